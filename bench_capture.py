@@ -0,0 +1,329 @@
+"""抓包和数据加载热点路径的离线性能基准
+
+不需要联网，也不需要启动mitmdump，分三部分：
+  addon   构造不同大小和类型的HTTPFlow，逐条调用mitm_writer的response，测量每条流量的开销
+  ingest  写入N条记录的分段文件，按界面自动加载的方式读取并加入DataProcessor，测量加载、表格刷新和搜索开销
+  export  测量save_to_excel、save_to_parquet/load_from_parquet和load_from_file的耗时
+结果以JSON输出，便于在不同版本之间比较吞吐量：
+  python bench_capture.py --rows 10000,100000 --output bench.json
+  python bench_capture.py --compare bench.json     吞吐量下降超过阈值时返回非零退出码
+缺少可选依赖（mitmproxy、PyQt5、openpyxl、pyarrow）的部分会标记为skipped。
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from capture_store import SegmentWriter, CaptureSession, SessionTailer
+from data_processor import DataProcessor
+
+SUITES = ('addon', 'ingest', 'export')
+
+HOSTS = ['api.example.com', 'www.example.com', 'static.example.net', 'm.example.org']
+
+
+def make_body(size):
+    """大约size字节的JSON响应体"""
+    item = {"id": 0, "name": "item", "tags": ["a", "b"], "score": 0.5, "active": True}
+    count = max(size // 80, 1)
+    return {"code": 0, "msg": "ok", "data": {"list": [dict(item, id=i) for i in range(count)], "total": count}}
+
+
+def make_record(i, body):
+    """与插件输出格式相同的记录"""
+    ts = 1754800000.0 + i * 0.01
+    host = HOSTS[i % len(HOSTS)]
+    path = f"/api/v1/users/{i % 997}/orders?page={i % 10}&_ts={int(ts * 1000)}"
+    return {
+        "url": f"https://{host}{path}",
+        "method": "GET" if i % 5 else "POST",
+        "host": host,
+        "path": path,
+        "status_code": 200 if i % 50 else 500,
+        "response_data": body,
+        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts)),
+        "timestamp_start": ts - 0.05,
+        "request_end": ts - 0.049,
+        "response_start": ts - 0.01,
+        "response_end": ts,
+        "request_bytes": 0,
+        "response_bytes": 200,
+        "duration_ms": 50.0 + i % 200,
+        "ttfb_ms": 40.0,
+    }
+
+
+class Bench:
+    def __init__(self):
+        self.results = []
+
+    def record(self, suite, name, count, seconds, **extra):
+        result = {
+            'suite': suite,
+            'name': name,
+            'count': count,
+            'seconds': round(seconds, 4),
+            'per_item_us': round(seconds / count * 1e6, 2) if count else None,
+            'items_per_s': round(count / seconds, 1) if seconds > 0 else None,
+        }
+        result.update(extra)
+        self.results.append(result)
+        print(f"  {suite:<7} {name:<28} {count:>9} 条  {seconds:>8.3f} s  "
+              f"{result['items_per_s'] or 0:>12,.0f} 条/s", file=sys.stderr)
+        return result
+
+    def timed(self, suite, name, count, func, **extra):
+        start = time.perf_counter()
+        value = func()
+        self.record(suite, name, count, time.perf_counter() - start, **extra)
+        return value
+
+    def skip(self, suite, reason):
+        self.results.append({'suite': suite, 'skipped': reason})
+        print(f"  {suite:<7} 跳过: {reason}", file=sys.stderr)
+
+
+# ---------------------------------------------------------------- addon
+
+def _addon_payloads():
+    """(名称, Content-Type, 响应体字节串)"""
+    small = json.dumps(make_body(200)).encode('utf-8')
+    large = json.dumps(make_body(100 * 1024)).encode('utf-8')
+    return [
+        ('json_small', 'application/json', small),
+        ('json_large', 'application/json; charset=utf-8', large),
+        ('json_gbk', 'application/json; charset=gbk',
+         json.dumps({"msg": "成功", "data": make_body(2000)}, ensure_ascii=False).encode('gbk')),
+        ('invalid_json', 'application/json', b'<html>not json</html>'),
+        ('html', 'text/html', b'<html>' + b'x' * 20000 + b'</html>'),
+        ('image', 'image/png', os.urandom(20000)),
+    ]
+
+
+def bench_addon(bench, flows, workdir):
+    try:
+        from mitmproxy.test import tflow
+    except ImportError:
+        bench.skip('addon', '未安装mitmproxy')
+        return
+    import mitm_writer
+
+    for name, content_type, body in _addon_payloads():
+        base = tflow.tflow(resp=True)
+        base.request.host = HOSTS[0]
+        base.request.path = '/api/v1/items?page=1'
+        base.response.headers['content-type'] = content_type
+        base.response.raw_content = body
+        batch = [base.copy() for _ in range(flows)]
+        # 小响应体另外测量开启去重时的开销，所有流量的响应体相同
+        for dedup in ((False, True) if name == 'json_small' else (False,)):
+            label = f'{name},dedup' if dedup else name
+            writer = mitm_writer.CaptureWriter(capture_dir=os.path.join(workdir, 'addon-' + label.replace(',', '-')),
+                                               stream_port=0, dedup=dedup)
+            bench.timed('addon', f'response[{label}]', flows, lambda: [writer.response(f) for f in batch],
+                        body_bytes=len(body))
+            bench.timed('addon', f'flush[{label}]', flows, writer.close)
+
+
+# ---------------------------------------------------------------- ingest
+
+def _write_segments(directory, rows, body):
+    writer = SegmentWriter(directory)
+    batch = []
+    for i in range(rows):
+        item = make_record(i, body)
+        batch.append(((json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8'),
+                      item['response_end'], item['host']))
+        if len(batch) >= 1000:
+            writer.write_batch(batch)
+            batch = []
+    writer.write_batch(batch)
+    writer.close()
+
+
+_qt_app = None
+
+
+def _table_model(processor):
+    """界面的表格模型，没有安装PyQt5时返回None"""
+    global _qt_app
+    try:
+        from PyQt5.QtCore import QCoreApplication
+        from table_model import CaptureTableModel
+    except ImportError:
+        return None
+    if QCoreApplication.instance() is None:
+        _qt_app = QCoreApplication(sys.argv[:1])
+    return CaptureTableModel(processor)
+
+
+def _render_visible(model, rows=40):
+    """模拟视图绘制：刷新模型并读取末尾一屏单元格"""
+    model.refresh()
+    total = model.rowCount()
+    for row in range(max(total - rows, 0), total):
+        for column in range(model.columnCount()):
+            model.data(model.index(row, column))
+
+
+def bench_ingest(bench, rows, workdir):
+    body = make_body(200)
+    directory = os.path.join(workdir, f'ingest-{rows}')
+    bench.timed('ingest', 'segment_write', rows, lambda: _write_segments(directory, rows, body), rows=rows)
+
+    processor = DataProcessor()
+    model = _table_model(processor)
+    tailer = SessionTailer(CaptureSession(directory))
+    read_seconds = add_seconds = render_seconds = 0.0
+    while True:
+        start = time.perf_counter()
+        items = tailer.read_new()
+        read_seconds += time.perf_counter() - start
+        if not items:
+            break
+        start = time.perf_counter()
+        processor.add_items(items)
+        add_seconds += time.perf_counter() - start
+        if model is not None:
+            start = time.perf_counter()
+            _render_visible(model)
+            render_seconds += time.perf_counter() - start
+    bench.record('ingest', 'tail_read', rows, read_seconds, rows=rows)
+    bench.record('ingest', 'add_items', rows, add_seconds, rows=rows)
+    if model is not None:
+        bench.record('ingest', 'render', rows, render_seconds, rows=rows)
+    else:
+        bench.skip('ingest', '未安装PyQt5，不测量表格刷新')
+
+    # 搜索：单词、字段组合和前缀查询
+    queries = ['orders', 'host:api.example.com status:500', 'item*']
+    bench.timed('ingest', 'search', len(queries), lambda: [processor.search(q) for q in queries], rows=rows)
+
+    # 逐条添加的路径（旧的add_item调用方式）
+    single = min(rows, 100000)
+    one_by_one = DataProcessor()
+    items = [make_record(i, body) for i in range(single)]
+    bench.timed('ingest', 'add_item', single, lambda: [one_by_one.add_item(item) for item in items], rows=single)
+    return processor
+
+
+# ---------------------------------------------------------------- export
+
+def bench_export(bench, processor, workdir):
+    rows = processor.row_count
+    json_path = os.path.join(workdir, f'export-{rows}.json')
+    items = [processor.get_row(i) for i in range(rows)]
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(items, f, ensure_ascii=False)
+    del items
+    bench.timed('export', 'load_from_file', rows, lambda: DataProcessor().load_from_file(json_path), rows=rows)
+
+    try:
+        import openpyxl  # noqa: F401
+        bench.timed('export', 'save_to_excel', rows,
+                    lambda: processor.save_to_excel(os.path.join(workdir, f'export-{rows}.xlsx')), rows=rows)
+    except ImportError:
+        bench.skip('export', '未安装openpyxl，不测量Excel导出')
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        bench.skip('export', '未安装pyarrow，不测量Parquet导出')
+        return
+    parquet_path = os.path.join(workdir, f'export-{rows}.parquet')
+    bench.timed('export', 'save_to_parquet', rows, lambda: processor.save_to_parquet(parquet_path), rows=rows)
+    bench.timed('export', 'load_from_parquet', rows,
+                lambda: DataProcessor().load_from_parquet(parquet_path), rows=rows)
+
+
+# ---------------------------------------------------------------- 比较
+
+def _key(result):
+    return result['suite'], result['name'], result.get('rows'), result['count']
+
+
+def compare(results, baseline_path, threshold):
+    """与之前的结果比较吞吐量，返回是否存在退化"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {_key(r): r for r in json.load(f)['results'] if 'skipped' not in r}
+    regressed = False
+    print(f"与 {baseline_path} 比较（退化阈值 {threshold:.0%}）:", file=sys.stderr)
+    for result in results:
+        if 'skipped' in result:
+            continue
+        old = baseline.get(_key(result))
+        if not old or not old.get('items_per_s') or not result.get('items_per_s'):
+            continue
+        ratio = result['items_per_s'] / old['items_per_s']
+        result['baseline_ratio'] = round(ratio, 3)
+        flag = ''
+        if ratio < 1 - threshold:
+            flag = '  <-- 退化'
+            regressed = True
+        print(f"  {result['suite']:<7} {result['name']:<28} {result['count']:>9}  x{ratio:.2f}{flag}",
+              file=sys.stderr)
+    return regressed
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except Exception:
+        return ''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="抓包和加载路径的离线性能基准")
+    parser.add_argument('--suites', default=','.join(SUITES), help="要运行的部分，逗号分隔：addon,ingest,export")
+    parser.add_argument('--rows', default='10000,100000', help="ingest/export的记录数，逗号分隔")
+    parser.add_argument('--flows', type=int, default=2000, help="addon部分每种响应类型的流量数")
+    parser.add_argument('--export-max-rows', type=int, default=200000, help="超过该记录数时跳过export部分")
+    parser.add_argument('--output', help="结果写入的JSON文件，默认输出到标准输出")
+    parser.add_argument('--compare', help="之前保存的结果文件，用于比较吞吐量")
+    parser.add_argument('--threshold', type=float, default=0.2, help="吞吐量下降超过该比例视为退化")
+    args = parser.parse_args(argv)
+
+    suites = [s.strip() for s in args.suites.split(',') if s.strip()]
+    row_counts = [int(n) for n in args.rows.split(',') if n.strip()]
+    bench = Bench()
+    workdir = tempfile.mkdtemp(prefix='bench_capture-')
+    try:
+        if 'addon' in suites:
+            bench_addon(bench, args.flows, workdir)
+        for rows in row_counts:
+            if 'ingest' not in suites and 'export' not in suites:
+                break
+            processor = bench_ingest(bench, rows, workdir)
+            if 'export' in suites:
+                if rows <= args.export_max_rows:
+                    bench_export(bench, processor, workdir)
+                else:
+                    bench.skip('export', f'{rows}条超过--export-max-rows')
+            del processor
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    regressed = compare(bench.results, args.compare, args.threshold) if args.compare else False
+    report = {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': bench.results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,16 @@
+"""响应体去重使用的内容哈希
+
+对响应体做规范化序列化（键排序、紧凑格式）后计算哈希，键顺序不同但内容相同的响应体哈希相同。
+响应体本身保存在分段记录中，见capture_store。
+"""
+import hashlib
+import json
+
+
+def canonical_bytes(data):
+    """规范化序列化，键顺序不同但内容相同的JSON得到相同的字节串"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def content_hash(raw):
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
@@ -0,0 +1,880 @@
+"""分段滚动的抓包存储
+
+抓包数据按大小或时间滚动写入目录下的分段文件：
+  seg-000001.jsonl   每行一条JSON记录（压缩格式为.jsonl.gz/.jsonl.zst）
+  seg-000001.idx     索引，每条记录一项：偏移量、长度、时间戳、域名哈希
+  seg-000001.fidx    压缩格式的帧索引，每帧一项：文件偏移、压缩后长度、记录数
+  seg-000001.range   分段关闭时写入的时间范围：最小、最大时间戳和缺少时间戳的记录数
+  START              清除数据时写入，记录第一个可见分段的编号
+清除数据只写入START，不删除正在写入的分段：写入方发现START超过当前分段后切换到新分段，
+START之前已封存（已有更新分段）的文件才会被删除。
+数据先于索引写入，索引中出现的记录一定已经完整写入数据文件。
+按时间范围读取时先用各分段的时间范围排除不相交的分段（写入方异常退出没有留下范围文件时从索引计算），
+只扫描可能包含结果的分段的索引。
+
+压缩格式由可以独立解压的帧组成（gzip成员或zstd帧），每帧包含若干条记录，
+记录索引中的偏移量是记录在解压后帧内的位置。读取时通过帧索引定位，
+只解压需要的帧；gzip格式的整个文件也可以直接用zcat查看。
+
+响应体去重以分段为单位：某个响应体在分段中第一次出现时完整写入该记录（同时带response_hash），
+之后相同内容的记录只带response_hash和response_ref（第一次出现的记录在分段中的序号），
+不产生额外的文件，压缩格式下响应体也在压缩帧中；删除分段时不会留下被其他分段引用的内容。
+"""
+import bisect
+import collections
+import importlib
+import json
+import os
+import struct
+import time
+import zlib
+
+# 偏移量(Q) 长度(I) 时间戳(d) 域名crc32(I)
+INDEX_ENTRY = struct.Struct('<QIdI')
+# 压缩帧偏移(Q) 压缩后长度(I) 帧内记录数(I)
+FRAME_ENTRY = struct.Struct('<QII')
+# 最小时间戳(d) 最大时间戳(d) 缺少时间戳的记录数(I)
+RANGE_ENTRY = struct.Struct('<ddI')
+INDEX_SUFFIX = '.idx'
+FRAME_SUFFIX = '.fidx'
+RANGE_SUFFIX = '.range'
+START_FILE = 'START'
+# 存储格式 -> 数据文件扩展名
+CODECS = {
+    'plain': '.jsonl',
+    'gzip': '.jsonl.gz',
+    'zstd': '.jsonl.zst',
+}
+DATA_SUFFIX = CODECS['plain']
+# 需要额外安装的压缩模块
+CODEC_MODULES = {
+    'zstd': 'zstandard',
+}
+
+
+def check_codec(codec):
+    """确认存储格式可用，未知格式或压缩模块未安装时抛出ValueError
+
+    在开始抓包前检查，避免写入时才发现无法压缩而丢失数据。
+    """
+    if codec not in CODECS:
+        raise ValueError(f"不支持的存储格式: {codec}")
+    module = CODEC_MODULES.get(codec)
+    if module is not None:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            raise ValueError(f"存储格式{codec}需要安装{module}: pip install {module}") from None
+
+
+def compress_frame(codec, raw):
+    if codec == 'gzip':
+        import gzip
+        return gzip.compress(raw, compresslevel=6, mtime=0)
+    import zstandard
+    return zstandard.ZstdCompressor(level=3).compress(raw)
+
+
+def decompress_frame(codec, data):
+    if codec == 'gzip':
+        import gzip
+        return gzip.decompress(data)
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def host_hash(host):
+    """域名的32位哈希，用于在索引中按域名过滤"""
+    return zlib.crc32((host or '').lower().encode('utf-8'))
+
+
+def segment_name(number):
+    return f'seg-{number:06d}'
+
+
+def list_segments(directory):
+    """返回目录下所有分段编号（升序）"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    numbers = []
+    for name in names:
+        if name.startswith('seg-') and name.endswith(INDEX_SUFFIX):
+            try:
+                numbers.append(int(name[4:-len(INDEX_SUFFIX)]))
+            except ValueError:
+                continue
+    numbers.sort()
+    return numbers
+
+
+def remove_segment(directory, number):
+    """删除一个分段的全部文件"""
+    for suffix in (INDEX_SUFFIX, FRAME_SUFFIX, RANGE_SUFFIX) + tuple(CODECS.values()):
+        try:
+            os.remove(os.path.join(directory, segment_name(number) + suffix))
+        except OSError:
+            pass
+
+
+def read_start_segment(directory):
+    """读取第一个可见分段的编号"""
+    try:
+        with open(os.path.join(directory, START_FILE), 'r', encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+class SegmentWriter:
+    """分段写入器：保持当前分段文件常开，超过大小或时间后滚动到新分段
+
+    压缩格式下记录先缓存在当前帧中，累计frame_records条或超过frame_seconds秒后
+    压缩为一个独立的帧写入。
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, max_seconds=3600, fsync=False,
+                 codec='plain', frame_records=256, frame_seconds=2.0, max_bodies=100000):
+        check_codec(codec)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.fsync = fsync
+        self.codec = codec
+        self.frame_records = max(frame_records, 1)
+        self.frame_seconds = frame_seconds
+        self.segment = None
+        self._data = None
+        self._index = None
+        self._frames = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._frame = []
+        self._frame_started = 0.0
+        self._start_mtime = None
+        # 当前分段中已写入的记录数，以及去重响应体的哈希 -> 第一次出现的记录序号
+        self._records = 0
+        self._bodies = {}
+        self.max_bodies = max_bodies
+        # 当前分段的时间范围，关闭分段时写入范围文件
+        self._min_ts = float('inf')
+        self._max_ts = float('-inf')
+        self._untimed = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_next(self):
+        existing = list_segments(self.directory)
+        last = existing[-1] if existing else 0
+        start = read_start_segment(self.directory)
+        number = max(last, start - 1) + 1
+        # 本进程之前的分段都已关闭，清除数据后留下的旧分段在这里删除
+        for old in existing:
+            if old >= start:
+                break
+            remove_segment(self.directory, old)
+        base = os.path.join(self.directory, segment_name(number))
+        # 先创建数据文件和帧索引再创建记录索引，读取方以记录索引判断分段是否存在
+        self._data = open(base + CODECS[self.codec], 'ab')
+        if self.codec != 'plain':
+            self._frames = open(base + FRAME_SUFFIX, 'ab')
+        self._index = open(base + INDEX_SUFFIX, 'ab')
+        self._size = self._data.tell()
+        self._opened_at = time.time()
+        self.segment = number
+        self._records = 0
+        self._bodies = {}
+        self._min_ts = float('inf')
+        self._max_ts = float('-inf')
+        self._untimed = 0
+
+    def _assign(self, records):
+        """确定记录在当前分段中的内容，返回(行字节串, 时间戳, 域名)列表
+
+        带响应体的记录为(行, 时间戳, 域名, (哈希, 响应体JSON字节串))，行是不含response_data的
+        JSON对象；响应体在本分段第一次出现时拼接到行中，之后只记录第一次出现的序号。
+        """
+        result = []
+        bodies = self._bodies
+        position = self._records
+        for record in records:
+            line = record[0]
+            ts = record[1]
+            if not ts:
+                self._untimed += 1
+            else:
+                if ts < self._min_ts:
+                    self._min_ts = ts
+                if ts > self._max_ts:
+                    self._max_ts = ts
+            if len(record) > 3 and record[3] is not None:
+                digest, raw = record[3]
+                first = bodies.get(digest)
+                if first is not None:
+                    line = line[:-2] + b', "response_ref": %d}\n' % first
+                else:
+                    if len(bodies) < self.max_bodies:
+                        bodies[digest] = position
+                    line = line[:-2] + b', "response_data": ' + raw + b'}\n'
+            result.append((line, record[1], record[2]))
+            position += 1
+        self._records = position
+        return result
+
+    def _check_start(self):
+        """清除数据后START超过当前分段时切换到新分段，不依赖数据通道送达rotate消息"""
+        if self._data is None:
+            return
+        try:
+            mtime = os.stat(os.path.join(self.directory, START_FILE)).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._start_mtime:
+            return
+        self._start_mtime = mtime
+        if read_start_segment(self.directory) > self.segment:
+            # 缓存中的帧属于清除之后的数据，留到新分段中写入
+            self._close_files()
+
+    def write_batch(self, records):
+        """批量写入，records为(行字节串, 时间戳, 域名)或带响应体的(行, 时间戳, 域名, (哈希, 响应体))的列表"""
+        if not records:
+            return
+        self._check_start()
+        if self.codec != 'plain':
+            if not self._frame:
+                self._frame_started = time.monotonic()
+            self._frame.extend(records)
+            if len(self._frame) >= self.frame_records:
+                self._write_frame()
+            else:
+                self.poll()
+            return
+        if self._data is None:
+            self._open_next()
+        offset = self._size
+        lines = []
+        entries = []
+        for line, ts, host in self._assign(records):
+            lines.append(line)
+            entries.append(INDEX_ENTRY.pack(offset, len(line), ts or 0.0, host_hash(host)))
+            offset += len(line)
+        self._data.write(b''.join(lines))
+        self._data.flush()
+        self._index.write(b''.join(entries))
+        self._index.flush()
+        self._sync()
+        self._size = offset
+        self._check_rotation()
+
+    def written_position(self):
+        """已写入索引的末尾位置(分段, 记录数)和还缓存在帧中的记录数，尚未写入任何分段时位置为None"""
+        position = (self.segment, self._records) if self.segment is not None else None
+        return position, len(self._frame)
+
+    def poll(self):
+        """压缩格式下，当前帧缓存超过frame_seconds秒时写出"""
+        if self._frame and time.monotonic() - self._frame_started >= self.frame_seconds:
+            self._write_frame()
+
+    def _write_frame(self):
+        records, self._frame = self._frame, []
+        if not records:
+            return
+        self._check_start()
+        if self._data is None:
+            self._open_next()
+        offset = 0
+        lines = []
+        entries = []
+        for line, ts, host in self._assign(records):
+            lines.append(line)
+            entries.append(INDEX_ENTRY.pack(offset, len(line), ts or 0.0, host_hash(host)))
+            offset += len(line)
+        compressed = compress_frame(self.codec, b''.join(lines))
+        self._data.write(compressed)
+        self._data.flush()
+        self._frames.write(FRAME_ENTRY.pack(self._size, len(compressed), len(records)))
+        self._frames.flush()
+        self._index.write(b''.join(entries))
+        self._index.flush()
+        self._sync()
+        self._size += len(compressed)
+        self._check_rotation()
+
+    def _sync(self):
+        if self.fsync:
+            for f in (self._data, self._frames, self._index):
+                if f is not None:
+                    os.fsync(f.fileno())
+
+    def _check_rotation(self):
+        if (self.max_bytes and self._size >= self.max_bytes) or \
+                (self.max_seconds and time.time() - self._opened_at >= self.max_seconds):
+            self.rotate()
+
+    def rotate(self):
+        """写出缓存的帧并关闭当前分段，下次写入时创建新分段"""
+        if self._frame:
+            self._write_frame()
+        self._close_files()
+
+    def _close_files(self):
+        if self._index is not None:
+            self._write_range()
+        for f in (self._data, self._frames, self._index):
+            if f is not None:
+                f.close()
+        self._data = None
+        self._frames = None
+        self._index = None
+
+    def _write_range(self):
+        """保存当前分段的时间范围，读取方据此跳过与查询范围不相交的分段"""
+        path = os.path.join(self.directory, segment_name(self.segment) + RANGE_SUFFIX)
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(RANGE_ENTRY.pack(self._min_ts, self._max_ts, self._untimed))
+            os.replace(path + '.tmp', path)
+        except OSError:
+            # 缺少范围文件时读取方从索引计算
+            pass
+
+    def close(self):
+        self.rotate()
+
+
+class CaptureStore:
+    """读取分段存储：按序号分页、按时间范围跳转、清除数据"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        # 已封存分段（不会再写入）的索引缓存
+        self._sealed_index = {}
+        self._codecs = {}
+        self._sealed_frames = {}
+        # 已封存分段的时间范围缓存
+        self._sealed_ranges = {}
+        # 最近解压的帧：(分段, 帧序号) -> 解压后的字节串
+        self._frame_cache = None
+        # 按范围读取时被引用、但不在本次读取范围内的响应体：(分段, 序号) -> 响应体
+        self._body_cache = collections.OrderedDict()
+        self.body_cache_size = 1024
+
+    def _path(self, number, suffix):
+        return os.path.join(self.directory, segment_name(number) + suffix)
+
+    def codec(self, number):
+        """分段的存储格式，根据数据文件扩展名判断"""
+        codec = self._codecs.get(number)
+        if codec is None:
+            codec = 'plain'
+            for name, suffix in CODECS.items():
+                if os.path.exists(self._path(number, suffix)):
+                    codec = name
+                    break
+            self._codecs[number] = codec
+        return codec
+
+    @property
+    def start_segment(self):
+        return read_start_segment(self.directory)
+
+    def segments(self):
+        """可见的分段编号列表"""
+        start = self.start_segment
+        return [n for n in list_segments(self.directory) if n >= start]
+
+    def record_count(self, number):
+        """分段中的记录数，只需读取索引文件大小"""
+        try:
+            return os.path.getsize(self._path(number, INDEX_SUFFIX)) // INDEX_ENTRY.size
+        except OSError:
+            return 0
+
+    def total_count(self):
+        return sum(self.record_count(n) for n in self.segments())
+
+    def read_index(self, number, start=0, stop=None, sealed=False):
+        """读取分段索引中[start, stop)范围的条目"""
+        cached = self._sealed_index.get(number)
+        if cached is not None:
+            return cached[start:stop]
+        try:
+            with open(self._path(number, INDEX_SUFFIX), 'rb') as f:
+                if sealed:
+                    raw = f.read()
+                else:
+                    f.seek(start * INDEX_ENTRY.size)
+                    length = -1 if stop is None else (stop - start) * INDEX_ENTRY.size
+                    raw = f.read(length)
+        except OSError:
+            return []
+        raw = raw[:len(raw) - len(raw) % INDEX_ENTRY.size]
+        entries = list(INDEX_ENTRY.iter_unpack(raw))
+        if sealed:
+            self._sealed_index[number] = entries
+            return entries[start:stop]
+        return entries
+
+    def _read_frames(self, number):
+        """读取帧索引，返回(各帧起始记录序号, 帧条目)"""
+        cached = self._sealed_frames.get(number)
+        if cached is not None:
+            return cached
+        try:
+            with open(self._path(number, FRAME_SUFFIX), 'rb') as f:
+                raw = f.read()
+        except OSError:
+            return [], []
+        raw = raw[:len(raw) - len(raw) % FRAME_ENTRY.size]
+        frames = list(FRAME_ENTRY.iter_unpack(raw))
+        starts = []
+        position = 0
+        for _, _, count in frames:
+            starts.append(position)
+            position += count
+        if self._is_sealed(number):
+            self._sealed_frames[number] = (starts, frames)
+        return starts, frames
+
+    def _read_plain(self, number, entries):
+        try:
+            with open(self._path(number, DATA_SUFFIX), 'rb') as f:
+                first = entries[0][0]
+                last = entries[-1][0] + entries[-1][1]
+                if last - first == sum(e[1] for e in entries):
+                    # 连续的记录一次读出
+                    f.seek(first)
+                    buf = f.read(last - first)
+                    return [buf[o - first:o - first + n] for o, n, _, _ in entries]
+                chunks = []
+                for offset, length, _, _ in entries:
+                    f.seek(offset)
+                    chunks.append(f.read(length))
+                return chunks
+        except OSError:
+            return []
+
+    def _read_compressed(self, number, positions, entries):
+        codec = self.codec(number)
+        starts, frames = self._read_frames(number)
+        chunks = []
+        try:
+            with open(self._path(number, CODECS[codec]), 'rb') as f:
+                for position, (offset, length, _, _) in zip(positions, entries):
+                    frame_no = bisect.bisect_right(starts, position) - 1
+                    if frame_no < 0:
+                        # 保持与positions对齐，解析时跳过
+                        chunks.append(b'')
+                        continue
+                    key = (number, frame_no)
+                    if self._frame_cache is None or self._frame_cache[0] != key:
+                        # 只解压用到的帧，连续记录复用同一帧
+                        frame_offset, frame_length, _ = frames[frame_no]
+                        f.seek(frame_offset)
+                        self._frame_cache = (key, decompress_frame(codec, f.read(frame_length)))
+                    raw = self._frame_cache[1]
+                    chunks.append(raw[offset:offset + length])
+        except (OSError, EOFError, zlib.error):
+            return chunks
+        return chunks
+
+    def read_entries(self, number, positions, entries):
+        """读取索引条目对应的记录，positions为各条目在分段中的序号"""
+        if not entries:
+            return []
+        if self.codec(number) == 'plain':
+            chunks = self._read_plain(number, entries)
+        else:
+            chunks = self._read_compressed(number, positions, entries)
+        items = []
+        # 本批中带完整响应体的记录：序号 -> 响应体，引用它的记录共用同一个对象
+        bodies = {}
+        for position, chunk in zip(positions, chunks):
+            try:
+                item = json.loads(chunk)
+            except ValueError:
+                continue
+            if not isinstance(item, dict):
+                continue
+            if 'response_ref' in item:
+                ref = item.pop('response_ref')
+                if ref not in bodies:
+                    bodies[ref] = self._read_body(number, ref)
+                item['response_data'] = bodies[ref]
+            elif 'response_hash' in item and 'response_data' in item:
+                bodies[position] = item['response_data']
+            items.append(item)
+        return items
+
+    def _read_body(self, number, position):
+        """读取分段中第position条记录的响应体，用于解析范围之外的response_ref"""
+        key = (number, position)
+        cache = self._body_cache
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        items = self.read_records(number, position, position + 1)
+        data = items[0].get('response_data') if items else None
+        cache[key] = data
+        if len(cache) > self.body_cache_size:
+            cache.popitem(last=False)
+        return data
+
+    def read_records(self, number, start=0, stop=None):
+        entries = self.read_index(number, start, stop, self._is_sealed(number))
+        return self.read_entries(number, range(start, start + len(entries)), entries)
+
+    def _is_sealed(self, number):
+        # 已存在更新的分段，说明该分段已经关闭
+        segments = list_segments(self.directory)
+        return bool(segments) and segments[-1] > number
+
+    def iter_records(self, batch_size=5000):
+        """按分段和批次依次返回所有记录"""
+        for number in self.segments():
+            count = self.record_count(number)
+            for start in range(0, count, batch_size):
+                yield self.read_records(number, start, min(start + batch_size, count))
+
+    def page(self, start, count):
+        """按全局序号分页读取，不需要从头扫描"""
+        items = []
+        for number in self.segments():
+            seg_count = self.record_count(number)
+            if start >= seg_count:
+                start -= seg_count
+                continue
+            stop = min(seg_count, start + count - len(items))
+            items.extend(self.read_records(number, start, stop))
+            start = 0
+            if len(items) >= count:
+                break
+        return items
+
+    def time_range(self, number, sealed=False):
+        """分段的(最小时间戳, 最大时间戳, 缺少时间戳的记录数)，没有带时间戳的记录时最小值为inf
+
+        已封存的分段读取写入方关闭分段时保存的范围文件，没有范围文件时从索引计算，结果都会缓存；
+        正在写入的分段每次从索引计算。
+        """
+        cached = self._sealed_ranges.get(number)
+        if cached is not None:
+            return cached
+        result = None
+        if sealed:
+            try:
+                with open(self._path(number, RANGE_SUFFIX), 'rb') as f:
+                    raw = f.read()
+                if len(raw) == RANGE_ENTRY.size:
+                    result = RANGE_ENTRY.unpack(raw)
+            except OSError:
+                pass
+        if result is None:
+            timestamps = [e[2] for e in self.read_index(number)]
+            timed = [ts for ts in timestamps if ts]
+            result = (min(timed, default=float('inf')), max(timed, default=float('-inf')),
+                      len(timestamps) - len(timed))
+        if sealed:
+            self._sealed_ranges[number] = result
+        return result
+
+    def find_time_range(self, begin, end, host=None):
+        """读取时间戳在[begin, end]之间的记录，可按域名过滤，只扫描时间范围相交的分段"""
+        wanted_host = host_hash(host) if host else None
+        items = []
+        segments = list_segments(self.directory)
+        start = self.start_segment
+        for number in segments:
+            if number < start:
+                continue
+            sealed = number != segments[-1]
+            low, high, untimed = self.time_range(number, sealed)
+            # 缺少时间戳的记录按0比较
+            if (high < begin or low > end) and not (untimed and begin <= 0 <= end):
+                continue
+            entries = self.read_index(number, sealed=sealed)
+            if not entries:
+                continue
+            # 响应按完成顺序写入，慢响应和缺少时间戳（记为0）的记录不保证有序，逐条检查索引
+            selected = [(i, e) for i, e in enumerate(entries)
+                        if begin <= e[2] <= end and (wanted_host is None or e[3] == wanted_host)]
+            items.extend(self.read_entries(number, [p for p, _ in selected], [e for _, e in selected]))
+        return items
+
+    def clear(self):
+        """清除数据：只需切换到新的分段编号，旧分段在写入方切换之后删除
+
+        需要在通知写入方rotate之前调用，保证写入方切换后打开的分段编号不小于START。
+        """
+        segments = list_segments(self.directory)
+        start = max(segments[-1] if segments else 0, self.start_segment - 1) + 1
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, START_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(start))
+        os.replace(tmp_path, os.path.join(self.directory, START_FILE))
+        self._sealed_index.clear()
+        self._sealed_frames.clear()
+        self._sealed_ranges.clear()
+        self._frame_cache = None
+        self._body_cache.clear()
+        self.prune()
+
+    def prune(self):
+        """删除START之前已封存的分段；最后一个分段可能仍在写入，留给写入方切换后删除"""
+        start = self.start_segment
+        segments = list_segments(self.directory)
+        for number in segments[:-1]:
+            if number >= start:
+                break
+            remove_segment(self.directory, number)
+
+
+class SegmentTailer:
+    """跟踪分段存储中新写入的记录，供界面增量读取"""
+
+    def __init__(self, store, max_records_per_read=20000):
+        self.store = store
+        self.max_records_per_read = max_records_per_read
+        self.segment = None
+        self.position = 0
+        # 读取上限(分段, 记录数)，为None时读取到末尾
+        self.limit = None
+        # 之后要跳过（已经通过数据通道收到）的记录数
+        self.skip = 0
+
+    def reset(self):
+        self.segment = None
+        self.position = 0
+        self.skip = 0
+
+    def resume(self, position, skip=0):
+        """从position(分段, 记录数)继续读取，再跳过之后的skip条记录；这些记录可能还没有写入文件"""
+        self.segment, self.position = position
+        self.skip = max(skip, 0)
+
+    def end_mark(self):
+        """当前末尾位置(分段, 记录数)，之后可作为读取上限"""
+        segments = self.store.segments()
+        if not segments:
+            return (0, 0)
+        return (segments[-1], self.store.record_count(segments[-1]))
+
+    def _visible(self, segments):
+        if self.limit is None:
+            return segments
+        return [n for n in segments if n <= self.limit[0]]
+
+    def _count(self, number):
+        count = self.store.record_count(number)
+        if self.limit is not None and number == self.limit[0]:
+            count = min(count, self.limit[1])
+        return count
+
+    def skip_to_end(self):
+        """跳过已有的记录，之后只读取新写入的数据"""
+        segments = self.store.segments()
+        if segments:
+            self.segment = segments[-1]
+            self.position = self.store.record_count(self.segment)
+            self.skip = 0
+        else:
+            self.reset()
+
+    def _advance(self, segments):
+        if self.segment is None or self.segment not in segments:
+            later = [n for n in segments if self.segment is None or n > self.segment]
+            if not later:
+                return False
+            self.segment = later[0]
+            self.position = 0
+        return True
+
+    def read_new(self):
+        """读取新增记录，单次最多读取max_records_per_read条，设置了limit时不超过上限"""
+        segments = self._visible(self.store.segments())
+        if not segments or not self._advance(segments):
+            return []
+        items = []
+        budget = self.max_records_per_read
+        while budget > 0:
+            count = self._count(self.segment)
+            if count > self.position and self.skip:
+                skipped = min(self.skip, count - self.position)
+                self.position += skipped
+                self.skip -= skipped
+                continue
+            if count > self.position:
+                stop = min(count, self.position + budget)
+                items.extend(self.store.read_records(self.segment, self.position, stop))
+                budget -= stop - self.position
+                self.position = stop
+                continue
+            later = [n for n in segments if n > self.segment]
+            if not later:
+                break
+            # 当前分段已读完且已有新分段，切换过去
+            self.segment = later[0]
+            self.position = 0
+        return items
+
+    def has_pending(self):
+        """是否还有未读取的记录"""
+        segments = self._visible(self.store.segments())
+        if not segments:
+            return False
+        if self.segment is None or self.segment not in segments:
+            return True
+        return self._count(self.segment) > self.position or segments[-1] > self.segment
+
+
+WORKER_PREFIX = 'worker-'
+
+
+def worker_directory(directory, index):
+    """多进程抓包时第index个工作进程的分段目录"""
+    return os.path.join(directory, f'{WORKER_PREFIX}{index}')
+
+
+def session_directories(directory):
+    """会话中所有包含分段的目录：会话目录本身和各工作进程的子目录"""
+    directories = [directory]
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return directories
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.startswith(WORKER_PREFIX) and os.path.isdir(path):
+            directories.append(path)
+    return directories
+
+
+def _order_key(item):
+    return item.get('response_end') or 0.0
+
+
+class CaptureSession:
+    """一个抓包会话：单进程时只有会话目录，多进程时还包括各工作进程的子目录"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._stores = {}
+
+    def stores(self):
+        """当前存在的所有分段存储，新出现的工作进程目录会自动加入"""
+        result = []
+        for path in session_directories(self.directory):
+            store = self._stores.get(path)
+            if store is None:
+                store = self._stores[path] = CaptureStore(path)
+            result.append(store)
+        return result
+
+    def total_count(self):
+        return sum(store.total_count() for store in self.stores())
+
+    def iter_records(self, batch_size=5000):
+        for store in self.stores():
+            yield from store.iter_records(batch_size)
+
+    def page(self, start, count):
+        """按全局序号分页读取，顺序与iter_records相同（先会话目录，再各工作进程目录）"""
+        items = []
+        for store in self.stores():
+            total = store.total_count()
+            if start >= total:
+                start -= total
+                continue
+            items.extend(store.page(start, count - len(items)))
+            start = 0
+            if len(items) >= count:
+                break
+        return items
+
+    def find_time_range(self, begin, end, host=None):
+        items = []
+        for store in self.stores():
+            items.extend(store.find_time_range(begin, end, host))
+        items.sort(key=_order_key)
+        return items
+
+    def clear(self):
+        for store in self.stores():
+            store.clear()
+
+
+class SessionTailer:
+    """跟踪会话中所有分段存储的新增记录，多个目录的新记录按响应完成时间合并"""
+
+    def __init__(self, session, max_records_per_read=20000):
+        self.session = session
+        self.max_records_per_read = max_records_per_read
+        self._tailers = {}
+        self._mark = None
+
+    def _current(self):
+        tailers = []
+        for store in self.session.stores():
+            tailer = self._tailers.get(store.directory)
+            if tailer is None:
+                tailer = self._tailers[store.directory] = SegmentTailer(store, self.max_records_per_read)
+                if self._mark is not None:
+                    tailer.limit = self._mark.get(store.directory, (0, 0))
+            tailers.append(tailer)
+        return tailers
+
+    def reset(self):
+        for tailer in self._current():
+            tailer.reset()
+
+    def skip_to_end(self):
+        for tailer in self._current():
+            tailer.skip_to_end()
+
+    def mark(self):
+        """各目录当前的末尾位置，启动代理前记录，用于区分历史数据和之后推送的数据"""
+        return {tailer.store.directory: tailer.end_mark() for tailer in self._current()}
+
+    def set_limit(self, mark):
+        """只读取到mark为止；mark中没有的目录（之后才出现的工作进程）不读取"""
+        self._mark = mark
+        for tailer in self._current():
+            tailer.limit = mark.get(tailer.store.directory, (0, 0))
+
+    def clear_limit(self):
+        self._mark = None
+        for tailer in self._current():
+            tailer.limit = None
+
+    def resume(self, points):
+        """数据通道断开后从各目录最后推送到的记录之后继续读取
+
+        points为StreamServer.resume_points()的结果；没有位置的来源从当前读取位置（启动前的末尾）算起，
+        没有推送过数据的目录保持当前位置。
+        """
+        points = {os.path.normpath(source): point for source, point in points.items()}
+        for tailer in self._current():
+            point = points.get(os.path.normpath(tailer.store.directory))
+            if point is None:
+                continue
+            position, skip = point
+            if position is None:
+                tailer.skip += max(skip, 0)
+            else:
+                tailer.resume(position, skip)
+
+    def read_new(self):
+        tailers = self._current()
+        if len(tailers) == 1:
+            return tailers[0].read_new()
+        items = []
+        for tailer in tailers:
+            items.extend(tailer.read_new())
+        items.sort(key=_order_key)
+        return items
+
+    def has_pending(self):
+        return any(tailer.has_pending() for tailer in self._current())
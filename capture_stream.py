@@ -0,0 +1,353 @@
+"""mitmdump插件与界面之间的本地数据通道
+
+帧格式：4字节大端长度 + UTF-8编码的JSON。
+插件作为客户端连接ProxyListener监听的回环端口，实时推送抓到的数据，
+ProxyListener也可以通过同一连接向插件发送控制消息。
+
+插件推送的每帧记录带有来源（插件的分段目录）和最后一条记录的写入序号，每次批量写入文件后
+再推送一个written消息，说明该序号的记录在文件中的位置(分段, 记录数)。通道断开后界面据此
+从最后推送到的记录之后继续读取文件，不会跳过或重复。
+"""
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+
+_HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+# 插件合并发送时单帧的目标大小，超过MAX_FRAME_SIZE的单条记录不推送，只计数（文件中仍然保存）
+BATCH_FRAME_BYTES = 4 * 1024 * 1024
+
+
+def encode_frame(message):
+    """把消息编码为带长度前缀的帧"""
+    payload = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    return _HEADER.pack(len(payload)) + payload
+
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def read_frame(sock):
+    """读取一帧并解码，连接关闭时返回None"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"数据帧过大: {size} 字节")
+    payload = _recv_exact(sock, size)
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+
+def _shutdown_socket(sock):
+    # 先shutdown再close，唤醒阻塞在accept/recv上的线程
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    try:
+        sock.close()
+    except OSError:
+        pass
+
+
+class StreamClient:
+    """插件端：后台线程批量发送数据，不阻塞mitmproxy事件循环"""
+
+    def __init__(self, port, on_message=None, max_queue=10000, max_batch=500, source='',
+                 max_frame_bytes=BATCH_FRAME_BYTES):
+        self.port = port
+        self.on_message = on_message
+        self.max_batch = max_batch
+        self.max_frame_bytes = max_frame_bytes
+        # 推送的数据来自哪个分段目录，界面按来源记录各目录已推送到的位置
+        self.source = source
+        self.dropped = 0
+        # 编码后超过MAX_FRAME_SIZE而没有推送的记录数
+        self.oversized = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._sock = None
+        self._closed = False
+        self._sender = None
+
+    def connect(self, timeout=3):
+        self._sock = socket.create_connection(('127.0.0.1', self.port), timeout=timeout)
+        self._sock.settimeout(None)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sender = threading.Thread(target=self._send_loop, daemon=True)
+        self._sender.start()
+        threading.Thread(target=self._recv_loop, daemon=True).start()
+
+    def send(self, item, seq=None):
+        """放入发送队列，队列满时丢弃并计数；seq为该记录在插件写入文件的记录中的序号"""
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait((item, seq))
+        except queue.Full:
+            self.dropped += 1
+
+    def send_message(self, message):
+        """发送控制消息，与记录按放入队列的顺序发送"""
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait((None, message))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=2.0):
+        """发送完队列中剩余的数据后关闭"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        if self._sender is not None:
+            self._sender.join(timeout)
+
+    def _records_frame(self, parts, seq):
+        """用已编码的记录拼成一帧，不重复编码"""
+        head = json.dumps({"type": "records", "source": self.source, "seq": seq}, ensure_ascii=False)
+        payload = (head[:-1] + ', "items": [').encode('utf-8') + b', '.join(parts) + b']}'
+        return _HEADER.pack(len(payload)) + payload
+
+    def _send_loop(self):
+        try:
+            while True:
+                entry = self._queue.get()
+                parts = []
+                size = 0
+                seq = None
+                # 把队列里已有的记录合并成一帧发送，按条数和编码后的大小限制单帧
+                while entry is not None:
+                    item, extra = entry
+                    if item is None:
+                        # 控制消息：先发出已合并的记录，保持顺序
+                        if parts:
+                            self._sock.sendall(self._records_frame(parts, seq))
+                            parts, size = [], 0
+                        self._sock.sendall(encode_frame(extra))
+                    else:
+                        part = json.dumps(item, ensure_ascii=False).encode('utf-8')
+                        if extra is not None:
+                            seq = extra
+                        if len(part) > MAX_FRAME_SIZE - 1024:
+                            self.oversized += 1
+                            print(f"记录过大（{len(part)} 字节），不推送给界面，只保存到文件")
+                        else:
+                            if parts and size + len(part) > self.max_frame_bytes:
+                                self._sock.sendall(self._records_frame(parts, seq))
+                                parts, size = [], 0
+                            parts.append(part)
+                            size += len(part)
+                    if len(parts) >= self.max_batch:
+                        break
+                    try:
+                        entry = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if parts:
+                    self._sock.sendall(self._records_frame(parts, seq))
+                if entry is None:
+                    break
+        except OSError as e:
+            print(f"数据通道发送失败: {e}")
+        finally:
+            self._closed = True
+            try:
+                self._sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    def _recv_loop(self):
+        try:
+            while True:
+                message = read_frame(self._sock)
+                if message is None:
+                    break
+                if self.on_message:
+                    self.on_message(message)
+        except (OSError, ValueError):
+            pass
+
+
+class StreamServer:
+    """界面端：监听回环端口，接收插件推送的数据"""
+
+    def __init__(self, on_records, on_state=None):
+        self.on_records = on_records
+        self.on_state = on_state
+        self.port = None
+        self._listener = None
+        self._conns = []
+        self._lock = threading.Lock()
+        # 来源 -> [文件位置(分段, 记录数)或None, 该位置对应的序号, 已推送到的序号]
+        self._positions = {}
+
+    def reset_positions(self):
+        """代理重新启动时清除各来源的推送位置"""
+        with self._lock:
+            self._positions = {}
+
+    def resume_points(self):
+        """各来源已推送到的位置：{来源: (文件位置或None, 该位置之后已推送的记录数)}
+
+        文件位置为None表示还没有收到written消息，从启动前记录的末尾位置开始计算。
+        """
+        with self._lock:
+            return {source: (anchor, delivered - anchor_seq)
+                    for source, (anchor, anchor_seq, delivered) in self._positions.items()}
+
+    def _track(self, message):
+        source = message.get('source')
+        if source is None:
+            return
+        with self._lock:
+            state = self._positions.get(source)
+            if state is None:
+                state = self._positions[source] = [None, 0, 0]
+            if message.get('type') == 'written':
+                state[0] = (message['segment'], message['records'])
+                state[1] = message['seq']
+                return
+            seq = message.get('seq')
+            if seq is None:
+                return
+            if seq < state[2]:
+                # 插件进程重启，序号从头开始，新进程的记录接在旧进程已推送的记录之后
+                state[1] -= state[2]
+                state[2] = 0
+            state[2] = seq
+
+    def start(self):
+        if self._listener is not None:
+            return self.port
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(8)
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self.port
+
+    @property
+    def connected(self):
+        with self._lock:
+            return bool(self._conns)
+
+    def send(self, message):
+        """向所有已连接的插件发送控制消息"""
+        frame = encode_frame(message)
+        with self._lock:
+            conns = list(self._conns)
+        sent = False
+        for conn in conns:
+            try:
+                conn.sendall(frame)
+                sent = True
+            except OSError:
+                pass
+        return sent
+
+    def _accept_loop(self):
+        listener = self._listener
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                break
+            with self._lock:
+                self._conns.append(conn)
+            if self.on_state:
+                self.on_state(True)
+            threading.Thread(target=self._read_loop, args=(conn,), daemon=True).start()
+
+    def _read_loop(self, conn):
+        try:
+            while True:
+                message = read_frame(conn)
+                if message is None:
+                    break
+                if message.get('type') == 'records' and message.get('items'):
+                    self.on_records(message['items'])
+                self._track(message)
+        except (OSError, ValueError) as e:
+            print(f"数据通道读取失败: {e}")
+        finally:
+            with self._lock:
+                if conn in self._conns:
+                    self._conns.remove(conn)
+                still_connected = bool(self._conns)
+            try:
+                conn.close()
+            except OSError:
+                pass
+            if self.on_state:
+                self.on_state(still_connected)
+
+    def stop(self):
+        if self._listener is not None:
+            _shutdown_socket(self._listener)
+            self._listener = None
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            _shutdown_socket(conn)
+        self.port = None
+
+
+class OrderedMerger:
+    """合并多个工作进程推送的数据
+
+    各进程的数据到达顺序与完成顺序不完全一致，收到的记录先缓存delay秒，
+    到期后按响应完成时间排序再一起交给on_records，保证合并后的数据流有序。
+    """
+
+    def __init__(self, on_records, delay=0.3):
+        self.on_records = on_records
+        self.delay = delay
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, items):
+        arrived = time.monotonic()
+        with self._lock:
+            self._pending.extend((arrived, item) for item in items)
+
+    def _release(self, before=None):
+        with self._lock:
+            if before is None:
+                ready, self._pending = self._pending, []
+            else:
+                ready = [p for p in self._pending if p[0] <= before]
+                if not ready:
+                    return
+                self._pending = [p for p in self._pending if p[0] > before]
+        if ready:
+            items = [item for _, item in ready]
+            items.sort(key=lambda item: item.get('response_end') or 0.0)
+            self.on_records(items)
+
+    def _run(self):
+        while not self._stopped.wait(self.delay / 2):
+            self._release(time.monotonic() - self.delay)
+
+    def close(self):
+        """停止后台线程，缓存中剩余的记录立即交出"""
+        self._stopped.set()
+        self._thread.join(timeout=1)
+        self._release()
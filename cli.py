@@ -0,0 +1,263 @@
+"""无界面抓包模式
+
+不依赖PyQt，适合在服务器或容器中长期运行：
+  python cli.py --port 8080 --domain .example.com --format gzip
+抓包数据写入分段存储目录，之后可以用界面的"打开会话"查看，
+也可以用 --stdout 把记录按JSON行实时输出，供其他程序处理。
+用 --read 不启动代理，把已保存的记录按JSON行输出，可按时间范围、域名或序号范围筛选：
+  python cli.py --read --dir captures --begin "2026-10-18 09:00" --end "2026-10-18 10:00"
+加上 --where/--order-by/--group-by/--count 时按条件查询或统计，指定 --sqlite 时在数据库中查询：
+  python cli.py --read --sqlite captures.db --where "status_code>=500" --group-by host
+"""
+import argparse
+import datetime
+import json
+import re
+import signal
+import sys
+import threading
+from capture_store import CODECS, CaptureSession, check_codec
+from domain_filter import invalid_rules
+from process_log import CLIENT_CONNECT, ERROR, REQUEST, TLS_ERROR, WARNING
+from proxy_manager import ProxyManager
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="API Sniffer 无界面抓包")
+    parser.add_argument('--port', type=int, default=8080, help="代理监听端口（默认8080）")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="mitmdump工作进程数，分别监听从--port开始的连续端口（默认1）")
+    parser.add_argument('--host', default='0.0.0.0', help="代理监听地址（默认0.0.0.0）")
+    parser.add_argument('--domain', action='append', default=[],
+                        help="域名过滤规则，可多次指定或用逗号分隔，语法与界面相同")
+    parser.add_argument('--dir', default='captures', help="分段存储目录，为空字符串时不写文件")
+    parser.add_argument('--format', choices=sorted(CODECS), default='plain', help="分段存储格式")
+    parser.add_argument('--segment-mb', type=int, default=64, help="单个分段的最大大小（MB）")
+    parser.add_argument('--segment-seconds', type=int, default=3600, help="单个分段的最长时长（秒）")
+    parser.add_argument('--sqlite', default='', help="同时写入SQLite数据库的路径；--read时从该数据库查询")
+    parser.add_argument('--dedup', action='store_true',
+                        help="对响应体去重，分段中相同的响应体只完整保存一次（适合大量重复的轮询接口）")
+    parser.add_argument('--stdout', action='store_true', help="把抓到的记录按JSON行输出到标准输出")
+    parser.add_argument('--stats', type=float, default=0, help="每隔多少秒在标准错误输出统计信息，0为不输出")
+    parser.add_argument('--verbose', action='store_true', help="输出mitmdump的全部日志（默认只输出错误和警告）")
+    read = parser.add_argument_group("读取已保存的记录（--read）")
+    read.add_argument('--read', action='store_true', help="不启动代理，把--dir中的记录按JSON行输出后退出")
+    read.add_argument('--begin', type=parse_time, help="开始时间，Unix时间戳或ISO格式（如2026-10-18 09:00）")
+    read.add_argument('--end', type=parse_time, help="结束时间，格式同--begin")
+    read.add_argument('--only-host', default='', help="只输出该域名的记录（完整域名）")
+    read.add_argument('--offset', type=int, default=0, help="跳过前多少条记录")
+    read.add_argument('--limit', type=int, default=0, help="最多输出多少条记录，0为不限制")
+    read.add_argument('--where', type=parse_condition, action='append', default=[],
+                      help="查询条件，如 status_code>=500、host=api.example.com、path^=/v1（前缀）、url~%%login%%（LIKE），"
+                           "可多次指定")
+    read.add_argument('--order-by', help="排序列")
+    read.add_argument('--desc', action='store_true', help="按排序列降序")
+    read.add_argument('--group-by', help="按列分组计数，输出“值<TAB>数量”")
+    read.add_argument('--count', action='store_true', help="只输出满足条件的记录数")
+    return parser
+
+
+CONDITION = re.compile(r'^\s*(\w+)\s*(!=|<=|>=|==|=|<|>|\^=|~)\s*(.*)$')
+# 命令行中的操作符 -> 查询接口的操作符
+CONDITION_OPERATORS = {'^=': 'prefix', '~': 'like'}
+
+
+def parse_condition(text):
+    """把“列 操作符 值”解析为(列名, (操作符, 值))，值按JSON解析，解析不了时作为字符串"""
+    match = CONDITION.match(text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"无法识别的条件: {text}")
+    column, op, value = match.groups()
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return column, (CONDITION_OPERATORS.get(op, op), value)
+
+
+def parse_time(value):
+    """命令行中的时间：Unix时间戳或ISO格式的本地时间"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法识别的时间: {value}")
+
+
+def parse_domains(values):
+    domains = []
+    for value in values:
+        domains.extend(d.strip() for d in value.split(',') if d.strip())
+    return domains
+
+
+class CaptureDaemon:
+    """命令行模式下的抓包进程：启动代理，转发记录，收到信号后正常退出"""
+
+    def __init__(self, args):
+        self.args = args
+        self.received = 0
+        self._stop = threading.Event()
+        self._output_lock = threading.Lock()
+        self.manager = ProxyManager(args.port, on_records=self.on_records)
+        manager = self.manager
+        manager.listen_host = args.host
+        manager.worker_count = max(args.workers, 1)
+        manager.allowed_domains = parse_domains(args.domain)
+        manager.capture_dir = args.dir
+        manager.capture_codec = args.format
+        manager.segment_mb = args.segment_mb
+        manager.segment_seconds = args.segment_seconds
+        manager.sqlite_path = args.sqlite
+        manager.dedup_bodies = args.dedup
+        # 输出到标准输出的每条记录都要带完整响应体，而不是只有去重后的哈希
+        manager.stream_full_bodies = args.stdout
+        manager.quiet = not args.verbose
+        manager.process_log.on_event = self.on_log_event
+
+    def on_records(self, items):
+        self.received += len(items)
+        if not self.args.stdout:
+            return
+        lines = ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items)
+        with self._output_lock:
+            sys.stdout.write(lines)
+            sys.stdout.flush()
+
+    def on_log_event(self, event):
+        """mitmdump输出：错误和警告始终显示，其他行只在--verbose时显示"""
+        if self.args.verbose or event.is_error or event.kind == WARNING:
+            with self._output_lock:
+                print(event.message, file=sys.stderr)
+
+    def format_stats(self):
+        totals = self.manager.process_log.totals()
+        rates = self.manager.process_log.rates()
+        errors = totals.get(ERROR, 0) + totals.get(TLS_ERROR, 0)
+        return (f"{self.manager.status_summary()}，已接收 {self.received} 条记录，请求 {rates.get(REQUEST, 0):.1f}/s，"
+                f"连接 {rates.get(CLIENT_CONNECT, 0):.1f}/s，错误 {errors}")
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            self.manager.start_proxy()
+        except Exception as e:
+            print(f"启动失败: {e}", file=sys.stderr)
+            return 1
+        print(f"代理已启动: {self.args.host}，{self.manager.status_summary()}，数据目录: {self.args.dir or '(不写文件)'}",
+              file=sys.stderr)
+        interval = self.args.stats if self.args.stats > 0 else 1.0
+        exit_code = 0
+        try:
+            while not self._stop.wait(interval):
+                code = self.manager.poll()
+                if code is not None:
+                    print(f"所有mitmdump进程均已退出且不再重启，退出码 {code}", file=sys.stderr)
+                    exit_code = 1
+                    break
+                if self.args.stats > 0:
+                    print(self.format_stats(), file=sys.stderr)
+        finally:
+            self.manager.stop_proxy()
+            self.manager.stream_server.stop()
+        print(f"已停止，共接收 {self.received} 条记录", file=sys.stderr)
+        return exit_code
+
+
+def read_records(args, out=sys.stdout, batch_size=5000):
+    """按JSON行输出已保存的记录，指定时间范围或域名时只扫描时间范围相交的分段，否则按序号分页读取"""
+    if args.sqlite or args.where or args.order_by or args.group_by or args.count:
+        return query_records(args, out)
+    session = CaptureSession(args.dir)
+    offset = max(args.offset, 0)
+    if args.begin is not None or args.end is not None or args.only_host:
+        begin = float('-inf') if args.begin is None else args.begin
+        end = float('inf') if args.end is None else args.end
+        items = session.find_time_range(begin, end, args.only_host or None)
+        stop = offset + args.limit if args.limit > 0 else None
+        batches = [items[offset:stop]]
+    else:
+        batches = _pages(session, offset, args.limit, batch_size)
+    written = 0
+    for items in batches:
+        out.write(''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items))
+        written += len(items)
+    out.flush()
+    print(f"共输出 {written} 条记录", file=sys.stderr)
+    return 0
+
+
+def query_records(args, out=sys.stdout):
+    """按条件查询、计数或分组：指定--sqlite时下推到数据库执行，否则把分段存储加载到内存后查询"""
+    from data_processor import DataProcessor
+
+    processor = DataProcessor()
+    filters = list(args.where)
+    if args.sqlite:
+        processor.attach_sqlite(args.sqlite)
+        if args.begin is not None:
+            filters.append(('ts', ('>=', args.begin)))
+        if args.end is not None:
+            filters.append(('ts', ('<=', args.end)))
+        if args.only_host:
+            filters.append(('host', args.only_host))
+    else:
+        processor.load_from_capture_dir(args.dir, args.begin, args.end, args.only_host or None)
+    limit = args.limit if args.limit > 0 else None
+    try:
+        if args.count:
+            out.write(f"{processor.count(filters)}\n")
+        elif args.group_by:
+            for value, count in processor.group_by(args.group_by, filters, limit):
+                out.write(f"{value}\t{count}\n")
+        else:
+            items = processor.query(filters, limit, max(args.offset, 0), args.order_by, args.desc)
+            out.write(''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items))
+            print(f"共输出 {len(items)} 条记录", file=sys.stderr)
+    except ValueError as e:
+        print(f"查询失败: {e}", file=sys.stderr)
+        return 2
+    finally:
+        processor.detach_sqlite()
+    out.flush()
+    return 0
+
+
+def _pages(session, offset, limit, batch_size):
+    remaining = limit if limit > 0 else session.total_count() - offset
+    while remaining > 0:
+        items = session.page(offset, min(remaining, batch_size))
+        if not items:
+            break
+        yield items
+        offset += len(items)
+        remaining -= len(items)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    invalid = invalid_rules(parse_domains(args.domain))
+    if invalid:
+        parser.error('; '.join(f"域名规则无效: {rule}（{error}）" for rule, error in invalid))
+    if args.read:
+        if not args.dir and not args.sqlite:
+            parser.error("--read 需要指定 --dir 或 --sqlite")
+        return read_records(args)
+    if args.dir:
+        try:
+            check_codec(args.format)
+        except ValueError as e:
+            parser.error(f"--format: {e}")
+    return CaptureDaemon(args).run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
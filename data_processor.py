@@ -1,10 +1,352 @@
+import bisect
 import json
-import pandas as pd
+import re
+from json_paths import Projection
+from endpoint_index import EndpointIndex
+from metrics import HostMetrics
+from search_index import SearchIndex
+
+# Excel单个工作表的最大行数（含表头）和单元格最大字符数
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_CELL_CHARS = 32767
+
+
+# Parquet导出的列类型，未列出的列（如提取的字段）按实际的值推断类型，
+# 类型混杂或含有对象/数组的列与JSON_COLUMNS中的列一样保存为JSON文本
+PARQUET_COLUMN_TYPES = {
+    'status_code': 'int64',
+    'timestamp_start': 'float64',
+    'request_end': 'float64',
+    'response_start': 'float64',
+    'response_end': 'float64',
+    'request_bytes': 'int64',
+    'response_bytes': 'int64',
+    'duration_ms': 'float64',
+    'ttfb_ms': 'float64',
+}
+PARQUET_DICTIONARY_COLUMNS = ['host', 'method', 'path']
+PARQUET_JSON_COLUMNS = ['response_data']
+PARQUET_METADATA_KEY = b'apisniffer.json_columns'
+
+# 数据库列在内存记录中对应的字段：ts是响应完成时间，id是从1开始的行号
+MEMORY_COLUMN_ALIASES = {'ts': 'response_end'}
+
+
+def infer_parquet_type(values):
+    """推断未列出类型的列在Parquet中的类型：全部为布尔/整数/数字/字符串时返回对应类型名，否则返回None"""
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            kinds.add('bool_')
+        elif isinstance(value, int):
+            kinds.add('int64' if -2 ** 63 <= value < 2 ** 63 else 'json')
+        elif isinstance(value, float):
+            kinds.add('float64')
+        elif isinstance(value, str):
+            kinds.add('string')
+        else:
+            kinds.add('json')
+        if len(kinds) > 1 and kinds != {'int64', 'float64'}:
+            return None
+    if kinds == {'int64', 'float64'}:
+        return 'float64'
+    if not kinds:
+        return 'string'
+    kind = kinds.pop()
+    return None if kind == 'json' else kind
+
+
+class ExportCancelled(Exception):
+    """导出被用户取消"""
+
 
 class DataProcessor:
     def __init__(self):
-        self.data_frame = None
+        # 按列存储的追加缓冲区：列名 -> 值列表
+        # list.append 按几何倍数扩容，追加N行的总代价为摊还O(N)
+        self._columns = {}
+        self._row_count = 0
+        # 每次清空或整体重新加载时递增，供表格模型判断是否需要重置
+        self._generation = 0
+        # 懒构建的DataFrame缓存，只有导出或需要时才生成
+        self._frame_cache = None
+        # 可选的SQLite存储，关联后query/count/group_by直接在数据库索引上执行
+        self.sqlite_store = None
+        # 字段投影：选中的JSON路径在导入时批量提取为独立列
+        self.projection = Projection([])
+        # 设置投影后response_data的保存方式：keep原样保留，text保存为JSON文本按需解析，drop不保存
+        self.raw_mode = 'keep'
+        # 按接口模板增量汇总的索引
+        self.endpoints = EndpointIndex()
+        # 按域名的耗时/大小分位数（按接口的统计在接口索引中）
+        self.host_metrics = HostMetrics()
+        # 全文搜索的倒排索引，与行号对应，随数据增量更新
+        self.search_index = SearchIndex()
+        # 去重的响应体：哈希 -> 响应体，只带response_hash的记录从这里取回，相同内容在内存中只保留一份
+        self._bodies = {}
+        self._body_texts = {}
+        self.body_counts = {}
+        # 只带哈希、但之前没有读到对应响应体的记录数
+        self.missing_bodies = 0
+
+    @property
+    def data_frame(self):
+        """按需把列缓冲区转换为DataFrame"""
+        if self._row_count == 0:
+            return None
+        if self._frame_cache is None or len(self._frame_cache) != self._row_count:
+            # pandas只在第一次需要DataFrame时导入，不影响启动速度
+            import pandas as pd
+            self._frame_cache = pd.DataFrame(self._columns, copy=False)
+        return self._frame_cache
+
+    @data_frame.setter
+    def data_frame(self, df):
+        self.clear()
+        if df is not None:
+            self.add_items(df.to_dict('records'))
+
+    @property
+    def row_count(self):
+        """当前数据行数"""
+        return self._row_count
+
+    @property
+    def generation(self):
+        """数据版本号，清空后递增"""
+        return self._generation
+
+    @property
+    def columns(self):
+        """当前列名列表"""
+        return list(self._columns)
+
+    def get_value(self, row, column):
+        """获取指定行列的值"""
+        return self._columns[column][row]
+
+    def get_row(self, row):
+        """获取指定行的数据字典"""
+        return {name: values[row] for name, values in self._columns.items()}
+
+    def get_response_data(self, row):
+        """获取指定行的response_data，以JSON文本保存时在这里才解析"""
+        values = self._columns.get('response_data')
+        if values is None:
+            return None
+        value = values[row]
+        if isinstance(value, str):
+            try:
+                return json.loads(value)
+            except ValueError:
+                return value
+        return value
+
+    def set_projection(self, paths, raw_mode='keep'):
+        """设置要提取为独立列的JSON路径
+
+        路径只编译一次，之后导入的数据按批提取；已有数据在这里一次性补算。
+        """
+        if raw_mode not in ('keep', 'text', 'drop'):
+            raise ValueError(f"不支持的保存方式: {raw_mode}")
+        old_paths = self.projection.paths
+        self.projection = Projection(paths)
+        for path in old_paths:
+            if path not in self.projection.paths:
+                self._columns.pop(path, None)
+
+        new_paths = [p for p in self.projection.paths if p not in self._columns]
+        if self._row_count and new_paths:
+            rows = [self._record_for_projection(r) for r in range(self._row_count)]
+            extracted = Projection(new_paths).extract_columns(rows)
+            for path in new_paths:
+                self._columns[path] = extracted[path]
+
+        # 没有提取字段时response_data总是完整保存；保存方式变化时（包括清空提取字段）转换已有数据
+        raw_mode = raw_mode if self.projection else 'keep'
+        raw_values = self._columns.get('response_data')
+        if raw_values is not None and raw_mode != self.raw_mode:
+            if raw_mode == 'drop':
+                self._columns.pop('response_data')
+            else:
+                for r in range(self._row_count):
+                    value = raw_values[r]
+                    if raw_mode == 'text' and not isinstance(value, (str, type(None))):
+                        raw_values[r] = json.dumps(value, ensure_ascii=False)
+                    elif raw_mode == 'keep' and isinstance(value, str):
+                        raw_values[r] = self.get_response_data(r)
+        self.raw_mode = raw_mode
+        # 列发生变化，表格需要整体刷新
+        self._frame_cache = None
+        self._generation += 1
+
+    def _record_for_projection(self, row):
+        record = {name: self._columns[name][row] for name in self._columns if '.' not in name}
+        if 'response_data' in record:
+            record['response_data'] = self.get_response_data(row)
+        return record
+
+    def _compact_raw(self, item):
+        """按raw_mode处理未投影的response_data，减少内存占用"""
+        if 'response_data' not in item:
+            return item
+        item = dict(item)
+        if self.raw_mode == 'drop':
+            del item['response_data']
+        elif not isinstance(item['response_data'], str):
+            digest = item.get('response_hash')
+            text = self._body_texts.get(digest) if digest is not None else None
+            if text is None:
+                text = json.dumps(item['response_data'], ensure_ascii=False)
+                if digest is not None:
+                    # 去重后的相同响应体共用同一个文本对象
+                    self._body_texts[digest] = text
+            item['response_data'] = text
+        return item
+
+    def clear(self):
+        """清空所有数据"""
+        self._columns = {}
+        self._row_count = 0
+        self._frame_cache = None
+        self._generation += 1
+        self.endpoints.clear()
+        self.host_metrics.clear()
+        self.search_index.clear()
+        self._bodies = {}
+        self._body_texts = {}
+        self.body_counts = {}
+        self.missing_bodies = 0
+
+    def seen_count(self, digest):
+        """相同响应体出现的次数"""
+        return self.body_counts.get(digest, 0)
+
+    def _resolve_bodies(self, items):
+        """统计响应体哈希，只带哈希的记录按哈希取回之前读到的响应体"""
+        bodies = self._bodies
+        counts = self.body_counts
+        for item in items:
+            digest = item.get('response_hash')
+            if digest is None:
+                continue
+            counts[digest] = counts.get(digest, 0) + 1
+            if 'response_data' in item:
+                # 分段和实时推送中第一次出现的响应体带有完整内容，之后只带哈希的记录直接从内存取回
+                item['response_data'] = bodies.setdefault(digest, item['response_data'])
+                continue
+            data = bodies.get(digest)
+            if data is None:
+                self.missing_bodies += 1
+            item['response_data'] = data
     
+    def attach_sqlite(self, path):
+        """关联SQLite抓包数据库，之后的查询下推到数据库执行，不加载到内存"""
+        if self.sqlite_store is not None:
+            self.sqlite_store.close()
+        from sqlite_store import SqliteCaptureStore
+        self.sqlite_store = SqliteCaptureStore(path, readonly=True)
+
+    def detach_sqlite(self):
+        """取消关联SQLite数据库，查询改为在内存数据上执行"""
+        if self.sqlite_store is not None:
+            self.sqlite_store.close()
+            self.sqlite_store = None
+
+    def query(self, filters=None, limit=None, offset=0, order_by=None, descending=False):
+        """按条件分页查询，返回记录字典列表
+
+        filters为字典：列名 -> 值，或列名 -> (操作符, 值)，也可以是(列名, 条件)的列表（同一列有多个条件时），
+        操作符支持 = != < <= > >= like in prefix。
+        """
+        if self.sqlite_store is not None:
+            return self.sqlite_store.query(filters, limit, offset, order_by or 'id', descending)
+        rows = self._filter_rows(filters)
+        if order_by and order_by != 'id':
+            values = self._column_values(order_by, '排序')
+            # 与SQLite一致：升序时NULL在最前，降序时在最后
+            rows.sort(key=lambda r: (values[r] is not None, values[r]), reverse=descending)
+        else:
+            self._column_values(order_by or 'id', '排序')
+            if descending:
+                rows.reverse()
+        stop = None if limit is None else offset + limit
+        return [self.get_row(r) for r in rows[offset:stop]]
+
+    def count(self, filters=None):
+        """统计满足条件的记录数"""
+        if self.sqlite_store is not None:
+            return self.sqlite_store.count(filters)
+        if not filters:
+            return self._row_count
+        return len(self._filter_rows(filters))
+
+    def group_by(self, column, filters=None, limit=None):
+        """按列分组计数，返回[(值, 数量), ...]，数量从多到少"""
+        if self.sqlite_store is not None:
+            return self.sqlite_store.group_by(column, filters, limit)
+        counts = {}
+        values = self._column_values(column, '分组')
+        for r in self._filter_rows(filters):
+            key = values[r]
+            counts[key] = counts.get(key, 0) + 1
+        result = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)
+        return result[:limit] if limit is not None else result
+
+    def _column_values(self, column, purpose='过滤'):
+        """按数据库的列名取内存中的列，允许的列与SQLite查询相同"""
+        from sqlite_store import COLUMNS
+        if column not in COLUMNS:
+            raise ValueError(f"不支持的{purpose}列: {column}")
+        if column == 'id':
+            return range(1, self._row_count + 1)
+        values = self._columns.get(MEMORY_COLUMN_ALIASES.get(column, column))
+        # 列还没有出现过时相当于数据库中的NULL
+        return values if values is not None else [None] * self._row_count
+
+    def _filter_rows(self, filters):
+        """在内存列缓冲区上按条件筛选，返回行号列表"""
+        rows = list(range(self._row_count))
+        for column, condition in _filter_items(filters):
+            op, target = condition if isinstance(condition, tuple) else ('=', condition)
+            test = _make_predicate(op.lower(), target)
+            values = self._column_values(column)
+            rows = [r for r in rows if test(values[r])]
+        return rows
+
+    @property
+    def searchable_rows(self):
+        """可以搜索的行数，从文件加载的索引校验完成前小于row_count"""
+        return min(self._row_count, self.search_index.verified_rows)
+
+    def search(self, query, start=0, limit=None):
+        """全文搜索，返回匹配的行号列表；查询为空时返回None"""
+        rows = self.search_index.search(query, start=start)
+        if rows:
+            end = self.searchable_rows
+            if rows[-1] >= end:
+                rows = rows[:bisect.bisect_left(rows, end)]
+        return rows[:limit] if rows is not None and limit is not None else rows
+
+    def load_search_index(self, path):
+        """加载保存的搜索索引，之后按原来的顺序加载的记录只做校验，不再分词"""
+        if self._row_count:
+            return False
+        return self.search_index.load(path)
+
+    def finish_search_index(self):
+        """数据已全部加载但加载的索引仍未校验完（会话数据比索引少），用已有数据重建"""
+        if self.search_index.pending:
+            self.search_index.rebuild(self._record_for_projection(r) for r in range(self._row_count))
+
+    def save_search_index(self, path):
+        if self.search_index.pending or not self._row_count:
+            return False
+        self.search_index.save(path)
+        return True
+
     def load_from_file(self, file_path):
         """从文件加载数据"""
         try:
@@ -14,7 +356,8 @@ class DataProcessor:
             # 处理数据
             processed_data = self.process_data(data)
             if processed_data:
-                self.data_frame = pd.DataFrame(processed_data)
+                self.clear()
+                self.add_items(processed_data)
                 return True
             return False
         except Exception as e:
@@ -27,7 +370,8 @@ class DataProcessor:
             # 处理数据
             processed_data = self.process_data(captured_data)
             if processed_data:
-                self.data_frame = pd.DataFrame(processed_data)
+                self.clear()
+                self.add_items(processed_data)
                 return True
             return False
         except Exception as e:
@@ -60,18 +404,247 @@ class DataProcessor:
         
         return result
     
-    def save_to_excel(self, file_path):
-        """保存数据到Excel文件"""
-        if self.data_frame is not None:
-            self.data_frame.to_excel(file_path, index=False)
-            return True
-        return False
+    def save_to_excel(self, file_path, progress=None, is_cancelled=None, chunk_size=5000):
+        """流式保存数据到Excel文件
+
+        使用只写模式的工作簿按块写入行，内存占用与数据量无关；
+        超过单个工作表的行数上限时自动拆分到多个工作表。
+        progress(已写行数, 总行数)用于报告进度，is_cancelled()返回True时抛出ExportCancelled。
+        """
+        if self._row_count == 0:
+            return False
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        # 取当前数据的快照，导出期间新追加的行不影响本次导出
+        total = self._row_count
+        names = list(self._columns)
+        values = [self._columns[name] for name in names]
+        rows_per_sheet = EXCEL_MAX_ROWS - 1
+
+        def cell(value):
+            if value is None:
+                return None
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            elif not isinstance(value, (str, int, float, bool)):
+                value = str(value)
+            if isinstance(value, str):
+                value = ILLEGAL_CHARACTERS_RE.sub('', value)[:EXCEL_MAX_CELL_CHARS]
+            return value
+
+        wb = Workbook(write_only=True)
+        ws = None
+        for start in range(0, total, chunk_size):
+            if is_cancelled is not None and is_cancelled():
+                raise ExportCancelled()
+            stop = min(total, start + chunk_size)
+            for row in range(start, stop):
+                if row % rows_per_sheet == 0:
+                    ws = wb.create_sheet(f"数据{row // rows_per_sheet + 1}")
+                    ws.append(names)
+                ws.append([cell(column[row]) for column in values])
+            if progress is not None:
+                progress(stop, total)
+        wb.save(file_path)
+        return True
     
+    def save_to_parquet(self, file_path, progress=None, is_cancelled=None, row_group_size=50000):
+        """按行组增量写入Parquet文件（需要pyarrow）
+
+        host/method/path使用字典编码，response_data以及无法用单一类型保存的提取字段
+        保存为JSON文本列，列名记录在文件元数据中，导入时自动还原为原始结构。
+        """
+        if self._row_count == 0:
+            return False
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        total = self._row_count
+        names = list(self._columns)
+        values = [self._columns[name] for name in names]
+        fields = []
+        # 按值推断类型失败的列，每个值都以JSON文本保存
+        encoded_columns = set()
+        for name, column in zip(names, values):
+            if name in PARQUET_COLUMN_TYPES:
+                type_name = PARQUET_COLUMN_TYPES[name]
+            elif name in PARQUET_JSON_COLUMNS:
+                type_name = 'string'
+            else:
+                type_name = infer_parquet_type(column)
+                if type_name is None:
+                    type_name = 'string'
+                    encoded_columns.add(name)
+            fields.append(pa.field(name, getattr(pa, type_name)()))
+        json_columns = [name for name in names if name in PARQUET_JSON_COLUMNS or name in encoded_columns]
+        schema = pa.schema(fields, metadata={PARQUET_METADATA_KEY: json.dumps(json_columns).encode()})
+
+        def convert(name, chunk):
+            if name in PARQUET_JSON_COLUMNS:
+                # 以JSON文本保存的response_data直接写入
+                return [v if v is None or isinstance(v, str) else json.dumps(v, ensure_ascii=False)
+                        for v in chunk]
+            if name in encoded_columns:
+                return [None if v is None else json.dumps(v, ensure_ascii=False) for v in chunk]
+            return chunk
+
+        dictionary_columns = [name for name in names if name in PARQUET_DICTIONARY_COLUMNS]
+        with pq.ParquetWriter(file_path, schema, use_dictionary=dictionary_columns or False,
+                              compression='zstd') as writer:
+            for start in range(0, total, row_group_size):
+                if is_cancelled is not None and is_cancelled():
+                    raise ExportCancelled()
+                stop = min(total, start + row_group_size)
+                arrays = [pa.array(convert(name, column[start:stop]), type=field.type)
+                          for name, column, field in zip(names, values, fields)]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                if progress is not None:
+                    progress(stop, total)
+        return True
+
+    def load_from_parquet(self, file_path, batch_size=50000):
+        """按批读取Parquet文件，内存占用只与批大小有关"""
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(file_path)
+        metadata = parquet_file.schema_arrow.metadata or {}
+        try:
+            json_columns = json.loads(metadata.get(PARQUET_METADATA_KEY, b'[]'))
+        except ValueError:
+            json_columns = []
+        self.clear()
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            items = batch.to_pylist()
+            for item in items:
+                for name in json_columns:
+                    value = item.get(name)
+                    if value is not None:
+                        try:
+                            item[name] = json.loads(value)
+                        except ValueError:
+                            pass
+            self.add_items(items)
+        return self._row_count > 0
+
+    def load_from_capture_dir(self, directory, begin=None, end=None, host=None):
+        """从分段存储目录加载记录，指定时间范围时只读取对应的记录（压缩分段只解压用到的帧）"""
+        from capture_store import CaptureSession
+
+        store = CaptureSession(directory)
+        self.clear()
+        if begin is None and end is None and not host:
+            for items in store.iter_records():
+                self.add_items(items)
+        else:
+            begin = float('-inf') if begin is None else begin
+            end = float('inf') if end is None else end
+            self.add_items(store.find_time_range(begin, end, host))
+        return self._row_count > 0
+
+    def import_batches(self, importer):
+        """清空现有数据，把导入器读出的记录按批加入，每加入一批产出一次已导入的条数
+
+        调用方可以在两批之间刷新界面、显示进度，停止迭代时保留已导入的部分。
+        去重的分段文件中重复的响应体只带response_hash，按文件中第一次出现的内容取回，
+        取不到的记录数见missing_bodies。
+        """
+        self.clear()
+        for batch in importer.batches():
+            self.add_items(batch)
+            yield importer.imported
+
+    def export(self, file_path, progress=None, is_cancelled=None):
+        """按扩展名选择导出格式"""
+        if file_path.lower().endswith('.parquet'):
+            return self.save_to_parquet(file_path, progress=progress, is_cancelled=is_cancelled)
+        return self.save_to_excel(file_path, progress=progress, is_cancelled=is_cancelled)
+
     def add_item(self, item):
         """添加单个数据项"""
-        if self.data_frame is None:
-            self.data_frame = pd.DataFrame([item])
-        else:
-            # 创建一个新的DataFrame并追加
-            new_df = pd.DataFrame([item])
-            self.data_frame = pd.concat([self.data_frame, new_df], ignore_index=True)
\ No newline at end of file
+        self.add_items([item])
+
+    def add_items(self, items):
+        """批量添加数据项，按列追加到缓冲区"""
+        if not isinstance(items, list):
+            items = list(items)
+        if not items:
+            return
+        self._resolve_bodies(items)
+        if not self.search_index.add_items(items, self._row_count):
+            # 加载的索引与数据不一致，用已有数据重建后再添加本批
+            self.search_index.rebuild(self._record_for_projection(r) for r in range(self._row_count))
+            self.search_index.add_items(items, self._row_count)
+        self.endpoints.add_items(items)
+        for item in items:
+            self.host_metrics.add(item)
+        # 投影列对整批数据一次性提取
+        projected = self.projection.extract_columns(items) if self.projection else {}
+        for path, extracted in projected.items():
+            # 记录中已经有同名字段（如导入带提取字段的Parquet文件，response_data可能未保存）时，
+            # 提取不到的行使用记录中的值，该字段只作为投影列保存一次
+            for i, item in enumerate(items):
+                if extracted[i] is None and path in item:
+                    extracted[i] = item[path]
+        if projected and self.raw_mode != 'keep':
+            items = [self._compact_raw(item) for item in items]
+        columns = self._columns
+        first_row = self._row_count
+        row_count = first_row
+        plain = [(key, values) for key, values in columns.items() if key not in projected]
+        for item in items:
+            # 新出现的列，用None补齐之前的行
+            for key in item:
+                if key not in columns and key not in projected:
+                    values = [None] * row_count
+                    columns[key] = values
+                    plain.append((key, values))
+            for key, values in plain:
+                values.append(item.get(key))
+            row_count += 1
+        for path, extracted in projected.items():
+            values = columns.get(path)
+            if values is None:
+                columns[path] = [None] * first_row + extracted
+            else:
+                values.extend(extracted)
+        self._row_count = row_count
+
+
+def _filter_items(filters):
+    """过滤条件的(列名, 条件)序列，filters可以是字典或列表"""
+    if not filters:
+        return []
+    return filters.items() if isinstance(filters, dict) else filters
+
+
+def _make_predicate(op, target):
+    """把过滤条件转换为判断函数，语义与SQLite查询保持一致"""
+    if op in ('=', '=='):
+        return lambda v: v == target
+    if op == '!=':
+        return lambda v: v is not None and v != target
+    if op == 'in':
+        targets = set(target)
+        return lambda v: v in targets
+    if op == 'prefix':
+        return lambda v: isinstance(v, str) and v.startswith(target)
+    if op == 'like':
+        pattern = ''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in target)
+        regex = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+        return lambda v: v is not None and regex.fullmatch(str(v)) is not None
+    compare = {
+        '<': lambda v: v < target,
+        '<=': lambda v: v <= target,
+        '>': lambda v: v > target,
+        '>=': lambda v: v >= target,
+    }.get(op)
+    if compare is None:
+        raise ValueError(f"不支持的操作符: {op}")
+
+    def predicate(v):
+        try:
+            return v is not None and compare(v)
+        except TypeError:
+            return False
+    return predicate
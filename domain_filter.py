@@ -0,0 +1,112 @@
+import re
+
+
+class DomainMatcher:
+    """编译后的域名过滤器
+
+    支持的规则写法：
+      example.com       只匹配该域名
+      *.example.com     匹配所有子域名（不含example.com本身）
+      .example.com      匹配example.com及其所有子域名
+      re:^api\\d+\\.     正则表达式（对完整域名search）
+    精确和通配规则存放在按标签倒序的前缀树中，查找代价只与域名的标签数有关。
+    无法编译的正则规则会被跳过，记录在invalid中（规则, 错误信息）。
+    """
+
+    _EXACT = '$exact'
+    _SUBDOMAINS = '$sub'
+
+    def __init__(self, rules=None):
+        self.rules = []
+        self.invalid = []
+        self._trie = {}
+        self._regexes = []
+        if rules:
+            self.update(rules)
+
+    @classmethod
+    def from_text(cls, text):
+        """从逗号分隔的字符串创建"""
+        return cls(parse_rules(text))
+
+    def update(self, rules):
+        """重新编译规则"""
+        trie = {}
+        regexes = []
+        valid = []
+        invalid = []
+        for rule in rules:
+            rule = rule.strip()
+            if not rule:
+                continue
+            if rule.startswith('re:'):
+                try:
+                    regexes.append(re.compile(rule[3:], re.IGNORECASE))
+                except re.error as e:
+                    invalid.append((rule, str(e)))
+                    continue
+                valid.append(rule)
+                continue
+            valid.append(rule)
+            rule = rule.lower().rstrip('.')
+            if rule.startswith('*.'):
+                self._insert(trie, rule[2:], self._SUBDOMAINS)
+            elif rule.startswith('.'):
+                self._insert(trie, rule[1:], self._SUBDOMAINS)
+                self._insert(trie, rule[1:], self._EXACT)
+            else:
+                self._insert(trie, rule, self._EXACT)
+        # 整体替换引用，其他线程读取时不会看到半更新的状态
+        self._trie, self._regexes = trie, regexes
+        self.rules = valid
+        self.invalid = invalid
+
+    @staticmethod
+    def _insert(trie, domain, marker):
+        node = trie
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        node[marker] = True
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, host):
+        """判断域名是否允许；没有任何规则时全部允许"""
+        if not self.rules:
+            return True
+        trie, regexes = self._trie, self._regexes
+        host = host.lower().rstrip('.')
+        labels = host.split('.')
+        node = trie
+        for i in range(len(labels) - 1, -1, -1):
+            node = node.get(labels[i])
+            if node is None:
+                break
+            if i == 0:
+                if self._EXACT in node:
+                    return True
+            elif self._SUBDOMAINS in node:
+                return True
+        for regex in regexes:
+            if regex.search(host):
+                return True
+        return False
+
+
+def invalid_rules(rules):
+    """返回无法编译的规则：[(规则, 错误信息), ...]"""
+    invalid = []
+    for rule in rules:
+        rule = rule.strip()
+        if rule.startswith('re:'):
+            try:
+                re.compile(rule[3:])
+            except re.error as e:
+                invalid.append((rule, str(e)))
+    return invalid
+
+
+def parse_rules(text):
+    """把逗号分隔的字符串拆分为规则列表"""
+    return [d.strip() for d in (text or '').split(',') if d.strip()]
@@ -0,0 +1,123 @@
+"""接口模板归一化和按接口的增量汇总
+
+同一接口因查询参数（时间戳、签名等）或路径中的数字/UUID不同而产生大量不同的url，
+归一化后折叠为同一个接口模板，例如：
+  /pcbackstage/coreMotionData?biz_type=4&_ts=1754811998550
+  -> /pcbackstage/coreMotionData?biz_type=*
+  /api/user/123456/orders/9f1c...-...  -> /api/user/{n}/orders/{uuid}
+"""
+import re
+from metrics import RecordMetrics
+
+# 这些查询参数每次请求都会变化，直接从模板中去掉
+VOLATILE_PARAMS = frozenset({
+    '_', '_t', '_ts', 't', 'ts', 'timestamp', 'time', 'nonce', 'rnd', 'random', 'r',
+    'sign', 'signature', 'callback', 'cb', 'msToken', 'X-Bogus', '_signature',
+})
+
+_NUMBER_RE = re.compile(r'^\d+$')
+_UUID_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+_HEX_RE = re.compile(r'^[0-9a-fA-F]{16,}$')
+
+
+def _normalize_segment(segment):
+    if not segment:
+        return segment
+    if _NUMBER_RE.match(segment):
+        return '{n}'
+    if _UUID_RE.match(segment):
+        return '{uuid}'
+    if _HEX_RE.match(segment):
+        return '{hex}'
+    return segment
+
+
+def normalize_path(path):
+    """把路径归一化为接口模板：折叠数字/UUID/长十六进制段，查询参数只保留参数名"""
+    path = path or '/'
+    base, _, query = path.partition('?')
+    base = '/'.join(_normalize_segment(s) for s in base.split('/'))
+    if not query:
+        return base
+    names = set()
+    for pair in query.split('&'):
+        name = pair.split('=', 1)[0]
+        if name and name not in VOLATILE_PARAMS:
+            names.add(name)
+    if not names:
+        return base
+    return base + '?' + '&'.join(f'{name}=*' for name in sorted(names))
+
+
+class EndpointStats:
+    """单个接口模板的汇总数据"""
+    __slots__ = ('method', 'host', 'template', 'count', 'status_counts', 'last_seen', 'metrics')
+
+    def __init__(self, method, host, template):
+        self.method = method
+        self.host = host
+        self.template = template
+        self.count = 0
+        self.status_counts = {}
+        self.last_seen = ''
+        # 耗时和响应大小的流式分位数
+        self.metrics = RecordMetrics()
+
+    def status_summary(self):
+        """状态码分布，如 200:95 404:5"""
+        return ' '.join(f'{code}:{n}' for code, n in
+                        sorted(self.status_counts.items(), key=lambda kv: -kv[1]))
+
+
+class EndpointIndex:
+    """接口模板 -> 汇总数据的哈希索引，每条记录O(1)更新"""
+
+    def __init__(self):
+        self._stats = {}
+        # 同一个原始路径会反复出现，缓存其归一化结果
+        self._path_cache = {}
+
+    def __len__(self):
+        return len(self._stats)
+
+    def clear(self):
+        self._stats = {}
+        self._path_cache = {}
+
+    def _template(self, path):
+        template = self._path_cache.get(path)
+        if template is None:
+            template = normalize_path(path)
+            if len(self._path_cache) < 100000:
+                self._path_cache[path] = template
+        return template
+
+    def key(self, item):
+        """记录对应的接口：(方法, 域名, 路径模板)"""
+        return (item.get('method') or '', item.get('host') or '', self._template(item.get('path')))
+
+    def add(self, item):
+        key = self.key(item)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = EndpointStats(*key)
+        stats.count += 1
+        status = item.get('status_code')
+        stats.status_counts[status] = stats.status_counts.get(status, 0) + 1
+        timestamp = str(item.get('timestamp') or '')
+        if timestamp > stats.last_seen:
+            stats.last_seen = timestamp
+        stats.metrics.add(item)
+        return stats
+
+    def add_items(self, items):
+        for item in items:
+            self.add(item)
+
+    def get(self, method, host, template):
+        return self._stats.get((method, host, template))
+
+    def top(self, limit=None):
+        """按请求次数从多到少返回接口汇总"""
+        result = sorted(self._stats.values(), key=lambda s: s.count, reverse=True)
+        return result[:limit] if limit is not None else result
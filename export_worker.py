@@ -0,0 +1,32 @@
+import traceback
+from PyQt5.QtCore import QThread, pyqtSignal
+from data_processor import ExportCancelled
+
+
+class ExportWorker(QThread):
+    """在后台线程中导出Excel/Parquet，避免界面卡顿"""
+    # 进度：已写行数、总行数
+    progress_signal = pyqtSignal(int, int)
+    finished_signal = pyqtSignal(str)
+    failed_signal = pyqtSignal(str)
+    cancelled_signal = pyqtSignal()
+
+    def __init__(self, processor, file_path, parent=None):
+        super().__init__(parent)
+        self.processor = processor
+        self.file_path = file_path
+        self._cancelled = False
+
+    def cancel(self):
+        """请求取消导出，在下一个数据块写入前生效"""
+        self._cancelled = True
+
+    def run(self):
+        try:
+            self.processor.export(self.file_path, progress=self.progress_signal.emit,
+                                  is_cancelled=lambda: self._cancelled)
+            self.finished_signal.emit(self.file_path)
+        except ExportCancelled:
+            self.cancelled_signal.emit()
+        except Exception as e:
+            self.failed_signal.emit(f"{e}\n详细信息:\n{traceback.format_exc()}")
@@ -0,0 +1,319 @@
+"""流式导入其他工具保存的抓包数据
+
+支持的格式：
+  har    浏览器开发者工具导出的HAR文件，逐条解码log.entries，不把整个文件读入内存
+  flows  mitmdump -w 保存的流量文件（需要安装mitmproxy），与插件使用相同的解析逻辑
+  jsonl  每行一条记录的JSON行文件，包括分段存储的.jsonl/.jsonl.gz
+  json   导出的JSON数组，逐个元素解码
+记录转换为与mitm_writer相同的字段，按批交给DataProcessor，内存占用只与批大小和单条记录大小有关。
+"""
+import base64
+import collections
+import datetime
+import gzip
+import io
+import json
+import os
+import re
+from urllib.parse import urlsplit
+
+FORMATS = ('har', 'flows', 'jsonl', 'json')
+
+# 扩展名到格式的对应关系，按顺序匹配
+EXTENSIONS = (
+    ('.har', 'har'),
+    ('.jsonl.gz', 'jsonl'),
+    ('.jsonl', 'jsonl'),
+    ('.ndjson', 'jsonl'),
+    ('.json', 'json'),
+    ('.flows', 'flows'),
+    ('.flow', 'flows'),
+    ('.mitm', 'flows'),
+    ('.dump', 'flows'),
+)
+
+# 每次从文件读取的字符数；单条记录超过该大小时读取量按需翻倍
+CHUNK_SIZE = 1024 * 1024
+
+_SEPARATOR = re.compile(r'[\s,]*')
+_JSON_START = ('{', '[')
+
+
+def detect_format(path):
+    """按扩展名判断格式，无法判断时返回None"""
+    lower = path.lower()
+    for suffix, fmt in EXTENSIONS:
+        if lower.endswith(suffix):
+            return fmt
+    return None
+
+
+def iter_json_array(f, key=None, chunk_size=CHUNK_SIZE):
+    """逐个解码文本文件中一个JSON数组的元素
+
+    key为空时解码第一个数组，否则解码名为key的字段对应的数组（如HAR的"entries"），
+    缓冲区只保留当前元素和一个读取块。
+    """
+    decoder = json.JSONDecoder()
+    if key:
+        start_re = re.compile(r'(?<!\\)"%s"\s*:\s*\[' % re.escape(key))
+    else:
+        start_re = re.compile(r'\[')
+    buf = ''
+    while True:
+        chunk = f.read(chunk_size)
+        buf += chunk
+        match = start_re.search(buf)
+        if match:
+            break
+        if not chunk:
+            raise ValueError(f"文件中没有找到{'字段 ' + key if key else 'JSON数组'}")
+        # 保留末尾一小段，字段名可能跨越两个读取块
+        buf = buf[-64:]
+
+    pos = match.end()
+    eof = False
+    while True:
+        pos = _SEPARATOR.match(buf, pos).end()
+        if pos < len(buf):
+            if buf[pos] == ']':
+                return
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                pos = end
+                yield value
+                continue
+        elif eof:
+            raise ValueError("文件在JSON数组结束前被截断")
+        # 当前元素不完整：丢弃已解码的部分，至少读入与剩余缓冲区等量的数据，避免大元素反复重试
+        rest = buf[pos:]
+        chunk = f.read(max(chunk_size, len(rest)))
+        eof = not chunk
+        buf = rest + chunk
+        pos = 0
+
+
+def _parse_time(text):
+    """HAR的startedDateTime（ISO 8601）转换为epoch秒"""
+    if not text:
+        return None
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    try:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+def _timing(timings, name):
+    """HAR中-1表示不适用"""
+    value = timings.get(name)
+    return value if isinstance(value, (int, float)) and value > 0 else 0
+
+
+def _har_body(content):
+    """HAR响应体解析为JSON，返回(跳过原因, 数据)"""
+    text = content.get('text')
+    if not text:
+        return 'empty', None
+    if content.get('encoding') == 'base64':
+        try:
+            text = base64.b64decode(text).decode('utf-8-sig')
+        except (ValueError, UnicodeDecodeError):
+            return 'decode_error', None
+    stripped = text.lstrip('\ufeff \t\r\n')
+    if not stripped or stripped[0] not in _JSON_START:
+        return 'not_json', None
+    try:
+        return None, json.loads(stripped)
+    except ValueError:
+        return 'invalid_json', None
+
+
+def har_entry_to_record(entry):
+    """把HAR的一个entry转换为记录，返回(跳过原因, 记录)"""
+    request = entry.get('request') or {}
+    response = entry.get('response') or {}
+    if not response.get('status'):
+        return 'empty', None
+    reason, data = _har_body(response.get('content') or {})
+    if reason is not None:
+        return reason, None
+
+    url = request.get('url', '')
+    parts = urlsplit(url)
+    path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+    start = _parse_time(entry.get('startedDateTime'))
+    timings = entry.get('timings') or {}
+    duration = entry.get('time')
+    duration = round(duration, 1) if isinstance(duration, (int, float)) and duration >= 0 else None
+    # 发送完成前的各阶段之和为请求结束时间，再加上等待时间为首字节时间
+    sent = sum(_timing(timings, name) for name in ('blocked', 'dns', 'connect', 'send'))
+    ttfb = sent + _timing(timings, 'wait')
+    metrics = {
+        "timestamp_start": start,
+        "request_end": None,
+        "response_start": None,
+        "response_end": None,
+        "request_bytes": max(request.get('bodySize') or 0, 0),
+        "response_bytes": max(response.get('bodySize') or 0, 0) or max(
+            (response.get('content') or {}).get('size') or 0, 0),
+        "duration_ms": duration,
+        "ttfb_ms": round(ttfb, 1) if timings else None,
+    }
+    if start is not None:
+        metrics["request_end"] = start + sent / 1000
+        metrics["response_start"] = start + ttfb / 1000
+        if duration is not None:
+            metrics["response_end"] = start + duration / 1000
+    end = metrics["response_end"] or start
+    record = {
+        "url": url,
+        "method": request.get('method', ''),
+        "host": parts.hostname or '',
+        "path": path,
+        "status_code": response.get('status'),
+        "response_data": data,
+        "timestamp": datetime.datetime.fromtimestamp(end).strftime('%Y-%m-%d %H:%M:%S') if end else '',
+    }
+    record.update(metrics)
+    return None, record
+
+
+class StreamImporter:
+    """按格式流式读取一个文件中的记录，分批输出
+
+    导入过程中可以通过bytes_read/total_bytes显示进度，skipped按原因统计跳过的条目。
+    """
+
+    def __init__(self, path, fmt=None, batch_size=5000, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.format = fmt or detect_format(path) or 'json'
+        if self.format not in FORMATS:
+            raise ValueError(f"不支持的导入格式: {self.format}")
+        self.batch_size = max(batch_size, 1)
+        self.chunk_size = chunk_size
+        self.total_bytes = os.path.getsize(path)
+        self.imported = 0
+        self.skipped = collections.Counter()
+        self._raw = None
+
+    @property
+    def bytes_read(self):
+        """已读取的文件字节数（压缩文件为压缩后的字节数）"""
+        try:
+            return self._raw.tell() if self._raw is not None else 0
+        except (OSError, ValueError):
+            return self.total_bytes
+
+    def _text(self, raw):
+        return io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace')
+
+    def _har_records(self, text):
+        for entry in iter_json_array(text, 'entries', self.chunk_size):
+            if not isinstance(entry, dict):
+                self.skipped['invalid'] += 1
+                continue
+            reason, record = har_entry_to_record(entry)
+            if reason is not None:
+                self.skipped[reason] += 1
+                continue
+            yield record
+
+    def _iter_har(self, raw):
+        return self._har_records(self._text(raw))
+
+    def _iter_jsonl(self, raw):
+        source = gzip.GzipFile(fileobj=raw) if self.path.lower().endswith('.gz') else raw
+        for line in source:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                self.skipped['invalid_json'] += 1
+                continue
+            if isinstance(item, dict):
+                yield item
+            else:
+                self.skipped['invalid'] += 1
+
+    def _iter_json(self, raw):
+        text = self._text(raw)
+        head = text.read(self.chunk_size)
+        stripped = head.lstrip()
+        if stripped.startswith('{'):
+            if re.match(r'\{\s*"log"\s*:', stripped):
+                # 扩展名为.json的HAR文件
+                yield from self._har_records(_Prepended(head, text))
+                return
+            # 其他JSON对象无法流式解析，按load_from_file的方式整体读入
+            from data_processor import DataProcessor
+            data = json.loads(head + text.read())
+            yield from DataProcessor().process_data(data)
+            return
+        for item in iter_json_array(_Prepended(head, text), None, self.chunk_size):
+            if isinstance(item, dict):
+                yield item
+            else:
+                self.skipped['invalid'] += 1
+
+    def _iter_flows(self, raw):
+        from mitmproxy import http
+        from mitmproxy import io as mitm_io
+        import mitm_writer
+
+        # 只用于解析，不写文件也不推送
+        writer = mitm_writer.CaptureWriter(capture_dir='', stream_port=0, sqlite_path='', dedup=False)
+        for flow in mitm_io.FlowReader(raw).stream():
+            if not isinstance(flow, http.HTTPFlow):
+                self.skipped['not_http'] += 1
+                continue
+            reason, record = writer.build_item(flow)
+            if reason is not None:
+                self.skipped[reason] += 1
+                continue
+            yield record
+
+    def records(self):
+        """逐条输出记录"""
+        with open(self.path, 'rb') as raw:
+            self._raw = raw
+            try:
+                for record in getattr(self, '_iter_' + self.format)(raw):
+                    self.imported += 1
+                    yield record
+            finally:
+                self._raw = None
+
+    def batches(self):
+        """按batch_size分批输出记录列表"""
+        batch = []
+        for record in self.records():
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def skipped_summary(self):
+        return ', '.join(f"{reason}={count}" for reason, count in self.skipped.most_common())
+
+
+class _Prepended:
+    """把已经读出的开头部分和剩余的文件拼成一个可读对象"""
+
+    def __init__(self, head, f):
+        self._head = head
+        self._f = f
+
+    def read(self, size=-1):
+        if self._head:
+            head, self._head = self._head, ''
+            return head
+        return self._f.read(size)
@@ -0,0 +1,331 @@
+"""代理压测：测量mitmdump和抓包插件带来的额外延迟
+
+启动一个本地上游HTTP(S)服务，按配置返回JSON或非JSON响应，再用多个保持连接的客户端
+分别直连上游、经过不加载插件的mitmdump、经过加载插件的mitmdump发送请求，
+输出每种情况的请求数/秒和p50/p99延迟，以及相对直连增加的延迟：
+  python load_test.py --clients 16 --duration 10
+  python load_test.py --payload json:2000,json:100000,text:5000 --https --output load.json
+不需要联网；--https时上游使用临时生成的自签名证书，mitmdump以ssl_insecure方式连接上游。
+"""
+import argparse
+import http.client
+import http.server
+import json
+import os
+import shutil
+import socket
+import ssl
+import sys
+import tempfile
+import threading
+import time
+from proxy_manager import ProxyManager
+
+SCENARIOS = ('direct', 'proxy', 'proxy_addon')
+
+
+# ---------------------------------------------------------------- 上游服务
+
+def _json_body(size):
+    item = {"id": 0, "name": "item", "value": 0.5, "tags": ["a", "b"]}
+    count = max(size // 60, 1)
+    return json.dumps({"code": 0, "data": [dict(item, id=i) for i in range(count)]}).encode('utf-8')
+
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'text': 'text/html; charset=utf-8',
+    'image': 'image/png',
+}
+
+
+def build_payload(kind, size):
+    if kind == 'json':
+        return _json_body(size)
+    if kind == 'text':
+        return b'<html>' + b'x' * max(size - 13, 0) + b'</html>'
+    return os.urandom(size)
+
+
+class UpstreamHandler(http.server.BaseHTTPRequestHandler):
+    """/json/2000、/text/5000、/image/20000：返回对应类型和大小的响应"""
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分两次写出，不关闭Nagle时每个请求会多出约40ms的延迟确认等待
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        body = self.server.payloads.get(tuple(parts))
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES[parts[0]])
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Upstream:
+    """本地上游服务，在后台线程运行"""
+
+    def __init__(self, payloads, use_tls=False):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), UpstreamHandler)
+        self.server.daemon_threads = True
+        self.server.payloads = {(kind, str(size)): build_payload(kind, size) for kind, size in payloads}
+        self.use_tls = use_tls
+        self._tmpdir = None
+        if use_tls:
+            self._tmpdir = tempfile.mkdtemp(prefix='load_test-')
+            cert, key = _self_signed_cert(self._tmpdir)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(cert, key)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+def _self_signed_cert(directory):
+    """用cryptography（mitmproxy的依赖）生成127.0.0.1的自签名证书"""
+    import datetime
+    import ipaddress
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, '127.0.0.1')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=7))
+            .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address('127.0.0.1'))]),
+                           critical=False)
+            .sign(key, hashes.SHA256()))
+    cert_path = os.path.join(directory, 'cert.pem')
+    key_path = os.path.join(directory, 'key.pem')
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+# ---------------------------------------------------------------- 客户端
+
+def _connect(upstream, proxy_port, timeout):
+    """建立保持连接的客户端：直连上游，或经过代理（HTTPS使用CONNECT隧道）"""
+    insecure = ssl._create_unverified_context()
+    if proxy_port is None:
+        if upstream.use_tls:
+            return http.client.HTTPSConnection('127.0.0.1', upstream.port, timeout=timeout, context=insecure)
+        return http.client.HTTPConnection('127.0.0.1', upstream.port, timeout=timeout)
+    if upstream.use_tls:
+        conn = http.client.HTTPSConnection('127.0.0.1', proxy_port, timeout=timeout, context=insecure)
+        conn.set_tunnel('127.0.0.1', upstream.port)
+        return conn
+    return http.client.HTTPConnection('127.0.0.1', proxy_port, timeout=timeout)
+
+
+def _client(upstream, proxy_port, paths, deadline, latencies, errors, timeout):
+    conn = _connect(upstream, proxy_port, timeout)
+    # 经过HTTP代理时请求行使用完整URL
+    prefix = f'http://127.0.0.1:{upstream.port}' if proxy_port is not None and not upstream.use_tls else ''
+    i = 0
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request('GET', prefix + path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            conn = _connect(upstream, proxy_port, timeout)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return values[min(int(q * (len(values) - 1) + 0.5), len(values) - 1)]
+
+
+def run_load(upstream, proxy_ports, paths, clients, duration, warmup=1.0, timeout=10):
+    """运行一轮压测，返回(延迟列表, 错误列表, 实际秒数)
+
+    proxy_ports为None时直连上游，多个端口时客户端轮流分配到各端口。
+    """
+    ports = proxy_ports or [None]
+    if warmup > 0:
+        for port in ports:
+            _client(upstream, port, paths, time.monotonic() + warmup / len(ports), [], [], timeout)
+    latencies_per_client = [[] for _ in range(clients)]
+    errors = []
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    threads = [threading.Thread(target=_client, daemon=True,
+                                args=(upstream, ports[i % len(ports)], paths, deadline,
+                                      latencies_per_client[i], errors, timeout))
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies = sorted(v for values in latencies_per_client for v in values)
+    return latencies, errors, elapsed
+
+
+def summarize(name, latencies, errors, elapsed, **extra):
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    result = {
+        'scenario': name,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        'p50_ms': ms(percentile(latencies, 0.5)),
+        'p90_ms': ms(percentile(latencies, 0.9)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+    }
+    result.update(extra)
+    return result
+
+
+# ---------------------------------------------------------------- 代理
+
+def start_proxy(args, upstream, with_addon, capture_dir):
+    manager = ProxyManager(args.proxy_port)
+    manager.listen_host = '127.0.0.1'
+    manager.quiet = True
+    manager.load_addon = with_addon
+    manager.capture_dir = capture_dir
+    manager.worker_count = args.workers
+    if upstream.use_tls:
+        manager.extra_args = ['--set', 'ssl_insecure=true']
+    captured = [0]
+
+    def on_records(items):
+        captured[0] += len(items)
+
+    manager.on_records = on_records
+    manager.start_proxy()
+    return manager, captured
+
+
+def parse_payloads(text):
+    payloads = []
+    for part in text.split(','):
+        kind, _, size = part.strip().partition(':')
+        if kind not in CONTENT_TYPES:
+            raise SystemExit(f"不支持的响应类型: {kind}（可选 {', '.join(CONTENT_TYPES)}）")
+        payloads.append((kind, int(size or 1000)))
+    return payloads
+
+
+def _free_port(port):
+    with socket.socket() as sock:
+        return sock.connect_ex(('127.0.0.1', port)) != 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测量代理和抓包插件带来的额外延迟")
+    parser.add_argument('--clients', type=int, default=8, help="并发的保持连接客户端数")
+    parser.add_argument('--duration', type=float, default=5.0, help="每种情况的压测时长（秒）")
+    parser.add_argument('--warmup', type=float, default=1.0, help="每种情况正式计时前的预热时长（秒）")
+    parser.add_argument('--payload', default='json:2000,json:50000,text:5000,image:20000',
+                        help="上游响应，类型:字节数，逗号分隔，请求按顺序轮流使用")
+    parser.add_argument('--https', action='store_true', help="上游使用HTTPS，客户端通过CONNECT隧道访问")
+    parser.add_argument('--proxy-port', type=int, default=18080, help="压测使用的代理端口")
+    parser.add_argument('--workers', type=int, default=1, help="mitmdump工作进程数，客户端平均分配到各进程的端口")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="direct,proxy,proxy_addon")
+    parser.add_argument('--output', help="结果写入的JSON文件，默认输出到标准输出")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    payloads = parse_payloads(args.payload)
+    paths = [f'/{kind}/{size}' for kind, size in payloads]
+    for port in range(args.proxy_port, args.proxy_port + max(args.workers, 1)):
+        if not _free_port(port):
+            print(f"端口 {port} 已被占用", file=sys.stderr)
+            return 1
+
+    upstream = Upstream(payloads, use_tls=args.https)
+    capture_dir = tempfile.mkdtemp(prefix='load_test-captures-')
+    results = []
+    try:
+        for scenario in scenarios:
+            extra = {}
+            manager = None
+            if scenario == 'direct':
+                proxy_ports = None
+            else:
+                manager, captured = start_proxy(args, upstream, scenario == 'proxy_addon', capture_dir)
+                proxy_ports = manager.worker_ports()
+            try:
+                latencies, errors, elapsed = run_load(upstream, proxy_ports, paths, args.clients,
+                                                      args.duration, args.warmup)
+            finally:
+                if manager is not None:
+                    manager.stop_proxy()
+                    manager.stream_server.stop()
+                    if scenario == 'proxy_addon':
+                        extra['captured'] = captured[0]
+            result = summarize(scenario, latencies, errors, elapsed, **extra)
+            results.append(result)
+            print(f"  {scenario:<12} {result['rps'] or 0:>9,.1f} 请求/s  p50 {result['p50_ms']} ms  "
+                  f"p99 {result['p99_ms']} ms  错误 {result['errors']}", file=sys.stderr)
+    finally:
+        upstream.stop()
+        shutil.rmtree(capture_dir, ignore_errors=True)
+
+    # 相对直连增加的延迟，以及插件相对纯代理增加的延迟
+    by_name = {r['scenario']: r for r in results}
+    for name, base in (('proxy', 'direct'), ('proxy_addon', 'direct'), ('proxy_addon', 'proxy')):
+        if name in by_name and base in by_name and by_name[base]['p50_ms'] is not None \
+                and by_name[name]['p50_ms'] is not None:
+            for q in ('p50', 'p99'):
+                key = f'added_{q}_ms_vs_{base}'
+                by_name[name][key] = round(by_name[name][f'{q}_ms'] - by_name[base][f'{q}_ms'], 3)
+
+    report = {
+        'clients': args.clients,
+        'duration': args.duration,
+        'https': args.https,
+        'workers': args.workers,
+        'payloads': [f'{kind}:{size}' for kind, size in payloads],
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,26 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QMainWindow, QMessageBox
-from ui import ApiSnifferUI
+import time
 
 if __name__ == "__main__":
+    started = time.perf_counter()
+    if '--headless' in sys.argv:
+        # 无界面模式，不加载PyQt
+        from cli import main
+        sys.exit(main([arg for arg in sys.argv[1:] if arg != '--headless']))
+
+    from PyQt5.QtWidgets import QApplication
+    from ui import ApiSnifferUI
+
     app = QApplication(sys.argv)
     window = ApiSnifferUI()
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    if '--profile-startup' in sys.argv:
+        # 输出从启动到窗口显示的耗时，以及启动阶段不应加载的重量级依赖
+        # 详细的导入耗时分解见 startup_profiler.py
+        from startup_profiler import HEAVY_MODULES
+        app.processEvents()
+        heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+        print(f"窗口显示耗时: {(time.perf_counter() - started) * 1000:.0f} ms，已加载模块 {len(sys.modules)} 个")
+        if heavy:
+            print(f"警告: 启动时加载了 {', '.join(heavy)}")
+    sys.exit(app.exec_())
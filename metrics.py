@@ -0,0 +1,98 @@
+"""流式分位数统计
+
+QuantileSketch按对数刻度分桶（与HDR直方图/DDSketch相同的思路），
+每个桶覆盖约±1%的相对范围，任意数据量下内存只与数值跨度有关，
+p50/p95/p99的相对误差不超过1%，不需要保存或排序原始数据。
+"""
+import math
+
+
+class QuantileSketch:
+    """对数分桶的分位数草图"""
+    __slots__ = ('_gamma_log', '_buckets', 'zero_count', 'count', 'total', 'min', 'max')
+
+    def __init__(self, relative_accuracy=0.01):
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._gamma_log = math.log(gamma)
+        self._buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value is None or value < 0:
+            return
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if value < 1e-9:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self._gamma_log)
+        self._buckets[key] = self._buckets.get(key, 0) + 1
+
+    def quantile(self, q):
+        """返回分位数q（0~1）的近似值，没有数据时返回None"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self._buckets):
+            seen += self._buckets[key]
+            if seen > rank:
+                # 取桶的中点，保证相对误差在精度范围内
+                value = 2 * math.exp(key * self._gamma_log) / (1 + math.exp(self._gamma_log))
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class RecordMetrics:
+    """单个域名或接口的耗时和响应大小统计"""
+    __slots__ = ('count', 'latency', 'size')
+
+    def __init__(self):
+        self.count = 0
+        self.latency = QuantileSketch()
+        self.size = QuantileSketch()
+
+    def add(self, item):
+        self.count += 1
+        self.latency.add(item.get('duration_ms'))
+        self.size.add(item.get('response_bytes'))
+
+
+class HostMetrics:
+    """按域名汇总的耗时和大小分位数"""
+
+    def __init__(self):
+        self._hosts = {}
+
+    def clear(self):
+        self._hosts = {}
+
+    def add(self, item):
+        host = item.get('host') or ''
+        metrics = self._hosts.get(host)
+        if metrics is None:
+            metrics = self._hosts[host] = RecordMetrics()
+        metrics.add(item)
+
+    def get(self, host):
+        return self._hosts.get(host)
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def hosts(self):
+        """返回[(域名, 统计), ...]，顺序为第一次出现的顺序"""
+        return list(self._hosts.items())
@@ -1,21 +1,345 @@
-from mitmproxy import http
+# 插件在mitmdump启动时加载，只导入必需的模块，可选功能用到时再导入
+from mitmproxy import ctx
+import asyncio
+import collections
 import json
 import os
+import re
+import time
 import datetime
+from capture_stream import StreamClient
+from capture_store import SegmentWriter, check_codec
+from blob_store import canonical_bytes, content_hash
+from domain_filter import DomainMatcher, parse_rules
 
+# 启动时的域名过滤规则，运行中可通过allowed_domains选项或数据通道更新
 ALLOWED_DOMAINS = os.environ.get('ALLOWED_DOMAINS', '')
-ALLOWED_DOMAINS = [d.strip() for d in ALLOWED_DOMAINS.split(',') if d.strip()]
 
-def response(flow: http.HTTPFlow):
-    try:
-        # 域名过滤
-        if ALLOWED_DOMAINS and flow.request.host not in ALLOWED_DOMAINS:
+# 实时推送数据的回环端口，由ProxyListener设置；为空则只写文件
+STREAM_PORT = int(os.environ.get('CAPTURE_STREAM_PORT', '0') or 0)
+
+# 写入配置：累计多少条或间隔多少毫秒批量写入一次；目录为空则不写文件
+CAPTURE_DIR = os.environ.get('CAPTURE_DIR', 'captures')
+# 分段滚动阈值：单个分段的大小（MB）和时长（秒）
+SEGMENT_MB = int(os.environ.get('CAPTURE_SEGMENT_MB', '64'))
+SEGMENT_SECONDS = int(os.environ.get('CAPTURE_SEGMENT_SECONDS', '3600'))
+# 分段存储格式：plain/gzip/zstd，压缩格式每帧包含的记录数
+CODEC = os.environ.get('CAPTURE_CODEC', 'plain') or 'plain'
+FRAME_RECORDS = int(os.environ.get('CAPTURE_FRAME_RECORDS', '256'))
+# 可选的SQLite数据库路径，设置后同时写入带索引的数据库
+CAPTURE_SQLITE = os.environ.get('CAPTURE_SQLITE', '')
+# 响应体去重：相同内容在每个分段中只完整保存一次，之后的记录只保存哈希和第一次出现的位置。
+# 响应体大多不重复时去重只增加哈希的开销，默认关闭
+DEDUP = os.environ.get('CAPTURE_DEDUP', '0') == '1'
+# 去重时记住最近推送过的响应体哈希数，推送过的内容之后只推送哈希
+STREAM_KNOWN_BODIES = 65536
+# 推送时总是带上完整响应体（接收方不保存已推送的响应体时使用，例如命令行的--stdout）
+STREAM_BODIES = os.environ.get('CAPTURE_STREAM_BODIES', '') == '1'
+FLUSH_INTERVAL_MS = int(os.environ.get('CAPTURE_FLUSH_MS', '200'))
+FLUSH_RECORDS = int(os.environ.get('CAPTURE_FLUSH_RECORDS', '100'))
+FSYNC = os.environ.get('CAPTURE_FSYNC', '') == '1'
+
+# 预分类配置：超过该大小的响应体直接跳过（字节），0表示不限制
+MAX_BODY_BYTES = int(os.environ.get('CAPTURE_MAX_BODY_BYTES', str(10 * 1024 * 1024)))
+# 这些Content-Type前缀一定不是JSON，不解码直接跳过（逗号分隔，可覆盖）
+SKIP_CONTENT_TYPES = tuple(t.strip().lower() for t in os.environ.get(
+    'CAPTURE_SKIP_TYPES',
+    'image/,video/,audio/,font/,text/css,application/javascript,text/javascript,'
+    'application/x-javascript,application/octet-stream,application/wasm,'
+    'application/pdf,application/zip,application/x-protobuf,application/grpc'
+).split(',') if t.strip())
+# JSON解析后端：auto（有orjson则用orjson）、json、orjson；
+# orjson解析失败或响应体中有超过64位的整数时改用标准库，结果与标准库一致
+JSON_BACKEND = os.environ.get('CAPTURE_JSON_BACKEND', 'auto')
+
+_LEADING_WS = re.compile(rb'(?:\xef\xbb\xbf)?[ \t\r\n]*')
+_JSON_START = (ord('{'), ord('['))
+_UTF8_CHARSETS = ('', 'utf-8', 'utf8')
+# 19位及以上的数字可能超过64位整数的范围（也可能在字符串中，这时只是多一次标准库解析）
+_LONG_DIGITS = re.compile(rb'[0-9]{19}')
+
+
+def _load_json_backend(name):
+    """选择JSON解析函数，返回(名称, loads)"""
+    if name in ('auto', 'orjson'):
+        try:
+            import orjson
+            return 'orjson', _with_json_fallback(orjson.loads)
+        except ImportError:
+            if name == 'orjson':
+                print("未安装orjson，改用标准库json")
+    return 'json', json.loads
+
+
+def _with_json_fallback(loads):
+    """orjson不接受NaN/Infinity，部分版本把超过64位的整数解析为浮点数，这两种情况改用标准库解析"""
+    def parse(content):
+        if _LONG_DIGITS.search(content) is None:
+            try:
+                return loads(content)
+            except Exception:
+                pass
+        return json.loads(content)
+    return parse
+
+
+JSON_BACKEND, _json_loads = _load_json_backend(JSON_BACKEND)
+
+
+class CaptureWriter:
+    """把抓到的数据实时推送给界面，同时批量写入文件持久化
+
+    数据先放入内存队列，再按条数或时间阈值批量写入当前分段文件，
+    分段文件句柄保持常开，超过大小或时长后自动滚动。
+    """
+
+    def __init__(self, capture_dir=CAPTURE_DIR, flush_interval_ms=FLUSH_INTERVAL_MS,
+                 flush_records=FLUSH_RECORDS, fsync=FSYNC, stream_port=STREAM_PORT,
+                 sqlite_path=CAPTURE_SQLITE, dedup=DEDUP, stream_bodies=STREAM_BODIES):
+        self.capture_dir = capture_dir
+        if capture_dir:
+            # 存储格式不可用时插件加载失败，mitmdump启动即退出
+            check_codec(CODEC)
+        self.dedup = dedup
+        self.stream_bodies = stream_bodies
+        # 已推送给界面的响应体哈希（LRU），界面按哈希在内存中取回
+        self._streamed = collections.OrderedDict()
+        self.sqlite_path = sqlite_path
+        self._sqlite = None
+        self._sqlite_pending = []
+        self.stream_port = stream_port
+        self.stream = None
+        self._loop = None
+        self.flush_interval = max(flush_interval_ms, 0) / 1000.0
+        self.flush_records = max(flush_records, 1)
+        self.fsync = fsync
+        self._store = None
+        # 交给分段写入器的记录数，推送时附带，界面据此计算已推送的记录在文件中的位置
+        self._seq = 0
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._flush_task = None
+        # 按原因统计跳过的响应
+        self.skipped = collections.Counter()
+        self.domain_filter = DomainMatcher.from_text(ALLOWED_DOMAINS)
+        self._report_invalid_rules()
+
+    def _report_invalid_rules(self):
+        for rule, error in self.domain_filter.invalid:
+            print(f"域名规则无效，已忽略: {rule}（{error}）")
+
+    def _open(self):
+        if self._store is None:
+            self._store = SegmentWriter(self.capture_dir, max_bytes=SEGMENT_MB * 1024 * 1024,
+                                        max_seconds=SEGMENT_SECONDS, fsync=self.fsync,
+                                        codec=CODEC, frame_records=FRAME_RECORDS)
+        return self._store
+
+    def write(self, item, ts=None):
+        """推送给界面并加入写入队列，达到条数阈值或时间阈值时批量写入"""
+        full_item = item
+        stream_item = item
+        body = None
+        if self.dedup and 'response_data' in item:
+            item = dict(item)
+            data = item.pop('response_data')
+            raw = canonical_bytes(data)
+            digest = content_hash(raw)
+            item['response_hash'] = digest
+            body = (digest, raw)
+            if self.stream_bodies or self._remember_streamed(digest):
+                stream_item = dict(item, response_data=data)
+            else:
+                stream_item = item
+        if self.capture_dir:
+            self._seq += 1
+        if self.stream is not None:
+            self.stream.send(stream_item, self._seq if self.capture_dir else None)
+        if not self.capture_dir and not self.sqlite_path:
             return
-        text = flow.response.text
+        if self.capture_dir:
+            line = (json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8')
+            # 响应体由分段写入器决定完整写入还是只记录第一次出现的位置
+            self._pending.append((line, ts, item.get('host'), body))
+        if self.sqlite_path:
+            self._sqlite_pending.append((full_item, ts))
+        if (max(len(self._pending), len(self._sqlite_pending)) >= self.flush_records
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def _remember_streamed(self, digest):
+        """记录已推送的哈希，第一次推送（需要带上完整响应体）时返回True"""
+        streamed = self._streamed
+        if digest in streamed:
+            streamed.move_to_end(digest)
+            return False
+        streamed[digest] = None
+        if len(streamed) > STREAM_KNOWN_BODIES:
+            streamed.popitem(last=False)
+        return True
+
+    def flush(self):
+        """把队列中的数据一次性写入分段文件和数据库"""
+        self._last_flush = time.monotonic()
+        if self._pending:
+            records, self._pending = self._pending, []
+            store = self._open()
+            store.write_batch(records)
+            self._send_written(store)
+        if self._sqlite_pending:
+            items, self._sqlite_pending = self._sqlite_pending, []
+            if self._sqlite is None:
+                from sqlite_store import SqliteCaptureStore
+                self._sqlite = SqliteCaptureStore(self.sqlite_path)
+            self._sqlite.insert_batch(items)
+
+    def _send_written(self, store):
+        """通知界面已写入文件的记录到了哪里"""
+        if self.stream is None:
+            return
+        position, buffered = store.written_position()
+        if position is not None:
+            self.stream.send_message({"type": "written", "source": self.capture_dir, "segment": position[0],
+                                      "records": position[1], "seq": self._seq - buffered})
+
+    def rotate(self):
+        """写完队列后切换到新分段（清除数据时调用）"""
+        # 界面清除数据时也清除了内存中的响应体，之后重新推送完整内容
+        self._streamed.clear()
+        self.flush()
+        if self._store is not None:
+            self._store.rotate()
+
+    def close(self):
+        self.flush()
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+        if self._sqlite is not None:
+            self._sqlite.close()
+            self._sqlite = None
+
+    async def _flush_periodically(self):
+        # 流量停顿时也按时间阈值把队列写出去
+        while True:
+            await asyncio.sleep(self.flush_interval or 0.05)
+            try:
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    self.flush()
+                if self._store is not None:
+                    # 压缩格式下把超时未满的帧写出，界面才能读到
+                    self._store.poll()
+            except Exception as e:
+                print(f"写入抓包数据时出错: {e}")
+
+    def _connect_stream(self):
+        if not self.stream_port:
+            return
+        try:
+            self.stream = StreamClient(self.stream_port, on_message=self._on_control, source=self.capture_dir)
+            self.stream.connect()
+        except OSError as e:
+            self.stream = None
+            print(f"连接数据通道失败，仅写入文件: {e}")
+
+    def _on_control(self, message):
+        # 在通道接收线程中调用，转交给事件循环处理
+        if self._loop is None:
+            return
+        if message.get('type') == 'shutdown':
+            self._loop.call_soon_threadsafe(ctx.master.shutdown)
+        elif message.get('type') == 'rotate':
+            self._loop.call_soon_threadsafe(self.rotate)
+        elif message.get('type') == 'set_domains':
+            text = ','.join(message.get('domains') or [])
+            self._loop.call_soon_threadsafe(ctx.options.update, allowed_domains=text)
+
+    def load(self, loader):
+        loader.add_option(
+            name="allowed_domains",
+            typespec=str,
+            default=ALLOWED_DOMAINS,
+            help="只抓取这些域名（逗号分隔，支持*.example.com、.example.com和re:正则）",
+        )
+
+    def configure(self, updated):
+        if "allowed_domains" in updated:
+            self.domain_filter.update(parse_rules(ctx.options.allowed_domains))
+            self._report_invalid_rules()
+
+    def running(self):
+        self._loop = asyncio.get_event_loop()
+        if self.stream is None:
+            self._connect_stream()
+        if (self.capture_dir or self.sqlite_path) and self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_periodically())
+
+    def classify(self, flow):
+        """在解码响应体之前做快速预分类，返回跳过原因，可以解析时返回None"""
+        resp = flow.response
+        if resp is None or not resp.raw_content:
+            return 'empty'
+        if MAX_BODY_BYTES and len(resp.raw_content) > MAX_BODY_BYTES:
+            return 'too_large'
+        content_type = resp.headers.get('content-type', '').lower()
+        if content_type.startswith(SKIP_CONTENT_TYPES):
+            return 'content_type'
+        return None
+
+    def parse_body(self, flow):
+        """解码响应体并解析JSON，返回(跳过原因, 数据)"""
+        resp = flow.response
         try:
-            data = json.loads(text)
+            content = resp.get_content(strict=False)
         except Exception:
-            return  # 不是合法JSON，跳过
+            return 'decode_error', None
+        if not content:
+            return 'empty', None
+        if MAX_BODY_BYTES and len(content) > MAX_BODY_BYTES:
+            return 'too_large', None
+        # 首个非空白字节必须是{或[，否则不可能是JSON对象/数组
+        start = _LEADING_WS.match(content).end()
+        if start >= len(content) or content[start] not in _JSON_START:
+            return 'not_json', None
+        charset = ''
+        content_type = resp.headers.get('content-type', '')
+        if 'charset=' in content_type.lower():
+            charset = content_type.lower().split('charset=', 1)[1].split(';', 1)[0].strip(' "\'')
+        try:
+            if charset in _UTF8_CHARSETS:
+                return None, _json_loads(content[start:] if start else content)
+            # 非UTF-8编码（如GBK）按响应声明的编码解码为文本
+            return None, json.loads(resp.get_text(strict=False))
+        except Exception:
+            return 'invalid_json', None
+
+    @staticmethod
+    def timing(flow):
+        """请求/响应的时间点（秒，epoch）和字节数，以及总耗时和首字节耗时（毫秒）"""
+        req, resp = flow.request, flow.response
+        metrics = {
+            "timestamp_start": req.timestamp_start,
+            "request_end": req.timestamp_end,
+            "response_start": resp.timestamp_start,
+            "response_end": resp.timestamp_end,
+            "request_bytes": len(req.raw_content or b''),
+            "response_bytes": len(resp.raw_content or b''),
+            "duration_ms": None,
+            "ttfb_ms": None,
+        }
+        if req.timestamp_start and resp.timestamp_end:
+            metrics["duration_ms"] = round((resp.timestamp_end - req.timestamp_start) * 1000, 1)
+        if req.timestamp_start and resp.timestamp_start:
+            metrics["ttfb_ms"] = round((resp.timestamp_start - req.timestamp_start) * 1000, 1)
+        return metrics
+
+    def build_item(self, flow):
+        """把一条流量转换为记录，返回(跳过原因, 记录)；导入mitmdump -w保存的流量文件时也使用"""
+        reason = self.classify(flow)
+        if reason is None:
+            reason, data = self.parse_body(flow)
+        if reason is not None:
+            return reason, None
         # 格式化时间戳为年月日时分秒
         ts = flow.response.timestamp_end
         if ts:
@@ -31,7 +355,40 @@ def response(flow: http.HTTPFlow):
             "response_data": data,
             "timestamp": dt_str
         }
-        with open('captured_data.json', 'a', encoding='utf-8') as f:
-            f.write(json.dumps(captured_item, ensure_ascii=False) + '\n')
-    except Exception as e:
-        print(f"处理响应时出错: {e}") 
\ No newline at end of file
+        captured_item.update(self.timing(flow))
+        return None, captured_item
+
+    def response(self, flow):
+        try:
+            # 域名过滤
+            if not self.domain_filter.match(flow.request.host):
+                self.skipped['domain'] += 1
+                return
+            reason, captured_item = self.build_item(flow)
+            if reason is not None:
+                self.skipped[reason] += 1
+                return
+            self.write(captured_item, flow.response.timestamp_end)
+        except Exception as e:
+            print(f"处理响应时出错: {e}")
+
+    def done(self):
+        if self.skipped:
+            summary = ', '.join(f"{reason}={count}" for reason, count in self.skipped.most_common())
+            print(f"跳过的响应统计（JSON解析：{JSON_BACKEND}）: {summary}")
+        # mitmdump退出前把队列中剩余的数据全部写入
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        try:
+            self.close()
+        except Exception as e:
+            print(f"关闭抓包文件时出错: {e}")
+        if self.stream is not None:
+            if self.stream.dropped:
+                print(f"数据通道队列已满，丢弃 {self.stream.dropped} 条数据（文件中仍有保存）")
+            self.stream.close()
+            self.stream = None
+
+
+addons = [CaptureWriter()]
@@ -0,0 +1,190 @@
+"""mitmdump输出的读取和解析
+
+mitmdump的stdout/stderr必须持续读取，否则管道缓冲区写满后代理会阻塞。
+每个输出流由一个后台线程逐行读取，解析为结构化事件放入有界环形缓冲区，
+并按秒统计各类事件的速率，供日志面板和命令行显示。
+"""
+import collections
+import re
+import threading
+import time
+
+# 事件类型
+CLIENT_CONNECT = 'client_connect'
+CLIENT_DISCONNECT = 'client_disconnect'
+SERVER_CONNECT = 'server_connect'
+SERVER_DISCONNECT = 'server_disconnect'
+REQUEST = 'request'
+RESPONSE = 'response'
+TLS_ERROR = 'tls_error'
+ERROR = 'error'
+WARNING = 'warning'
+INFO = 'info'
+# 管理进程自己的健康检查连接，不计入客户端连接
+PROBE = 'probe'
+
+# mitmproxy日志行前缀：[12:34:56.789][127.0.0.1:54321] ...
+_PREFIX_RE = re.compile(r'^(?:\[[\d:.]+\])?(?:\[(?P<client>[^\]]+)\])?\s*')
+_FLOW_RE = re.compile(r'^(?P<client>\S+:\d+): (?P<method>[A-Z]+) (?P<url>\S+)')
+_RESPONSE_RE = re.compile(r'^<< (?:HTTP/\S+ )?(?P<status>\d{3})\b')
+_ERROR_RE = re.compile(r'error|exception|traceback|出错|失败', re.IGNORECASE)
+_WARNING_RE = re.compile(r'^warn(?:ing)?\b|丢弃', re.IGNORECASE)
+
+
+class LogEvent:
+    """一行输出解析得到的事件"""
+    __slots__ = ('seq', 'ts', 'stream', 'kind', 'message', 'fields')
+
+    def __init__(self, seq, ts, stream, kind, message, fields=None):
+        self.seq = seq
+        self.ts = ts
+        self.stream = stream
+        self.kind = kind
+        self.message = message
+        self.fields = fields or {}
+
+    @property
+    def is_error(self):
+        return self.kind in (ERROR, TLS_ERROR)
+
+    def format(self):
+        clock = time.strftime('%H:%M:%S', time.localtime(self.ts))
+        return f"{clock} [{self.kind}] {self.message}"
+
+
+def parse_line(line):
+    """把一行输出解析为(事件类型, 字段)"""
+    text = line.strip()
+    match = _PREFIX_RE.match(text)
+    client = match.group('client')
+    body = text[match.end():]
+    fields = {'client': client} if client else {}
+
+    if body == 'client connect':
+        return CLIENT_CONNECT, fields
+    if body == 'client disconnect':
+        return CLIENT_DISCONNECT, fields
+    if body.startswith('server connect'):
+        fields['server'] = body[len('server connect'):].strip().split(' ', 1)[0]
+        return SERVER_CONNECT, fields
+    if body.startswith('server disconnect'):
+        fields['server'] = body[len('server disconnect'):].strip().split(' ', 1)[0]
+        return SERVER_DISCONNECT, fields
+    flow = _FLOW_RE.match(body)
+    if flow:
+        return REQUEST, flow.groupdict()
+    response = _RESPONSE_RE.match(body)
+    if response:
+        fields['status'] = int(response.group('status'))
+        return RESPONSE, fields
+    if 'TLS handshake failed' in body:
+        return TLS_ERROR, fields
+    if _WARNING_RE.search(body):
+        return WARNING, fields
+    if _ERROR_RE.search(body):
+        return ERROR, fields
+    return INFO, fields
+
+
+class ProcessLog:
+    """子进程输出的有界缓冲区和事件速率统计，可以被多个读取线程同时写入"""
+
+    def __init__(self, capacity=2000, rate_window=10):
+        self.capacity = capacity
+        self.rate_window = rate_window
+        self.on_event = None
+        self._events = collections.deque(maxlen=capacity)
+        self._totals = collections.Counter()
+        # 每秒一个计数器，用于计算最近rate_window秒的速率
+        self._buckets = collections.deque()
+        self._seq = 0
+        # 健康检查连接的本地地址（与日志中的客户端地址格式相同），按加入顺序保留最近的若干个
+        self._probes = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._totals.clear()
+            self._buckets.clear()
+
+    def add_probe(self, address, limit=256):
+        """登记一个健康检查连接的本地地址(host, port)，该地址的连接和断开事件记为PROBE"""
+        host, port = address[:2]
+        client = f"[{host}]:{port}" if ':' in host else f"{host}:{port}"
+        with self._lock:
+            self._probes[client] = None
+            while len(self._probes) > limit:
+                self._probes.popitem(last=False)
+
+    def append(self, line, stream='stdout'):
+        """解析一行输出并记录"""
+        if not line.strip():
+            return None
+        kind, fields = parse_line(line)
+        now = time.time()
+        with self._lock:
+            if kind in (CLIENT_CONNECT, CLIENT_DISCONNECT) and fields.get('client') in self._probes:
+                if kind == CLIENT_DISCONNECT:
+                    del self._probes[fields['client']]
+                kind = PROBE
+            self._seq += 1
+            event = LogEvent(self._seq, now, stream, kind, line.rstrip(), fields)
+            self._events.append(event)
+            self._totals[kind] += 1
+            second = int(now)
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append((second, collections.Counter()))
+                while self._buckets and self._buckets[0][0] <= second - self.rate_window:
+                    self._buckets.popleft()
+            self._buckets[-1][1][kind] += 1
+        if self.on_event is not None:
+            self.on_event(event)
+        return event
+
+    def events_since(self, seq):
+        """返回序号大于seq的事件"""
+        with self._lock:
+            return [e for e in self._events if e.seq > seq]
+
+    def tail(self, count=20, stream=None):
+        with self._lock:
+            events = [e for e in self._events if stream is None or e.stream == stream]
+        return events[-count:]
+
+    def totals(self):
+        with self._lock:
+            return dict(self._totals)
+
+    def rates(self):
+        """最近rate_window秒内各类事件的每秒速率"""
+        cutoff = int(time.time()) - self.rate_window
+        counts = collections.Counter()
+        with self._lock:
+            for second, counter in self._buckets:
+                if second > cutoff:
+                    counts.update(counter)
+        return {kind: n / self.rate_window for kind, n in counts.items()}
+
+    def attach(self, process):
+        """为子进程的stdout/stderr各启动一个读取线程，返回线程列表"""
+        threads = []
+        for stream, pipe in (('stdout', process.stdout), ('stderr', process.stderr)):
+            if pipe is None:
+                continue
+            thread = threading.Thread(target=self._drain, args=(pipe, stream), daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _drain(self, pipe, stream):
+        try:
+            for raw in iter(pipe.readline, b''):
+                self.append(raw.decode('utf-8', errors='replace'), stream)
+        except (OSError, ValueError):
+            pass
+        finally:
+            try:
+                pipe.close()
+            except OSError:
+                pass
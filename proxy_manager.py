@@ -0,0 +1,493 @@
+# 不依赖PyQt的代理进程管理，界面和命令行模式共用
+import json
+import os
+import socket
+import subprocess
+import shutil
+import sys
+import threading
+import time
+from capture_store import check_codec, worker_directory
+from capture_stream import OrderedMerger, StreamServer
+from process_log import ProcessLog
+
+# mitmdump路径和版本的缓存文件，避免每次启动都运行--version
+MITMDUMP_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.api_sniffer_mitmdump.json')
+
+
+class ProxyWorker:
+    """一个mitmdump工作进程"""
+
+    def __init__(self, index, port):
+        self.index = index
+        self.port = port
+        self.process = None
+        self.log_threads = []
+        self.health_failures = 0
+        self.restarts = 0
+        self.restart_times = []
+        # 短时间内崩溃次数过多，不再重启
+        self.failed = False
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def state(self):
+        if self.alive:
+            return '运行中'
+        return '已放弃' if self.failed else '已退出'
+
+
+class ProxyManager:
+    """管理mitmdump子进程和插件数据通道
+
+    on_records(list)在数据通道线程中被调用，每次一批记录；
+    on_state(bool)在数据通道连接或断开时调用。
+    """
+    # 已确认可用的mitmdump：路径 -> {fingerprint, version}，所有实例共用
+    _resolved = None
+
+    def __init__(self, port=8080, on_records=None, on_state=None, **kwargs):
+        # 支持与QObject协作的多继承，多余的参数交给下一个基类
+        super().__init__(**kwargs)
+        self.port = port
+        self.on_records = on_records
+        self.on_state = on_state
+        self.captured_data = []
+        self.is_running = False
+        self.allowed_domains = []  # 允许的域名列表
+        # 代理监听地址
+        self.listen_host = '0.0.0.0'
+        # 抓包数据批量写入的阈值（毫秒/条数），越小越及时，越大开销越低
+        self.flush_interval_ms = 200
+        self.flush_records = 100
+        # 分段存储目录，设为空字符串则只通过数据通道实时推送，不写文件
+        self.capture_dir = 'captures'
+        # 分段滚动阈值
+        self.segment_mb = 64
+        self.segment_seconds = 3600
+        # 分段存储格式：plain/gzip/zstd（zstd需要安装zstandard）
+        self.capture_codec = 'plain'
+        # 可选的SQLite数据库路径，设置后插件同时写入带索引的数据库
+        self.sqlite_path = ''
+        # 响应体按内容去重保存（相同响应体很多时才能节省空间，默认关闭）
+        self.dedup_bodies = False
+        # 推送的记录总是带完整响应体；接收方不按哈希缓存响应体时（如命令行输出）需要打开
+        self.stream_full_bodies = False
+        # 不输出mitmdump的逐条请求日志
+        self.quiet = False
+        # 是否加载抓包插件（压测时关闭，用于对比插件带来的开销），以及附加的mitmdump参数
+        self.load_addon = True
+        self.extra_args = []
+        # 等待代理端口可连接的最长时间（秒）
+        self.ready_timeout = 10.0
+        self.mitmdump_version = ''
+        # 最近一次启动耗时（毫秒）
+        self.last_start_ms = None
+        # start_proxy_async的结果回调
+        self.on_ready = None
+        self.on_failed = None
+        # stop_proxy_async完成后的回调
+        self.on_stopped = None
+        # 工作进程数：mitmdump和插件都是单核运行，多个进程分别监听从port开始的连续端口
+        self.worker_count = 1
+        self.workers = []
+        # 健康检查间隔（秒），以及restart_window秒内最多重启max_restarts次
+        self.health_interval = 2.0
+        self.max_restarts = 5
+        self.restart_window = 60
+        self._mitmdump_exe = None
+        self._supervisor = None
+        self._stop_event = threading.Event()
+        self._merger = None
+        # mitmdump输出由后台线程持续读取，解析后保存在有界缓冲区中
+        self.process_log = ProcessLog()
+        # 插件通过本地回环端口实时推送数据
+        self.stream_server = StreamServer(self._dispatch_records, self._dispatch_state)
+
+    def _dispatch_records(self, items):
+        merger = self._merger
+        if merger is not None:
+            merger.add(items)
+        else:
+            self._emit_records(items)
+
+    def _emit_records(self, items):
+        if self.on_records is not None:
+            self.on_records(items)
+
+    def _dispatch_state(self, connected):
+        if self.on_state is not None:
+            self.on_state(connected)
+
+    @staticmethod
+    def base_path():
+        """程序所在目录，被PyInstaller打包时为解包目录"""
+        if getattr(sys, 'frozen', False):
+            return sys._MEIPASS if hasattr(sys, '_MEIPASS') else os.path.dirname(sys.executable)
+        return os.path.dirname(os.path.abspath(__file__))
+
+    def script_path(self):
+        """插件脚本路径，不依赖当前工作目录"""
+        path = os.path.join(self.base_path(), 'mitm_writer.py')
+        return path if os.path.exists(path) else 'mitm_writer.py'
+
+    @staticmethod
+    def _fingerprint(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_mtime, stat.st_size]
+
+    @staticmethod
+    def _load_cache():
+        try:
+            with open(MITMDUMP_CACHE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _save_cache(cache):
+        try:
+            with open(MITMDUMP_CACHE_FILE, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+    def resolve_mitmdump(self):
+        """返回(mitmdump路径, 版本信息)
+
+        优先本地目录的mitmdump.exe，其次PATH中的mitmdump。结果按可执行文件的
+        修改时间和大小缓存（进程内和磁盘），文件不变时不再运行--version。
+        """
+        local_path = os.path.join(self.base_path(), 'mitmdump.exe')
+        candidates = [local_path] if os.path.exists(local_path) else []
+        system_path = shutil.which('mitmdump')
+        if system_path:
+            candidates.append(system_path)
+
+        cache = ProxyManager._resolved
+        if cache is None:
+            cache = ProxyManager._resolved = self._load_cache()
+        for path in candidates:
+            fingerprint = self._fingerprint(path)
+            entry = cache.get(path)
+            if entry and fingerprint and entry.get('fingerprint') == fingerprint:
+                return path, entry.get('version', '')
+            # 首次使用或文件有变化，运行一次--version确认可用
+            try:
+                result = subprocess.run([path, '--version'], capture_output=True, text=True, timeout=5)
+            except subprocess.TimeoutExpired:
+                raise Exception("mitmdump响应超时，可能版本不兼容")
+            except OSError:
+                continue
+            if result.returncode != 0:
+                continue
+            version = (result.stdout.strip().splitlines() or [''])[0]
+            cache[path] = {'fingerprint': fingerprint, 'version': version}
+            self._save_cache(cache)
+            return path, version
+        raise Exception("未找到mitmdump程序，请先安装mitmproxy: pip install mitmproxy")
+
+    def get_mitmdump_path(self):
+        """获取mitmdump可执行文件路径，优先本地版本"""
+        return self.resolve_mitmdump()[0]
+
+    def worker_ports(self):
+        """各工作进程的监听端口：从port开始连续分配"""
+        return [self.port + i for i in range(max(self.worker_count, 1))]
+
+    def build_env(self, worker):
+        """插件通过环境变量读取配置"""
+        env = os.environ.copy()
+        capture_dir = self.capture_dir or ''
+        env['ALLOWED_DOMAINS'] = ','.join(self.allowed_domains)
+        env['CAPTURE_FLUSH_MS'] = str(self.flush_interval_ms)
+        env['CAPTURE_FLUSH_RECORDS'] = str(self.flush_records)
+        # 多个进程不能写同一个分段目录，每个工作进程写自己的子目录
+        if capture_dir and len(self.workers) > 1:
+            env['CAPTURE_DIR'] = worker_directory(capture_dir, worker.index)
+        else:
+            env['CAPTURE_DIR'] = capture_dir
+        env['CAPTURE_SEGMENT_MB'] = str(self.segment_mb)
+        env['CAPTURE_SEGMENT_SECONDS'] = str(self.segment_seconds)
+        env['CAPTURE_CODEC'] = self.capture_codec
+        env['CAPTURE_SQLITE'] = self.sqlite_path or ''
+        env['CAPTURE_DEDUP'] = '1' if self.dedup_bodies else '0'
+        env['CAPTURE_STREAM_BODIES'] = '1' if self.stream_full_bodies else ''
+        env['CAPTURE_STREAM_PORT'] = str(self.stream_server.start())
+        return env
+
+    def build_command(self, mitmdump_exe, port):
+        cmd = [
+            mitmdump_exe,
+            "--listen-port", str(port),
+            "--listen-host", self.listen_host,
+        ]
+        if self.load_addon:
+            cmd += ["--scripts", self.script_path()]
+        if self.quiet:
+            cmd.append("--quiet")
+        return cmd + list(self.extra_args)
+
+    def _probe_host(self):
+        return '127.0.0.1' if self.listen_host in ('0.0.0.0', '', '::') else self.listen_host
+
+    def _port_accepts(self, port, timeout=0.2):
+        """端口是否可以连接；连接前先绑定本地端口并登记，mitmdump日志中的这次连接不计入客户端连接"""
+        try:
+            family, sock_type, proto, _, address = socket.getaddrinfo(
+                self._probe_host(), port, type=socket.SOCK_STREAM)[0]
+            with socket.socket(family, sock_type, proto) as sock:
+                sock.settimeout(timeout)
+                sock.bind((address[0], 0))
+                self.process_log.add_probe(sock.getsockname())
+                sock.connect(address)
+            return True
+        except OSError:
+            return False
+
+    def _spawn(self, worker):
+        worker.process = subprocess.Popen(
+            self.build_command(self._mitmdump_exe, worker.port), env=self.build_env(worker),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            # 终端的Ctrl+C只发给管理进程，由它通知各工作进程正常退出，避免被当作崩溃重启
+            start_new_session=os.name != 'nt')
+        # 持续读取输出，避免管道写满后mitmdump阻塞
+        worker.log_threads = self.process_log.attach(worker.process)
+        worker.health_failures = 0
+
+    def wait_until_ready(self, worker, timeout=10.0):
+        """轮询直到工作进程的端口可以连接；进程提前退出或超时时抛出异常"""
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while True:
+            if worker.process.poll() is not None:
+                # 进程已经退出，等读取线程读完剩余输出后取最后几行错误信息
+                for thread in worker.log_threads:
+                    thread.join(timeout=1)
+                lines = [e.message for e in self.process_log.tail(10)]
+                error_msg = '\n'.join(lines) if lines else "未知错误"
+                raise Exception(f"mitmdump启动失败: {error_msg}")
+            if self._port_accepts(worker.port):
+                return
+            if time.monotonic() >= deadline:
+                raise Exception(f"mitmdump在{timeout:.0f}秒内没有开始监听端口 {worker.port}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def start_proxy(self):
+        """启动所有工作进程，全部端口可以连接后返回"""
+        if self.is_running:
+            return
+
+        # 先停止可能存在的旧进程
+        self.stop_proxy()
+
+        started = time.monotonic()
+        try:
+            self.is_running = True
+            self.stream_server.reset_positions()
+            if self.capture_dir:
+                # 压缩模块缺失时在启动前报错，而不是等到插件写入时丢弃数据
+                check_codec(self.capture_codec)
+            self._mitmdump_exe, self.mitmdump_version = self.resolve_mitmdump()
+            self.workers = [ProxyWorker(i + 1, port) for i, port in enumerate(self.worker_ports())]
+
+            # 检查端口是否被占用
+            for worker in self.workers:
+                if self._port_accepts(worker.port):
+                    raise Exception(f"端口 {worker.port} 已被占用，请选择其他端口或停止占用该端口的程序")
+
+            if len(self.workers) > 1:
+                # 多个进程的数据按完成时间合并为一个有序的数据流
+                self._merger = OrderedMerger(self._emit_records, delay=self.flush_interval_ms / 1000.0 + 0.1)
+            for worker in self.workers:
+                self._spawn(worker)
+            for worker in self.workers:
+                self.wait_until_ready(worker, self.ready_timeout)
+            self.last_start_ms = (time.monotonic() - started) * 1000
+
+            self._stop_event.clear()
+            self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+            self._supervisor.start()
+
+        except Exception as e:
+            self.is_running = False
+            for worker in self.workers:
+                if worker.alive:
+                    worker.process.kill()
+                    worker.process.wait()
+            self.workers = []
+            self._close_merger()
+            print(f"启动代理服务器失败: {e}")
+            raise
+
+    def start_proxy_async(self):
+        """在后台线程中启动代理，完成后调用on_ready()或on_failed(错误信息)"""
+        def run():
+            try:
+                self.start_proxy()
+            except Exception as e:
+                if self.on_failed is not None:
+                    self.on_failed(str(e))
+                return
+            if self.on_ready is not None:
+                self.on_ready()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def _supervise(self):
+        """健康检查：进程退出或端口连续无法连接时重启，短时间内崩溃过多则放弃该进程"""
+        while not self._stop_event.wait(self.health_interval):
+            for worker in self.workers:
+                if not self.is_running:
+                    return
+                if worker.failed:
+                    continue
+                if worker.alive:
+                    if self._port_accepts(worker.port, timeout=1.0):
+                        worker.health_failures = 0
+                        continue
+                    worker.health_failures += 1
+                    if worker.health_failures < 3:
+                        continue
+                    print(f"工作进程 {worker.index}（端口 {worker.port}）无响应，重新启动")
+                    worker.process.kill()
+                    worker.process.wait()
+                else:
+                    print(f"工作进程 {worker.index}（端口 {worker.port}）已退出，退出码 {worker.process.returncode}")
+                self._restart(worker)
+
+    def _restart(self, worker):
+        if not self.is_running:
+            return
+        now = time.monotonic()
+        worker.restart_times = [t for t in worker.restart_times if now - t < self.restart_window]
+        if len(worker.restart_times) >= self.max_restarts:
+            worker.failed = True
+            print(f"工作进程 {worker.index} 在{self.restart_window}秒内重启{self.max_restarts}次，不再重启")
+            return
+        worker.restart_times.append(now)
+        worker.restarts += 1
+        try:
+            self._spawn(worker)
+            self.wait_until_ready(worker, self.ready_timeout)
+        except Exception as e:
+            print(f"重启工作进程 {worker.index} 失败: {e}")
+
+    def stop_proxy(self):
+        """停止代理服务器"""
+        self.is_running = False
+        self._stop_event.set()
+        if self._supervisor is not None:
+            self._supervisor.join(timeout=self.ready_timeout + 2)
+            self._supervisor = None
+        # 终止mitmdump进程
+        try:
+            workers = [w for w in self.workers if w.process is not None]
+            if any(w.alive for w in workers) and self.stream_server.send({"type": "shutdown"}):
+                # 通过数据通道通知插件正常退出，插件会先写完队列中的数据
+                deadline = time.monotonic() + 3
+                for worker in workers:
+                    try:
+                        worker.process.wait(timeout=max(deadline - time.monotonic(), 0.01))
+                    except subprocess.TimeoutExpired:
+                        pass
+            if os.name == 'nt' and any(w.alive for w in workers):
+                # Windows下terminate会直接结束进程，不会触发插件的done钩子，
+                # 先等待一个写入周期，让插件把队列中的数据写入文件
+                time.sleep(self.flush_interval_ms / 1000.0 + 0.1)
+            for worker in workers:
+                # 其他平台terminate发送SIGTERM，mitmdump会正常退出并调用done钩子
+                worker.process.terminate()
+                try:
+                    worker.process.wait(timeout=3)
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+                    worker.process.wait()
+        except Exception as e:
+            print(f"停止代理服务器失败: {e}")
+        self._close_merger()
+
+        # 额外保险：杀死所有mitmdump进程
+        if os.name == 'nt':
+            try:
+                subprocess.run(['taskkill', '/F', '/IM', 'mitmdump.exe'],
+                               capture_output=True, check=False)
+            except Exception:
+                pass
+
+    def stop_proxy_async(self):
+        """在后台线程中停止代理，等待插件写完数据和进程退出不阻塞调用方，完成后调用on_stopped()"""
+        def run():
+            try:
+                self.stop_proxy()
+            finally:
+                if self.on_stopped is not None:
+                    self.on_stopped()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def _close_merger(self):
+        if self._merger is not None:
+            self._merger.close()
+            self._merger = None
+
+    @property
+    def proxy_process(self):
+        """第一个工作进程（单进程时即mitmdump进程）"""
+        return self.workers[0].process if self.workers else None
+
+    def poll(self):
+        """所有工作进程都已放弃重启时返回最后的退出码，否则返回None"""
+        if not self.workers or not all(w.failed and not w.alive for w in self.workers):
+            return None
+        return self.workers[-1].process.returncode
+
+    def status(self):
+        """各工作进程的状态"""
+        return [{'index': w.index, 'port': w.port, 'pid': w.process.pid if w.process else None,
+                 'state': w.state, 'restarts': w.restarts} for w in self.workers]
+
+    def status_summary(self):
+        """汇总状态，如：2/2个进程运行中，端口8080-8081，重启1次"""
+        if not self.workers:
+            return ''
+        alive = sum(1 for w in self.workers if w.alive)
+        ports = self.worker_ports()
+        port_text = str(ports[0]) if len(ports) == 1 else f'{ports[0]}-{ports[-1]}'
+        text = f"{alive}/{len(self.workers)}个进程运行中，端口{port_text}"
+        restarts = sum(w.restarts for w in self.workers)
+        if restarts:
+            text += f"，重启{restarts}次"
+        return text
+
+    def get_captured_data(self):
+        """获取所有捕获的数据"""
+        return self.captured_data
+
+    def clear_data(self):
+        """清除所有捕获的数据，代理运行中时通知插件切换到新分段"""
+        self.captured_data = []
+        if self.is_running:
+            self.stream_server.send({"type": "rotate"})
+
+    def save_to_file(self, file_path):
+        """将捕获的数据保存到文件"""
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.captured_data, f, ensure_ascii=False, indent=2)
+
+    def set_domain_filter(self, domains):
+        """设置允许的域名列表，代理运行中时通过数据通道实时生效"""
+        self.allowed_domains = domains
+        if self.is_running:
+            self.stream_server.send({"type": "set_domains", "domains": list(domains)})
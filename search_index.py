@@ -0,0 +1,331 @@
+"""抓包记录的增量倒排索引
+
+索引的内容：url的域名、路径和查询参数分词，方法、状态码，以及response_data中所有字符串/数字叶子的分词。
+每个词同时以不带字段和带字段（field:词）两种形式保存，字段为叶子所在的键名，
+url部分的字段为host、path、method、status。
+
+查询语法，多个条件用空格分隔，全部满足才匹配：
+  ORD20240501        任意位置出现该词
+  ord2024*           以该前缀开头的词
+  order_id:12345     response_data中键为order_id的值包含该词
+  host:api.example   字段值中的多个词都需要出现
+倒排表为按行号递增的数组，新记录只追加到末尾；前缀查询在排好序的词表上二分查找。
+"""
+import array
+import bisect
+import collections
+import json
+import os
+import re
+import sys
+import zlib
+
+FORMAT_VERSION = 1
+# 保存在会话目录中的索引文件名
+INDEX_FILE = 'search.idx'
+
+# 词的最大长度，更长的词（如token）按该长度切成多个词，查询时按同样方式切分
+MAX_TOKEN_CHARS = 64
+# 单个字符串叶子只对开头这么多字符分词
+MAX_VALUE_CHARS = 1024
+# 单条记录最多保存的词数，避免个别巨大响应体撑大索引
+MAX_TERMS_PER_RECORD = 4096
+# 前缀查询最多展开的词数
+MAX_PREFIX_TERMS = 50000
+# 每隔这么多行记录一次校验和，加载的索引按段校验，校验通过的部分即可查询
+CHECKPOINT_ROWS = 4096
+
+_TOKEN_RE = re.compile(r'\w{1,%d}' % MAX_TOKEN_CHARS)
+
+
+def tokenize(text):
+    """小写分词，返回词列表"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _walk_leaves(value, key, out):
+    """收集(键名, 文本)叶子，列表中的元素使用列表所在的键名"""
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _walk_leaves(v, str(k).lower(), out)
+    elif isinstance(value, list):
+        for v in value:
+            _walk_leaves(v, key, out)
+    elif isinstance(value, str):
+        if value:
+            out.append((key, value[:MAX_VALUE_CHARS]))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out.append((key, str(value)))
+
+
+def body_terms(data):
+    """response_data中的词（含带字段的形式）"""
+    leaves = []
+    _walk_leaves(data, '', leaves)
+    terms = set()
+    for key, text in leaves:
+        tokens = tokenize(text)
+        terms.update(tokens)
+        if key:
+            key += ':'
+            terms.update([key + token for token in tokens])
+        if len(terms) >= MAX_TERMS_PER_RECORD:
+            break
+    return terms
+
+
+def field_terms(field, value):
+    """一个字段值中的词，含不带字段和带字段两种形式"""
+    if value is None or value == '':
+        return set()
+    tokens = tokenize(str(value))
+    terms = set(tokens)
+    terms.update([f'{field}:{token}' for token in tokens])
+    return terms
+
+
+def _new_postings():
+    return array.array('I')
+
+
+def _row_key(item):
+    return f"{item.get('url')}\x00{item.get('response_end')}".encode('utf-8', errors='replace')
+
+
+class SearchIndex:
+    """词 -> 行号数组的倒排索引，按行号顺序增量添加记录"""
+
+    def __init__(self, body_cache_size=4096):
+        self._postings = collections.defaultdict(_new_postings)
+        self._sorted_terms = None
+        # 已索引的行数，也是下一条记录的行号
+        self.row_count = 0
+        # 已索引记录的url和完成时间的校验和，用于确认保存的索引与会话数据一致
+        self.checksum = 0
+        self.checkpoints = []
+        # 去重后的相同响应体只分词一次
+        self.body_cache_size = body_cache_size
+        self._body_cache = collections.OrderedDict()
+        # 域名、方法和状态码的组合不多，缓存其分词结果
+        self._url_cache = {}
+        # 从文件加载的索引在重新读入会话数据时逐行校验：已校验的行数和校验和
+        self.pending = False
+        self._verified_rows = 0
+        self._verify_checksum = 0
+
+    def __len__(self):
+        return len(self._postings)
+
+    def clear(self):
+        self._postings = collections.defaultdict(_new_postings)
+        self._sorted_terms = None
+        self.row_count = 0
+        self.checksum = 0
+        self.checkpoints = []
+        self._body_cache.clear()
+        self._url_cache = {}
+        self.pending = False
+        self._verified_rows = 0
+        self._verify_checksum = 0
+
+    @property
+    def verified_rows(self):
+        """可以查询的行数：加载的索引只有校验通过的部分可信"""
+        return self._verified_rows if self.pending else self.row_count
+
+    def _url_terms(self, item):
+        """域名、路径（含查询参数）、方法和状态码中的词"""
+        key = (item.get('host'), item.get('method'), item.get('status_code'))
+        terms = self._url_cache.get(key)
+        if terms is None:
+            terms = field_terms('host', key[0])
+            terms.update(field_terms('method', key[1]))
+            terms.update(field_terms('status', key[2]))
+            terms = frozenset(terms)
+            if len(self._url_cache) < 10000:
+                self._url_cache[key] = terms
+        result = field_terms('path', item.get('path'))
+        result.update(terms)
+        return result
+
+    def _body_terms(self, item):
+        digest = item.get('response_hash')
+        if digest is None:
+            return body_terms(item.get('response_data'))
+        terms = self._body_cache.get(digest)
+        if terms is None:
+            terms = frozenset(body_terms(item.get('response_data')))
+            self._body_cache[digest] = terms
+            if len(self._body_cache) > self.body_cache_size:
+                self._body_cache.popitem(last=False)
+        else:
+            self._body_cache.move_to_end(digest)
+        return terms
+
+    def add_items(self, items, first_row):
+        """索引从first_row开始的连续记录，与DataProcessor的行号一致
+
+        从文件加载的索引已经包含的行只计算校验和并按段校验，之后的行继续增量索引；
+        校验失败说明会话数据已变化，返回False，调用方需要用全部数据重建索引。
+        """
+        row = first_row
+        skip = 0
+        if self.pending:
+            skip = max(min(self.row_count - row, len(items)), 0)
+            checksum = self._verify_checksum
+            for item in items[:skip]:
+                checksum = zlib.crc32(_row_key(item), checksum)
+                row += 1
+                if row % CHECKPOINT_ROWS == 0 or row == self.row_count:
+                    expected = (self.checksum if row == self.row_count
+                                else self.checkpoints[row // CHECKPOINT_ROWS - 1])
+                    if checksum != expected:
+                        self.clear()
+                        return False
+                    self._verified_rows = row
+            self._verify_checksum = checksum
+            if row < self.row_count:
+                return True
+            self.pending = False
+        if row != self.row_count:
+            # 行号不连续（例如中途才开始建立索引），无法增量添加
+            return False
+        postings = self._postings
+        term_count = len(postings)
+        checksum = self.checksum
+        for item in items[skip:]:
+            terms = self._url_terms(item)
+            terms.update(self._body_terms(item))
+            for term in terms:
+                postings[term].append(row)
+            checksum = zlib.crc32(_row_key(item), checksum)
+            row += 1
+            if row % CHECKPOINT_ROWS == 0:
+                self.checkpoints.append(checksum)
+        self.row_count = row
+        self.checksum = checksum
+        if len(postings) != term_count:
+            self._sorted_terms = None
+        return True
+
+    def rebuild(self, rows):
+        """用全部记录重建索引"""
+        self.clear()
+        return self.add_items(list(rows), 0)
+
+    # ------------------------------------------------------------ 查询
+
+    def terms_with_prefix(self, prefix, limit=MAX_PREFIX_TERMS):
+        """以prefix开头的词，在排好序的词表上二分查找"""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        terms = self._sorted_terms
+        start = bisect.bisect_left(terms, prefix)
+        result = []
+        for term in terms[start:start + limit]:
+            if not term.startswith(prefix):
+                break
+            result.append(term)
+        return result
+
+    def _term_rows(self, term, prefix, start):
+        """单个条件匹配的行号（已排序），start之前的行不返回"""
+        if prefix:
+            arrays = [self._postings[t] for t in self.terms_with_prefix(term)]
+        else:
+            rows = self._postings.get(term)
+            arrays = [rows] if rows is not None else []
+        if not arrays:
+            return []
+        if len(arrays) == 1:
+            rows = arrays[0]
+            return rows[bisect.bisect_left(rows, start):] if start else rows
+        merged = set()
+        for rows in arrays:
+            merged.update(rows[bisect.bisect_left(rows, start):] if start else rows)
+        return sorted(merged)
+
+    @staticmethod
+    def parse_query(query):
+        """把查询文本解析为(词, 是否前缀)条件列表"""
+        clauses = []
+        for part in query.split():
+            field, sep, value = part.partition(':')
+            if not sep or not field:
+                field, value = '', part
+            prefix = value.endswith('*')
+            tokens = tokenize(value.rstrip('*'))
+            for i, token in enumerate(tokens):
+                term = f'{field.lower()}:{token}' if field else token
+                clauses.append((term, prefix and i == len(tokens) - 1))
+        return clauses
+
+    def search(self, query, start=0, limit=None):
+        """返回匹配查询的行号列表（递增），查询为空时返回None表示不过滤"""
+        clauses = self.parse_query(query)
+        if not clauses:
+            return None
+        results = sorted((self._term_rows(term, prefix, start) for term, prefix in clauses), key=len)
+        if not results[0]:
+            return []
+        if len(results) == 1:
+            rows = list(results[0])
+        else:
+            matched = set(results[0])
+            for other in results[1:]:
+                matched.intersection_update(other)
+                if not matched:
+                    return []
+            rows = sorted(matched)
+        return rows[:limit] if limit is not None else rows
+
+    # ------------------------------------------------------------ 持久化
+
+    def save(self, path):
+        """保存到文件：第一行为JSON头（词表和各倒排表长度），之后依次是各倒排表的二进制内容"""
+        terms = list(self._postings)
+        header = {
+            'version': FORMAT_VERSION,
+            'byteorder': sys.byteorder,
+            'itemsize': array.array('I').itemsize,
+            'rows': self.row_count,
+            'checksum': self.checksum,
+            'checkpoints': self.checkpoints,
+            'terms': terms,
+            'counts': [len(self._postings[t]) for t in terms],
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+            for term in terms:
+                self._postings[term].tofile(f)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """从文件加载，之后重新读入会话数据时逐行校验；文件不存在或格式不符时返回False
+
+        加载后需要按原来的顺序重新添加同样的记录，add_items只计算校验和，不再分词。
+        """
+        self.clear()
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                if (header.get('version') != FORMAT_VERSION
+                        or header.get('itemsize') != array.array('I').itemsize):
+                    return False
+                postings = {}
+                for term, count in zip(header['terms'], header['counts']):
+                    rows = array.array('I')
+                    rows.fromfile(f, count)
+                    postings[term] = rows
+        except (OSError, ValueError, KeyError, EOFError):
+            return False
+        if header.get('byteorder') != sys.byteorder:
+            for rows in postings.values():
+                rows.byteswap()
+        self._postings.update(postings)
+        self.row_count = header['rows']
+        self.checksum = header['checksum']
+        self.checkpoints = header['checkpoints']
+        self.pending = self.row_count > 0
+        return True
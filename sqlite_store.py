@@ -0,0 +1,183 @@
+"""可选的SQLite抓包存储
+
+插件批量写入（WAL模式，读写互不阻塞），host、path、method、status_code
+和时间戳建立索引，response_data以JSON文本保存，各阶段时间点、字节数和耗时保存在独立的列中。
+DataProcessor通过query/count/group_by把过滤条件下推到索引上执行。
+"""
+import json
+import sqlite3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY,
+    url TEXT,
+    method TEXT,
+    host TEXT,
+    path TEXT,
+    status_code INTEGER,
+    ts REAL,
+    timestamp TEXT,
+    response_data TEXT,
+    timestamp_start REAL,
+    request_end REAL,
+    response_start REAL,
+    response_end REAL,
+    request_bytes INTEGER,
+    response_bytes INTEGER,
+    duration_ms REAL,
+    ttfb_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_captures_host ON captures(host, ts);
+CREATE INDEX IF NOT EXISTS idx_captures_path ON captures(path);
+CREATE INDEX IF NOT EXISTS idx_captures_method ON captures(method);
+CREATE INDEX IF NOT EXISTS idx_captures_status ON captures(status_code);
+CREATE INDEX IF NOT EXISTS idx_captures_ts ON captures(ts);
+'''
+
+# 请求各阶段的时间点、字节数和耗时，与mitm_writer记录中的字段相同
+METRIC_COLUMNS = {
+    'timestamp_start': 'REAL',
+    'request_end': 'REAL',
+    'response_start': 'REAL',
+    'response_end': 'REAL',
+    'request_bytes': 'INTEGER',
+    'response_bytes': 'INTEGER',
+    'duration_ms': 'REAL',
+    'ttfb_ms': 'REAL',
+}
+
+# 允许用于过滤、排序和分组的列
+COLUMNS = ('id', 'url', 'method', 'host', 'path', 'status_code', 'ts', 'timestamp') + tuple(METRIC_COLUMNS)
+RECORD_COLUMNS = ('url', 'method', 'host', 'path', 'status_code', 'timestamp', 'response_data') + tuple(METRIC_COLUMNS)
+INSERT_COLUMNS = ('url', 'method', 'host', 'path', 'status_code', 'ts', 'timestamp', 'response_data') + tuple(METRIC_COLUMNS)
+
+_OPERATORS = {
+    '=': '=', '==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>=',
+    'like': 'LIKE',
+}
+
+
+def build_where(filters):
+    """把过滤条件转换为WHERE子句和参数
+
+    filters为字典：列名 -> 值，或列名 -> (操作符, 值)，也可以是(列名, 条件)的列表（同一列有多个条件时）。
+    操作符支持 = != < <= > >= like in prefix；prefix转换为范围条件以便使用索引。
+    """
+    clauses = []
+    params = []
+    if isinstance(filters, dict):
+        filters = filters.items()
+    for column, condition in filters or ():
+        if column not in COLUMNS:
+            raise ValueError(f"不支持的过滤列: {column}")
+        if isinstance(condition, tuple):
+            op, value = condition
+        else:
+            op, value = '=', condition
+        op = op.lower()
+        if op == 'in':
+            values = list(value)
+            if not values:
+                clauses.append('0')
+                continue
+            clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        elif op == 'prefix':
+            clauses.append(f"{column} >= ? AND {column} < ?")
+            params.extend([value, value + '\uffff'])
+        elif op in _OPERATORS:
+            if value is None and op in ('=', '=='):
+                clauses.append(f"{column} IS NULL")
+                continue
+            clauses.append(f"{column} {_OPERATORS[op]} ?")
+            params.append(value)
+        else:
+            raise ValueError(f"不支持的操作符: {op}")
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+    return where, params
+
+
+class SqliteCaptureStore:
+    """SQLite抓包存储，写入方和读取方可以是不同进程"""
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        if readonly:
+            self.conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(SCHEMA)
+            self._add_missing_columns()
+        self.conn.execute('PRAGMA busy_timeout=3000')
+        # 旧版本创建的只读数据库可能没有指标列，查询时这些字段为None
+        existing = self._existing_columns()
+        self.record_columns = [c for c in RECORD_COLUMNS if c in existing]
+
+    def _existing_columns(self):
+        return {row[1] for row in self.conn.execute('PRAGMA table_info(captures)')}
+
+    def _add_missing_columns(self):
+        """旧版本创建的数据库补上之后新增的列"""
+        existing = self._existing_columns()
+        with self.conn:
+            for column, column_type in METRIC_COLUMNS.items():
+                if column not in existing:
+                    self.conn.execute(f'ALTER TABLE captures ADD COLUMN {column} {column_type}')
+
+    def insert_batch(self, items):
+        """批量写入记录，items为(记录字典, 数值时间戳)的列表"""
+        rows = [(
+            item.get('url'), item.get('method'), item.get('host'), item.get('path'),
+            item.get('status_code'), ts, item.get('timestamp'),
+            json.dumps(item.get('response_data'), ensure_ascii=False),
+        ) + tuple(item.get(column) for column in METRIC_COLUMNS) for item, ts in items]
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO captures ({', '.join(INSERT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(INSERT_COLUMNS))})", rows)
+
+    def query(self, filters=None, limit=None, offset=0, order_by='id', descending=False):
+        """按条件分页查询，返回记录字典列表"""
+        if order_by not in COLUMNS:
+            raise ValueError(f"不支持的排序列: {order_by}")
+        where, params = build_where(filters)
+        sql = f"SELECT {', '.join(self.record_columns)} FROM captures{where} ORDER BY {order_by}"
+        if descending:
+            sql += ' DESC'
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params = params + [limit, offset]
+        elif offset:
+            # SQLite的OFFSET必须跟在LIMIT之后，-1表示不限制条数
+            sql += ' LIMIT -1 OFFSET ?'
+            params = params + [offset]
+        items = []
+        for row in self.conn.execute(sql, params):
+            item = dict.fromkeys(RECORD_COLUMNS)
+            item.update(zip(self.record_columns, row))
+            try:
+                item['response_data'] = json.loads(item['response_data'])
+            except (TypeError, ValueError):
+                pass
+            items.append(item)
+        return items
+
+    def count(self, filters=None):
+        where, params = build_where(filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM captures{where}", params).fetchone()[0]
+
+    def group_by(self, column, filters=None, limit=None):
+        """按列分组计数，返回[(值, 数量), ...]，数量从多到少"""
+        if column not in COLUMNS:
+            raise ValueError(f"不支持的分组列: {column}")
+        where, params = build_where(filters)
+        sql = f"SELECT {column}, COUNT(*) AS n FROM captures{where} GROUP BY {column} ORDER BY n DESC"
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params = params + [limit]
+        return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        self.conn.close()
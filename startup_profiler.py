@@ -0,0 +1,127 @@
+"""启动耗时分析
+
+在子进程中用 python -X importtime 导入指定模块，汇总各模块的导入耗时：
+  python startup_profiler.py                   分析界面(ui)和命令行(cli)的导入耗时
+  python startup_profiler.py mitm_writer --top 20
+  python startup_profiler.py ui --budget-ms 800   超出预算时返回非零退出码，可放进构建脚本
+还会检查启动时不应加载的重量级依赖（pandas、pyarrow等），它们应当在第一次使用时再导入。
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+
+# 启动阶段不应导入的模块，出现即视为回归
+# orjson不在其中：它是很小的C扩展，插件加载时就选定JSON解析后端，避免第一条响应时才导入
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'openpyxl', 'zstandard')
+
+DEFAULT_TARGETS = ('ui', 'cli')
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$')
+
+
+class ImportTiming:
+    """单个模块的导入耗时（微秒）"""
+    __slots__ = ('name', 'self_us', 'cumulative_us', 'depth')
+
+    def __init__(self, name, self_us, cumulative_us, depth):
+        self.name = name
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.depth = depth
+
+    @property
+    def package(self):
+        return self.name.split('.', 1)[0]
+
+
+def parse_importtime(text):
+    """解析 -X importtime 的输出"""
+    timings = []
+    for line in text.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            # 每级嵌套缩进两个空格，顶层模块前有一个空格
+            timings.append(ImportTiming(name, int(self_us), int(cumulative_us), max(len(indent) - 1, 0) // 2))
+    return timings
+
+
+def profile_imports(target, python=None):
+    """在新进程中导入target模块并返回各模块的导入耗时"""
+    result = subprocess.run([python or sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+                            capture_output=True, text=True)
+    timings = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(f"导入 {target} 失败: {errors[-1] if errors else result.returncode}")
+    return timings
+
+
+def summarize(target, timings, top=15):
+    """汇总：总耗时、累计耗时最长的模块、按顶层包合计的自身耗时、重量级依赖"""
+    total = sum(t.self_us for t in timings)
+    by_package = {}
+    for t in timings:
+        by_package[t.package] = by_package.get(t.package, 0) + t.self_us
+    loaded = {t.package for t in timings}
+    return {
+        'target': target,
+        'total_ms': round(total / 1000, 1),
+        'modules': len(timings),
+        'slowest': [{'module': t.name, 'cumulative_ms': round(t.cumulative_us / 1000, 1),
+                     'self_ms': round(t.self_us / 1000, 1)}
+                    for t in sorted(timings, key=lambda t: t.cumulative_us, reverse=True)[:top]],
+        'packages': [{'package': name, 'self_ms': round(us / 1000, 1)}
+                     for name, us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]],
+        'heavy_modules': [name for name in HEAVY_MODULES if name in loaded],
+    }
+
+
+def format_summary(summary):
+    lines = [f"== {summary['target']}: {summary['total_ms']} ms, {summary['modules']} 个模块"]
+    lines.append("累计耗时最长的模块:")
+    for row in summary['slowest']:
+        lines.append(f"  {row['cumulative_ms']:>8.1f} ms  (自身 {row['self_ms']:.1f})  {row['module']}")
+    lines.append("按顶层包合计:")
+    for row in summary['packages']:
+        lines.append(f"  {row['self_ms']:>8.1f} ms  {row['package']}")
+    if summary['heavy_modules']:
+        lines.append(f"警告: 启动时加载了重量级依赖 {', '.join(summary['heavy_modules'])}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析模块导入耗时")
+    parser.add_argument('targets', nargs='*', default=list(DEFAULT_TARGETS), help="要分析的模块")
+    parser.add_argument('--top', type=int, default=15, help="列出的模块数量")
+    parser.add_argument('--budget-ms', type=float, default=0, help="导入耗时预算，超出时返回非零退出码")
+    parser.add_argument('--json', action='store_true', help="以JSON格式输出")
+    args = parser.parse_args(argv)
+
+    summaries = []
+    failed = False
+    for target in args.targets:
+        try:
+            summary = summarize(target, profile_imports(target), args.top)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            failed = True
+            continue
+        summary['over_budget'] = bool(args.budget_ms) and summary['total_ms'] > args.budget_ms
+        failed = failed or summary['over_budget'] or bool(summary['heavy_modules'])
+        summaries.append(summary)
+
+    if args.json:
+        print(json.dumps(summaries, ensure_ascii=False, indent=2))
+    else:
+        for summary in summaries:
+            print(format_summary(summary))
+            if summary['over_budget']:
+                print(f"超出预算: {summary['total_ms']} ms > {args.budget_ms} ms")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+
+class CaptureTableModel(QAbstractTableModel):
+    """直接基于DataProcessor列缓冲区的表格模型
+
+    视图只会请求可见单元格的数据，新增行通过rowsInserted通知，
+    不再每次重建整张表格。设置搜索条件后只显示匹配的行，新增数据只搜索新增的部分。
+    """
+
+    def __init__(self, processor, parent=None):
+        super().__init__(parent)
+        self.processor = processor
+        self._rows = 0
+        self._columns = []
+        self._generation = processor.generation
+        # 搜索条件和匹配的行号，没有条件时为None
+        self._query = ''
+        self._matches = None
+        self._searched = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._rows
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        column = self._columns[index.column()]
+        value = self.processor.get_value(self.source_row(index.row()), column)
+        if value is None:
+            return ''
+        if column == 'response_hash':
+            return f"{value[:12]}（出现{self.processor.seen_count(value)}次）"
+        return str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            if 0 <= section < len(self._columns):
+                return self._columns[section]
+            return None
+        return str(self.source_row(section) + 1)
+
+    def column_name(self, column):
+        """获取列名"""
+        return self._columns[column]
+
+    def source_row(self, row):
+        """表格中的行对应的数据行号"""
+        return self._matches[row] if self._matches is not None else row
+
+    @property
+    def query(self):
+        return self._query
+
+    def set_query(self, query):
+        """设置搜索条件，返回匹配的行数；条件为空时显示全部数据"""
+        self.beginResetModel()
+        self._query = query.strip()
+        self._matches = None
+        self._searched = 0
+        self._generation = self.processor.generation
+        self._columns = self.processor.columns
+        self._rows = self._search_new()
+        self.endResetModel()
+        return self._rows
+
+    def _search_new(self):
+        """搜索上次之后新增的数据，返回当前应显示的行数"""
+        processor = self.processor
+        if not self._query:
+            return processor.row_count
+        rows = processor.search(self._query, start=self._searched)
+        if rows is None:
+            # 条件中没有可以搜索的词
+            self._matches = None
+            return processor.row_count
+        if self._matches is None:
+            self._matches = []
+        self._matches.extend(rows)
+        self._searched = processor.searchable_rows
+        return len(self._matches)
+
+    def refresh(self):
+        """与处理器同步，返回是否有新增列"""
+        processor = self.processor
+        if processor.generation != self._generation:
+            # 数据被清空或整体重新加载
+            self.set_query(self._query)
+            return True
+
+        columns_added = False
+        columns = processor.columns
+        if len(columns) > len(self._columns):
+            first = len(self._columns)
+            self.beginInsertColumns(QModelIndex(), first, len(columns) - 1)
+            self._columns = columns
+            self.endInsertColumns()
+            columns_added = True
+
+        row_count = self._search_new()
+        if row_count > self._rows:
+            self.beginInsertRows(QModelIndex(), self._rows, row_count - 1)
+            self._rows = row_count
+            self.endInsertRows()
+        return columns_added
+
+
+class EndpointTableModel(QAbstractTableModel):
+    """接口汇总表格模型，数据来自DataProcessor的接口索引"""
+
+    HEADERS = ["方法", "域名", "接口模板", "次数", "状态码分布", "最后出现",
+               "耗时P50(ms)", "耗时P95(ms)", "耗时P99(ms)", "大小P95(B)"]
+
+    def __init__(self, processor, parent=None):
+        super().__init__(parent)
+        self.processor = processor
+        self._rows = []
+        # 当前排序：(列, 是否降序)，默认按次数降序
+        self._sort = (3, True)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        stats = self._rows[index.row()]
+        column = index.column()
+        if column == 0:
+            return stats.method
+        if column == 1:
+            return stats.host
+        if column == 2:
+            return stats.template
+        if column == 3:
+            return str(stats.count)
+        if column == 4:
+            return stats.status_summary()
+        if column == 5:
+            return stats.last_seen
+        if column == 9:
+            return _format_number(stats.metrics.size.quantile(0.95))
+        return _format_number(stats.metrics.latency.quantile((0.5, 0.95, 0.99)[column - 6]))
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return str(section + 1)
+
+    def _sort_key(self, column):
+        if column == 3:
+            return lambda s: s.count
+        if 6 <= column <= 8:
+            q = (0.5, 0.95, 0.99)[column - 6]
+            return lambda s: s.metrics.latency.quantile(q) or 0.0
+        if column == 9:
+            return lambda s: s.metrics.size.quantile(0.95) or 0.0
+        return lambda s: (s.method, s.host, s.template, '', s.status_summary(), s.last_seen)[column]
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort = (column, order == Qt.DescendingOrder)
+        self.layoutAboutToBeChanged.emit()
+        self._rows.sort(key=self._sort_key(column), reverse=self._sort[1])
+        self.layoutChanged.emit()
+
+    def refresh(self):
+        """重新获取接口汇总并按当前列排序，接口数量远小于记录数，直接整体刷新"""
+        self.beginResetModel()
+        column, descending = self._sort
+        self._rows = self.processor.endpoints.top()
+        self._rows.sort(key=self._sort_key(column), reverse=descending)
+        self.endResetModel()
+
+
+def _format_number(value):
+    if value is None:
+        return ''
+    return f'{value:.1f}' if value < 100 else f'{value:.0f}'
+
+
+class HostTableModel(QAbstractTableModel):
+    """域名汇总表格模型：每个域名的请求次数、耗时和响应大小分位数"""
+
+    HEADERS = ["域名", "次数", "耗时P50(ms)", "耗时P95(ms)", "耗时P99(ms)", "大小P50(B)", "大小P95(B)"]
+
+    def __init__(self, processor, parent=None):
+        super().__init__(parent)
+        self.processor = processor
+        self._rows = []
+        # 当前排序：(列, 是否降序)，默认按耗时P95降序
+        self._sort = (3, True)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        host, metrics = self._rows[index.row()]
+        column = index.column()
+        if column == 0:
+            return host
+        if column == 1:
+            return str(metrics.count)
+        return _format_number(self._value(metrics, column))
+
+    @staticmethod
+    def _value(metrics, column):
+        if column <= 4:
+            return metrics.latency.quantile((0.5, 0.95, 0.99)[column - 2])
+        return metrics.size.quantile((0.5, 0.95)[column - 5])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return str(section + 1)
+
+    def _sort_key(self, column):
+        if column == 0:
+            return lambda hm: hm[0]
+        if column == 1:
+            return lambda hm: hm[1].count
+        return lambda hm: self._value(hm[1], column) or 0.0
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort = (column, order == Qt.DescendingOrder)
+        self.layoutAboutToBeChanged.emit()
+        self._rows.sort(key=self._sort_key(column), reverse=self._sort[1])
+        self.layoutChanged.emit()
+
+    def refresh(self):
+        """重新获取域名汇总并按当前列排序"""
+        self.beginResetModel()
+        column, descending = self._sort
+        self._rows = self.processor.host_metrics.hosts()
+        self._rows.sort(key=self._sort_key(column), reverse=descending)
+        self.endResetModel()
@@ -1,12 +1,17 @@
-from PyQt5 import QtCore, QtGui, QtWidgets
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
-import pandas as pd
 import os
-import json
-import time
+from PyQt5 import QtWidgets
+from PyQt5.QtWidgets import QApplication, QFileDialog, QHeaderView, QMainWindow, QMenu, QMessageBox
+from PyQt5.QtCore import Qt, QTimer
 from data_processor import DataProcessor
 from proxy_listener import ProxyListener
+from capture_store import CaptureSession, SessionTailer
+from table_model import CaptureTableModel, EndpointTableModel, HostTableModel
+from export_worker import ExportWorker
+from importers import StreamImporter
+from json_paths import parse_paths
+from search_index import INDEX_FILE
+from domain_filter import invalid_rules
+from process_log import CLIENT_CONNECT, ERROR, REQUEST, TLS_ERROR
 
 class ApiSnifferUI(QMainWindow):
     def __init__(self):
@@ -14,9 +19,22 @@ class ApiSnifferUI(QMainWindow):
         self.processor = DataProcessor()
         self.proxy_listener = ProxyListener(port=8080)
         self.proxy_listener.new_data_signal.connect(self.on_new_data)
+        self.proxy_listener.stream_state_signal.connect(self.on_stream_state_changed)
+        self.proxy_listener.ready_signal.connect(self.on_proxy_ready)
+        self.proxy_listener.failed_signal.connect(self.on_proxy_failed)
+        self.proxy_listener.stopped_signal.connect(self.on_proxy_stopped)
         self.setupUi()
-        # 新增：定时器自动读取抓包数据
-        self.last_loaded_count = 0
+        # 新增：定时器自动读取抓包数据（按分段索引增量读取）
+        # 数据通道连接后改为实时推送，定时器只在通道断开时读取文件
+        self.capture_store = CaptureSession(self.proxy_listener.capture_dir)
+        self.capture_tailer = SessionTailer(self.capture_store)
+        # 表格数据来自该会话时才保存搜索索引，导入其他文件后为None
+        self.search_index_path = None
+        self.load_search_index()
+        # 启动代理时文件的末尾位置，以及数据通道连接后历史数据读完之前缓存的推送数据
+        self.history_mark = None
+        self.loading_history = False
+        self.stream_backlog = []
         self.auto_load_timer = QTimer(self)
         self.auto_load_timer.timeout.connect(self.auto_load_captured_data)
         self.auto_load_timer.start(2000)  # 每2秒自动读取一次
@@ -51,12 +69,30 @@ class ApiSnifferUI(QMainWindow):
         self.stopButton.setEnabled(False)
         self.topButtonLayout.addWidget(self.stopButton)
         
+        # 工作进程数：多个mitmdump进程分别监听从8080开始的连续端口
+        self.workerLabel = QtWidgets.QLabel("进程数：")
+        self.workerSpin = QtWidgets.QSpinBox()
+        self.workerSpin.setRange(1, max(os.cpu_count() or 1, 1))
+        self.workerSpin.setValue(self.proxy_listener.worker_count)
+        self.topButtonLayout.addWidget(self.workerLabel)
+        self.topButtonLayout.addWidget(self.workerSpin)
         
-        # 添加导出Excel按钮
-        self.exportButton = QtWidgets.QPushButton("导出Excel")
+        
+        # 添加导出按钮（Excel/Parquet）
+        self.exportButton = QtWidgets.QPushButton("导出数据")
         self.exportButton.clicked.connect(self.export_to_excel)
         self.topButtonLayout.addWidget(self.exportButton)
         
+        # 添加导入按钮
+        self.importButton = QtWidgets.QPushButton("导入数据")
+        self.importButton.clicked.connect(self.import_data)
+        self.topButtonLayout.addWidget(self.importButton)
+        
+        # 添加打开会话按钮
+        self.openSessionButton = QtWidgets.QPushButton("打开会话")
+        self.openSessionButton.clicked.connect(self.open_session)
+        self.topButtonLayout.addWidget(self.openSessionButton)
+        
         # 添加清除数据按钮
         self.clearButton = QtWidgets.QPushButton("清除数据")
         self.clearButton.clicked.connect(self.clear_data)
@@ -66,72 +102,184 @@ class ApiSnifferUI(QMainWindow):
         self.domainFilterLayout = QtWidgets.QHBoxLayout()
         self.domainFilterLabel = QtWidgets.QLabel("只监听域名（逗号分隔）：")
         self.domainFilterEdit = QtWidgets.QLineEdit()
-        self.domainFilterEdit.setPlaceholderText("如: example.com,api.test.com")
-        self.domainFilterEdit.textChanged.connect(self.on_domain_filter_changed)
+        self.domainFilterEdit.setPlaceholderText("如: example.com,*.test.com,re:^api\\d+\\.（运行中修改立即生效）")
+        # 输入停顿后再生效，避免把输入到一半的规则（如re:api(）发给插件
+        self.domainFilterTimer = QTimer(self)
+        self.domainFilterTimer.setSingleShot(True)
+        self.domainFilterTimer.timeout.connect(self.on_domain_filter_changed)
+        self.domainFilterEdit.textChanged.connect(lambda _: self.domainFilterTimer.start(500))
         self.domainFilterLayout.addWidget(self.domainFilterLabel)
         self.domainFilterLayout.addWidget(self.domainFilterEdit)
         self.mainLayout.addLayout(self.domainFilterLayout)
         
-        # 创建表格视图
-        self.tableWidget = QtWidgets.QTableWidget(self.centralWidget)
-        self.mainLayout.addWidget(self.tableWidget)
+        # 添加字段投影输入框：选中的JSON路径提取为独立列
+        self.projectionLayout = QtWidgets.QHBoxLayout()
+        self.projectionLabel = QtWidgets.QLabel("提取字段（逗号分隔）：")
+        self.projectionEdit = QtWidgets.QLineEdit()
+        self.projectionEdit.setPlaceholderText("如: data.interval,check_spam_resp.decision（相对response_data）")
+        self.projectionEdit.editingFinished.connect(self.on_projection_changed)
+        self.projectionLayout.addWidget(self.projectionLabel)
+        self.projectionLayout.addWidget(self.projectionEdit)
+        self.mainLayout.addLayout(self.projectionLayout)
+        
+        # 全文搜索输入框：在url和响应内容的倒排索引上查询，表格只显示匹配的行
+        self.searchLayout = QtWidgets.QHBoxLayout()
+        self.searchLabel = QtWidgets.QLabel("搜索：")
+        self.searchEdit = QtWidgets.QLineEdit()
+        self.searchEdit.setPlaceholderText("如: ORD20240501  token前缀*  order_id:12345  host:api.example.com（空格分隔，全部满足）")
+        self.searchEdit.setClearButtonEnabled(True)
+        # 输入停顿后再搜索，避免每输入一个字符都查询一次
+        self.searchTimer = QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.timeout.connect(self.on_search_changed)
+        self.searchEdit.textChanged.connect(lambda _: self.searchTimer.start(300))
+        self.searchLayout.addWidget(self.searchLabel)
+        self.searchLayout.addWidget(self.searchEdit)
+        self.mainLayout.addLayout(self.searchLayout)
+        
+        # 创建表格视图（模型直接读取处理器中的数据，只渲染可见行）
+        self.tableModel = CaptureTableModel(self.processor, self)
+        self.tableView = QtWidgets.QTableView(self.centralWidget)
+        self.tableView.setModel(self.tableModel)
+        self.tableView.setWordWrap(False)
+        # 固定行高，避免视图为计算行高遍历所有行
+        self.tableView.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.tableView.verticalHeader().setDefaultSectionSize(self.fontMetrics().height() + 6)
+        self.tableView.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        
+        # 接口汇总视图：按接口模板统计次数、状态码和最后出现时间
+        self.endpointModel = EndpointTableModel(self.processor, self)
+        self.endpointView = QtWidgets.QTableView(self.centralWidget)
+        self.endpointView.setModel(self.endpointModel)
+        self.endpointView.setWordWrap(False)
+        self.endpointView.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.endpointView.setSortingEnabled(True)
+        self.endpointView.sortByColumn(3, Qt.DescendingOrder)
+        
+        # 域名汇总视图：按域名统计耗时和响应大小的分位数
+        self.hostModel = HostTableModel(self.processor, self)
+        self.hostView = QtWidgets.QTableView(self.centralWidget)
+        self.hostView.setModel(self.hostModel)
+        self.hostView.setWordWrap(False)
+        self.hostView.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.hostView.setSortingEnabled(True)
+        self.hostView.sortByColumn(3, Qt.DescendingOrder)
+        
+        self.tabWidget = QtWidgets.QTabWidget(self.centralWidget)
+        self.tabWidget.addTab(self.tableView, "请求列表")
+        self.tabWidget.addTab(self.endpointView, "接口汇总")
+        self.tabWidget.addTab(self.hostView, "域名汇总")
+        
+        # 运行日志：mitmdump的输出事件和速率统计
+        self.logPanel = QtWidgets.QWidget(self.centralWidget)
+        self.logLayout = QtWidgets.QVBoxLayout(self.logPanel)
+        self.logRateLabel = QtWidgets.QLabel("")
+        self.logView = QtWidgets.QPlainTextEdit(self.logPanel)
+        self.logView.setReadOnly(True)
+        self.logView.setMaximumBlockCount(self.proxy_listener.process_log.capacity)
+        self.logLayout.addWidget(self.logRateLabel)
+        self.logLayout.addWidget(self.logView)
+        self.tabWidget.addTab(self.logPanel, "运行日志")
+        self.logSeq = 0
+        self.logTimer = QTimer(self)
+        self.logTimer.timeout.connect(self.refresh_log)
+        self.logTimer.start(1000)
+        self.tabWidget.currentChanged.connect(self.refresh_endpoints)
+        self.mainLayout.addWidget(self.tabWidget)
         
         # 表格右键菜单
-        self.tableWidget.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.tableWidget.customContextMenuRequested.connect(self.show_table_context_menu)
+        self.tableView.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.tableView.customContextMenuRequested.connect(self.show_table_context_menu)
         
         # 创建状态栏
         self.statusBar = QtWidgets.QStatusBar(self)
         self.setStatusBar(self.statusBar)
         self.statusBar.showMessage("就绪")
+        
+        # 正在进行的流式导入
+        self.importer = None
+        self.import_batches = None
+
+        # 导出进度条和取消按钮，导出时才显示
+        self.exportWorker = None
+        self.exportProgress = QtWidgets.QProgressBar()
+        self.exportProgress.setMaximumWidth(200)
+        self.exportProgress.hide()
+        self.statusBar.addPermanentWidget(self.exportProgress)
+        self.cancelExportButton = QtWidgets.QPushButton("取消导出")
+        self.cancelExportButton.clicked.connect(self.cancel_export)
+        self.cancelExportButton.hide()
+        self.statusBar.addPermanentWidget(self.cancelExportButton)
     
     def update_status_bar(self):
         """刷新状态栏，显示代理状态和数据条数"""
-        data_count = 0
-        if self.processor.data_frame is not None:
-            data_count = len(self.processor.data_frame)
-        self.statusBar.showMessage(f"代理状态：{self.proxy_status} | 已抓取数据：{data_count} 条")
+        data_count = self.processor.row_count
+        workers = self.proxy_listener.status_summary() if self.proxy_listener.is_running else ''
+        status = f"{self.proxy_status}（{workers}）" if workers else self.proxy_status
+        message = f"代理状态：{status} | 已抓取数据：{data_count} 条"
+        if self.tableModel.query:
+            message += f" | 搜索匹配：{self.tableModel.rowCount()} 条"
+        self.statusBar.showMessage(message)
 
     def start_listening(self):
-        """开始监听网络数据"""
-        try:
-            self.proxy_listener.start_proxy()
-            self.startButton.setEnabled(False)
-            self.stopButton.setEnabled(True)
-            self.proxy_status = '运行中'
-            self.update_status_bar()
-            QMessageBox.information(self, "提示", "代理服务器已启动，请在设备上设置代理：\n\n"  
-                                   f"IP地址: 127.0.0.1\n端口: {self.proxy_listener.port}\n\n" 
-                                   "并访问 http://mitm.it/ 安装证书")
-        except Exception as e:
-            self.proxy_status = '异常'
-            self.update_status_bar()
-            QMessageBox.critical(self, "错误", f"启动监听失败: {str(e)}")
-    
+        """开始监听网络数据，代理在后台线程启动，完成后通过信号通知"""
+        # 还在等待生效的域名过滤规则立即应用，启动参数中使用最新的规则
+        if self.domainFilterTimer.isActive():
+            self.domainFilterTimer.stop()
+            self.on_domain_filter_changed()
+        # 记录启动前文件的末尾位置：之前的是历史数据，之后的数据由数据通道实时推送
+        self.history_mark = self.capture_tailer.mark()
+        self.auto_load_captured_data()
+        self.startButton.setEnabled(False)
+        self.workerSpin.setEnabled(False)
+        self.proxy_listener.worker_count = self.workerSpin.value()
+        self.proxy_status = '启动中'
+        self.update_status_bar()
+        self.proxy_listener.start_proxy_async()
+
+    def on_proxy_ready(self):
+        """代理端口已可连接"""
+        self.stopButton.setEnabled(True)
+        self.proxy_status = '运行中'
+        self.update_status_bar()
+        ports = self.proxy_listener.worker_ports()
+        port_text = str(ports[0]) if len(ports) == 1 else f"{ports[0]}-{ports[-1]}（不同设备分别使用不同端口）"
+        QMessageBox.information(self, "提示", "代理服务器已启动，请在设备上设置代理：\n\n"
+                               f"IP地址: 127.0.0.1\n端口: {port_text}\n\n"
+                               "并访问 http://mitm.it/ 安装证书")
+
+    def on_proxy_failed(self, message):
+        """代理启动失败"""
+        self.startButton.setEnabled(True)
+        self.stopButton.setEnabled(False)
+        self.workerSpin.setEnabled(True)
+        self.proxy_status = '异常'
+        self.update_status_bar()
+        QMessageBox.critical(self, "错误", f"启动监听失败: {message}")
+
     def stop_listening(self):
-        """停止监听网络数据"""
-        try:
-            self.proxy_listener.stop_proxy()
-            self.startButton.setEnabled(True)
-            self.stopButton.setEnabled(False)
-            self.proxy_status = '已停止'
-            self.update_status_bar()
-            
-            # 处理捕获的数据
-            captured_data = self.proxy_listener.get_captured_data()
-            if captured_data:
-                self.processor.load_from_captured_data(captured_data)
-                self.update_table()
-        except Exception as e:
-            self.proxy_status = '异常'
-            self.update_status_bar()
-            QMessageBox.critical(self, "错误", f"停止监听失败: {str(e)}")
+        """停止监听网络数据，代理在后台线程停止，完成后通过信号通知"""
+        self.stopButton.setEnabled(False)
+        self.proxy_status = '停止中'
+        self.update_status_bar()
+        self.proxy_listener.stop_proxy_async()
+
+    def on_proxy_stopped(self):
+        """代理进程已全部退出"""
+        self.startButton.setEnabled(True)
+        self.workerSpin.setEnabled(True)
+        self.proxy_status = '已停止'
+        self.update_status_bar()
+        self.save_search_index()
     
-    def on_new_data(self, data_item):
-        """处理新捕获的数据"""
+    def on_new_data(self, data_items):
+        """处理数据通道推送的一批新数据"""
+        if self.loading_history:
+            self.stream_backlog.extend(data_items)
+            return
         try:
             # 添加到处理器
-            self.processor.add_item(data_item)
+            self.processor.add_items(data_items)
             # 更新表格
             self.update_table()
             self.update_status_bar()
@@ -140,103 +288,326 @@ class ApiSnifferUI(QMainWindow):
     
     
     
-    def update_table(self):
-        """更新表格显示数据"""
-        if self.processor.data_frame is None or self.processor.data_frame.empty:
+    def refresh_log(self):
+        """追加新的日志事件并刷新速率统计"""
+        process_log = self.proxy_listener.process_log
+        events = process_log.events_since(self.logSeq)
+        if events:
+            self.logSeq = events[-1].seq
+            self.logView.appendPlainText('\n'.join(e.format() for e in events))
+        totals = process_log.totals()
+        rates = process_log.rates()
+        errors = totals.get(ERROR, 0) + totals.get(TLS_ERROR, 0)
+        self.logRateLabel.setText(
+            f"请求 {rates.get(REQUEST, 0):.1f}/s | "
+            f"连接 {rates.get(CLIENT_CONNECT, 0):.1f}/s | "
+            f"错误 {rates.get(ERROR, 0) + rates.get(TLS_ERROR, 0):.1f}/s"
+            f"（累计 {errors}）")
+        if self.proxy_listener.is_running:
+            # 工作进程可能被重启，定期刷新汇总状态
+            self.update_status_bar()
+
+    def on_stream_state_changed(self, connected):
+        """数据通道连接时只把启动前的历史数据读完，断开后从最后推送到的记录之后继续读取文件"""
+        if connected:
+            self.auto_load_timer.stop()
+            if self.history_mark is None:
+                self.capture_tailer.skip_to_end()
+                return
+            self.capture_tailer.set_limit(self.history_mark)
+            if self.capture_tailer.has_pending():
+                # 历史数据还没读完，推送的数据先缓存，读完后再追加，保持先后顺序
+                self.loading_history = True
+                QTimer.singleShot(0, self.auto_load_captured_data)
+        else:
+            self.finish_history_load()
+            self.capture_tailer.clear_limit()
+            # 断开前已推送但还没写入文件的记录会被跳过，之后写入的记录从文件读取
+            self.capture_tailer.resume(self.proxy_listener.stream_server.resume_points())
+            if not self.auto_load_timer.isActive():
+                self.auto_load_timer.start(2000)
+
+    def finish_history_load(self):
+        """历史数据读完，追加读取期间缓存的推送数据"""
+        if not self.loading_history:
             return
-            
-        df = self.processor.data_frame
-        
-        # 设置表格列数和表头
-        self.tableWidget.setColumnCount(len(df.columns))
-        self.tableWidget.setHorizontalHeaderLabels(df.columns)
-        
-        # 设置表格行数
-        self.tableWidget.setRowCount(len(df))
-        
-        # 填充表格数据
-        for row in range(len(df)):
-            for col, column_name in enumerate(df.columns):
-                item = QtWidgets.QTableWidgetItem(str(df.iloc[row, col]))
-                self.tableWidget.setItem(row, col, item)
-        
-        # 调整列宽以适应内容
-        self.tableWidget.resizeColumnsToContents()
+        self.loading_history = False
+        backlog, self.stream_backlog = self.stream_backlog, []
+        if backlog:
+            self.on_new_data(backlog)
+
+    def update_table(self):
+        """更新表格显示数据，只通知新增的行和列"""
+        columns_added = self.tableModel.refresh()
+        if columns_added:
+            self.resize_columns_sampled()
+        self.refresh_endpoints()
         self.update_status_bar()
+
+    def refresh_endpoints(self, *args):
+        """接口汇总和域名汇总页可见时才刷新"""
+        current = self.tabWidget.currentWidget()
+        for view, model in ((self.endpointView, self.endpointModel), (self.hostView, self.hostModel)):
+            if current is not view:
+                continue
+            first_fill = model.rowCount() == 0
+            model.refresh()
+            if first_fill:
+                view.resizeColumnsToContents()
+
+    def resize_columns_sampled(self, sample_size=50, max_width=400):
+        """根据表头和首尾部分行抽样计算列宽，不遍历全部数据"""
+        row_count = self.tableModel.rowCount()
+        if row_count <= sample_size * 2:
+            rows = range(row_count)
+        else:
+            rows = list(range(sample_size)) + list(range(row_count - sample_size, row_count))
+        metrics = self.tableView.fontMetrics()
+        padding = 16
+        for col in range(self.tableModel.columnCount()):
+            width = metrics.horizontalAdvance(self.tableModel.column_name(col))
+            for row in rows:
+                text = self.tableModel.data(self.tableModel.index(row, col))
+                if text:
+                    width = max(width, metrics.horizontalAdvance(text[:200]))
+                if width >= max_width:
+                    break
+            self.tableView.setColumnWidth(col, min(width + padding, max_width))
     
     def export_to_excel(self):
-        """导出数据到Excel"""
-        if self.processor.data_frame is None or self.processor.data_frame.empty:
+        """导出数据到Excel或Parquet"""
+        if self.processor.row_count == 0:
             QMessageBox.warning(self, "警告", "没有数据可导出！")
             return
         # 打开文件保存对话框
-        file_path, _ = QFileDialog.getSaveFileName(self, "保存Excel文件", "", "Excel Files (*.xlsx)")
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "导出数据", "", "Excel Files (*.xlsx);;Parquet Files (*.parquet)")
+        if not file_path:
+            return
+        if 'parquet' in selected_filter and not file_path.lower().endswith('.parquet'):
+            file_path += '.parquet'
+        # 在后台线程中分块写入，状态栏显示进度，可随时取消
+        self.exportWorker = ExportWorker(self.processor, file_path, self)
+        self.exportWorker.progress_signal.connect(self.on_export_progress)
+        self.exportWorker.finished_signal.connect(self.on_export_finished)
+        self.exportWorker.failed_signal.connect(self.on_export_failed)
+        self.exportWorker.cancelled_signal.connect(self.on_export_cancelled)
+        self.exportButton.setEnabled(False)
+        self.exportProgress.setRange(0, self.processor.row_count)
+        self.exportProgress.setValue(0)
+        self.exportProgress.show()
+        self.cancelExportButton.show()
+        self.exportWorker.start()
+
+    def import_data(self):
+        """导入Parquet、JSON、JSON行、HAR或mitmdump流量文件，替换当前表格中的数据"""
+        if self.proxy_listener.is_running:
+            QMessageBox.warning(self, "警告", "请先停止监听再导入数据！")
+            return
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "导入数据", "",
+            "所有支持的文件 (*.parquet *.json *.jsonl *.jsonl.gz *.har *.flows *.flow *.mitm *.dump);;"
+            "Parquet Files (*.parquet);;JSON Files (*.json *.jsonl *.jsonl.gz);;HAR Files (*.har);;"
+            "mitmproxy Flows (*.flows *.flow *.mitm *.dump)")
         if not file_path:
             return
+        # 导入的数据不是当前会话，停止跟踪抓包目录，也不再保存搜索索引
+        self.save_search_index()
+        self.search_index_path = None
+        self.auto_load_timer.stop()
+        self.capture_tailer.skip_to_end()
+        if not file_path.lower().endswith('.parquet'):
+            self.start_stream_import(file_path)
+            return
+        try:
+            self.processor.load_from_parquet(file_path)
+            self.update_table()
+            self.statusBar.showMessage(f"已导入 {self.processor.row_count} 条数据")
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"导入失败: {str(e)}")
+
+    def start_stream_import(self, file_path):
+        """流式导入：每次事件循环读取一批记录加入表格，大文件导入时界面保持响应"""
+        try:
+            self.importer = StreamImporter(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"导入失败: {str(e)}")
+            return
+        self.import_batches = self.processor.import_batches(self.importer)
+        self.update_table()
+        self.importButton.setEnabled(False)
+        QTimer.singleShot(0, self.import_next_batch)
+
+    def import_next_batch(self):
         try:
-            self.processor.save_to_excel(file_path)
-            QMessageBox.information(self, "成功", f"数据已成功导出到 {file_path}")
+            imported = next(self.import_batches, None)
         except Exception as e:
-            import traceback
-            tb = traceback.format_exc()
-            QMessageBox.critical(self, "错误", f"导出失败: {str(e)}\n详细信息:\n{tb}")
+            self.finish_stream_import()
+            QMessageBox.critical(self, "错误", f"导入失败: {str(e)}")
+            return
+        if imported is None:
+            importer = self.importer
+            self.finish_stream_import()
+            message = f"已导入 {importer.imported} 条数据"
+            if importer.skipped:
+                message += f"，跳过 {sum(importer.skipped.values())} 条（{importer.skipped_summary()}）"
+            if self.processor.missing_bodies:
+                message += f"，{self.processor.missing_bodies} 条记录的响应体缺失（文件中没有第一次出现的完整内容）"
+            self.statusBar.showMessage(message)
+            return
+        self.update_table()
+        percent = self.importer.bytes_read * 100 // max(self.importer.total_bytes, 1)
+        self.statusBar.showMessage(f"正在导入：{imported} 条（{percent}%）")
+        QTimer.singleShot(0, self.import_next_batch)
+
+    def finish_stream_import(self):
+        self.importer = None
+        self.import_batches = None
+        self.importButton.setEnabled(True)
+
+    def cancel_export(self):
+        """取消正在进行的导出"""
+        if self.exportWorker is not None:
+            self.exportWorker.cancel()
+            self.cancelExportButton.setEnabled(False)
+
+    def on_export_progress(self, written, total):
+        self.exportProgress.setRange(0, total)
+        self.exportProgress.setValue(written)
+        self.statusBar.showMessage(f"正在导出：{written}/{total} 条")
+
+    def _finish_export(self):
+        self.exportButton.setEnabled(True)
+        self.exportProgress.hide()
+        self.cancelExportButton.hide()
+        self.cancelExportButton.setEnabled(True)
+        self.exportWorker = None
+
+    def on_export_finished(self, file_path):
+        self._finish_export()
+        self.update_status_bar()
+        QMessageBox.information(self, "成功", f"数据已成功导出到 {file_path}")
+
+    def on_export_failed(self, message):
+        self._finish_export()
+        self.update_status_bar()
+        QMessageBox.critical(self, "错误", f"导出失败: {message}")
+
+    def on_export_cancelled(self):
+        self._finish_export()
+        self.statusBar.showMessage("导出已取消")
     
     def clear_data(self):
         """清除所有数据"""
-        if self.processor.data_frame is not None and not self.processor.data_frame.empty:
+        if self.processor.row_count > 0:
             reply = QMessageBox.question(self, "确认", "确定要清除所有数据吗？", 
                                        QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.Yes:
-                self.processor.data_frame = None
-                self.proxy_listener.clear_data()
-                self.tableWidget.setRowCount(0)
-                # 新增：清空数据文件
+                self.processor.clear()
+                self.update_table()
+                # 新增：切换到新分段，旧分段不再显示（先写入起始分段再通知插件滚动）
                 try:
-                    with open('captured_data.json', 'w', encoding='utf-8') as f:
-                        f.truncate(0)
+                    self.capture_store.clear()
+                    self.capture_tailer.reset()
+                    if self.search_index_path and os.path.exists(self.search_index_path):
+                        os.remove(self.search_index_path)
                 except Exception as e:
                     QMessageBox.warning(self, "警告", f"清空数据文件失败: {str(e)}")
+                self.proxy_listener.clear_data()
                 self.statusBar.showMessage("数据已清除")
 
-    def auto_load_captured_data(self):
-        """自动读取captured_data.json并刷新表格"""
-        file_path = 'captured_data.json'
-        if not os.path.exists(file_path):
+    def open_session(self):
+        """打开一个抓包会话目录，分批加载其中的记录"""
+        if self.proxy_listener.is_running:
+            QMessageBox.warning(self, "警告", "请先停止监听再打开其他会话！")
+            return
+        directory = QFileDialog.getExistingDirectory(self, "选择会话目录", self.capture_store.directory)
+        if not directory:
             return
-        new_items = []
+        self.save_search_index()
+        self.processor.clear()
+        self.update_table()
+        # 之后的抓包数据也写入该会话
+        self.proxy_listener.capture_dir = directory
+        self.capture_store = CaptureSession(directory)
+        self.capture_tailer = SessionTailer(self.capture_store)
+        self.load_search_index()
+        self.auto_load_captured_data()
+        if not self.auto_load_timer.isActive():
+            self.auto_load_timer.start(2000)
+
+    def auto_load_captured_data(self):
+        """自动读取分段存储中新增的数据并刷新表格"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                # 只加载新增的数据
-                for line in lines[self.last_loaded_count:]:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        item = json.loads(line)
-                        new_items.append(item)
-                    except Exception:
-                        continue
+            new_items = self.capture_tailer.read_new()
             if new_items:
-                for item in new_items:
-                    self.processor.add_item(item)
+                self.processor.add_items(new_items)
                 self.update_table()
-                self.last_loaded_count += len(new_items)
             self.update_status_bar()
+            # 历史数据较多时分批加载，每批之间让出事件循环
+            if self.capture_tailer.has_pending():
+                QTimer.singleShot(0, self.auto_load_captured_data)
+            else:
+                self.processor.finish_search_index()
+                self.finish_history_load()
         except Exception as e:
             self.statusBar.showMessage(f"自动加载数据出错: {str(e)}")
+            # 历史数据读取失败时不再缓存推送的数据
+            self.finish_history_load()
 
     def show_table_context_menu(self, pos):
-        item = self.tableWidget.itemAt(pos)
-        if item:
+        index = self.tableView.indexAt(pos)
+        if index.isValid():
             menu = QMenu()
             copyAction = menu.addAction("复制")
-            action = menu.exec_(self.tableWidget.viewport().mapToGlobal(pos))
+            action = menu.exec_(self.tableView.viewport().mapToGlobal(pos))
             if action == copyAction:
                 clipboard = QApplication.clipboard()
-                clipboard.setText(item.text())
+                clipboard.setText(self.tableModel.data(index))
+
+    def on_search_changed(self):
+        """按搜索条件过滤表格"""
+        self.tableModel.set_query(self.searchEdit.text())
+        self.resize_columns_sampled()
+        self.update_status_bar()
+
+    def load_search_index(self):
+        """加载会话目录中保存的搜索索引，重新读入会话数据时只校验不再分词"""
+        self.search_index_path = os.path.join(self.capture_store.directory, INDEX_FILE)
+        self.processor.load_search_index(self.search_index_path)
+
+    def save_search_index(self):
+        """把当前会话的搜索索引保存到会话目录"""
+        if not self.search_index_path or not os.path.isdir(os.path.dirname(self.search_index_path)):
+            return
+        try:
+            self.processor.save_search_index(self.search_index_path)
+        except OSError as e:
+            self.statusBar.showMessage(f"保存搜索索引失败: {str(e)}")
+
+    def closeEvent(self, event):
+        self.save_search_index()
+        super().closeEvent(event)
+
+    def on_projection_changed(self):
+        """提取字段变化时重新编译路径，未提取的response_data只保留JSON文本"""
+        paths = parse_paths(self.projectionEdit.text())
+        if paths == self.processor.projection.paths:
+            return
+        try:
+            self.processor.set_projection(paths, raw_mode='text' if paths else 'keep')
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", f"字段路径无效: {str(e)}")
+            return
+        self.update_table()
 
-    def on_domain_filter_changed(self, text):
-        # 域名过滤内容变化时，通知proxy_listener
-        domains = [d.strip() for d in text.split(',') if d.strip()]
+    def on_domain_filter_changed(self):
+        # 域名过滤内容变化时，通知proxy_listener；无效的正则规则不发送，在状态栏提示
+        domains = [d.strip() for d in self.domainFilterEdit.text().split(',') if d.strip()]
+        invalid = invalid_rules(domains)
+        if invalid:
+            bad = {rule for rule, _ in invalid}
+            domains = [d for d in domains if d not in bad]
+            self.statusBar.showMessage(
+                '域名规则无效，已忽略: ' + '; '.join(f"{rule}（{error}）" for rule, error in invalid))
         self.proxy_listener.set_domain_filter(domains)
\ No newline at end of file